@@ -4,6 +4,7 @@ from pathlib import Path
 from collections import defaultdict
 import os
 from templates import return_template_info
+from utils.template_registry import STORE_DIRNAME
 import random
 import re
 from common.config import MONOMER_CONFIG,HOMOMULTIMER_CONFIG,HETEROMULTIMER_CONFIG
@@ -26,23 +27,27 @@ def get_template_source(is_homomultimer):
 
 
 
+def _template_info_from_index(ip_dir,source_dir,representative_id):
+    return return_template_info(os.path.join(ip_dir,"templates",source_dir,f"{representative_id}_templates.csv"),f"templates/{STORE_DIRNAME}",os.path.join(ip_dir,"templates",STORE_DIRNAME))
+
+
 def get_template_info_from_source(ip_dir,template_source,representative_id,predictor):
     if template_source == "notemplate":
         return []
     if template_source == "pdb_seqres":
-        return return_template_info(os.path.join(ip_dir,"templates","pdb_seqres",f"{representative_id}_templates.csv"),"templates/pdb_seqres/templates",os.path.join(ip_dir,"templates","pdb_seqres","templates"))
+        return _template_info_from_index(ip_dir,"pdb_seqres",representative_id)
     if template_source == "sequence_based_template_pdb70":
-        return return_template_info(os.path.join(ip_dir,"templates","pdb70_seq",f"{representative_id}_templates.csv"),"templates/pdb70_seq/templates",os.path.join(ip_dir,"templates","pdb70_seq","templates"))
+        return _template_info_from_index(ip_dir,"pdb70_seq",representative_id)
     if template_source == "foldseek_structure_based_template":
-        return return_template_info(os.path.join(ip_dir,"templates","struct_temp",f"{representative_id}_templates.csv"),"templates/struct_temp/templates",os.path.join(ip_dir,"templates","struct_temp","templates"))
+        return _template_info_from_index(ip_dir,"struct_temp",representative_id)
     if template_source == "tmsearch_structure_based_template":
-        return return_template_info(os.path.join(ip_dir,"templates","tmsearch",f"{representative_id}_templates.csv"),"templates/tmsearch/templates",os.path.join(ip_dir,"templates","tmsearch","templates"))
+        return _template_info_from_index(ip_dir,"tmsearch",representative_id)
     if template_source == "sequence_based_template_pdb_sort90":
-        return return_template_info(os.path.join(ip_dir,"templates","pdb_seq",f"{representative_id}_templates.csv"),"templates/pdb_seq/templates",os.path.join(ip_dir,"templates","pdb_seq","templates"))
+        return _template_info_from_index(ip_dir,"pdb_seq",representative_id)
     if template_source == "sequence_based_template_pdb_complex":
-        return return_template_info(os.path.join(ip_dir,"templates","complex_pdb_seq",f"{representative_id}_templates.csv"),"templates/complex_pdb_seq/templates",os.path.join(ip_dir,"templates","complex_pdb_seq","templates"))
+        return _template_info_from_index(ip_dir,"complex_pdb_seq",representative_id)
     if template_source == "foldseek":
-        return return_template_info(os.path.join(ip_dir,"templates",predictor,f"{representative_id}_templates.csv"),f"templates/{predictor}/templates",os.path.join(ip_dir,"templates",predictor,"templates"))
+        return _template_info_from_index(ip_dir,predictor,representative_id)
     else:
         return []
 
@@ -88,11 +93,34 @@ def find_common_jsons(subunits_dir):
             common_files &= json_files  # intersect
 
     return sorted(common_files)
-def combine(ip_dir,json_paths, output_path,predictor,num_models,is_homomultimer,is_default_af3=False):
+def get_template_info_key(template_source,representative_id,predictor):
+    """Everything get_template_info_from_source depends on; only foldseek is per predictor."""
+    if template_source == "foldseek":
+        return (template_source,representative_id,predictor)
+    return (template_source,representative_id,None)
+
+
+def get_cached_template_info(ip_dir,template_source,representative_id,predictor,template_info_cache):
+    key = get_template_info_key(template_source,representative_id,predictor)
+    if key not in template_info_cache:
+        template_info_cache[key] = get_template_info_from_source(ip_dir,template_source,representative_id,predictor)
+    return template_info_cache[key]
+
+
+def combine(ip_dir,json_paths, output_path,predictor,num_models,is_homomultimer,is_default_af3=False,
+            predictor_template_sources=None,template_info_cache=None):
     """
     Combine multiple JSONs by grouping on identical `sequence`.
     Also rewrites paths with representative chain id.
+
+    predictor_template_sources and template_info_cache let combine_jsons resolve
+    template sources and template info once for all predictors of a target.
     """
+    if predictor_template_sources is None and not is_default_af3:
+        predictor_template_sources = get_template_source(is_homomultimer)
+    if template_info_cache is None:
+        template_info_cache = {}
+
     grouped = defaultdict(lambda: {
         "ids": [],
         "data": None  # first occurrence
@@ -148,9 +176,8 @@ def combine(ip_dir,json_paths, output_path,predictor,num_models,is_homomultimer,
             }
         
         else:
-            predictor_template_sources = get_template_source(is_homomultimer)
             template_source = predictor_template_sources[predictor_name_for_template_source]
-            template_info = get_template_info_from_source(ip_dir,template_source,representative_id,predictor.split(".")[0])
+            template_info = get_cached_template_info(ip_dir,template_source,representative_id,predictor.split(".")[0],template_info_cache)
         
             combined_protein = {
                 "id": info["ids"],
@@ -178,11 +205,14 @@ def combine_jsons(ip_dir,num_models,is_homomultimer):
     common_jsons = find_common_jsons(subunits_dir)
     subunits = sorted(os.listdir(subunits_dir))
 
+    predictor_template_sources = get_template_source(is_homomultimer)
+    template_info_cache = {}
     for predictor in common_jsons:
         if "afsample" in predictor or "drop" in predictor or "ptm" in predictor:
             continue
         ip_jsons = [f"{subunits_dir}/{sub}/input_files/{predictor}" for sub in subunits]
         op_json = f"{ip_dir}/{predictor}"
-        combine(ip_dir,ip_jsons, op_json,predictor,num_models,is_homomultimer,is_default_af3=(predictor=="default_af3.json"))
+        combine(ip_dir,ip_jsons, op_json,predictor,num_models,is_homomultimer,is_default_af3=(predictor=="default_af3.json"),
+                predictor_template_sources=predictor_template_sources,template_info_cache=template_info_cache)
 
 
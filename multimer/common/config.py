@@ -1,4 +1,5 @@
 import copy
+import os
 import ml_collections
 MONOMER_PREDICTIONS_PER_MODEL = 100
 
@@ -14,8 +15,75 @@ env_dir = "/bmlfast/bml_casp16/anaconda3/envs/multicom4/bin/"
 database_dir = "/bmlfast/bml_casp16/tools/alphafold_databases_multicom3"
 
 pdb_mmcif_database_dir = f"{database_dir}/pdb_mmcif//mmcif_files/"
+# Per-user directory of the template caches and store below ($XDG_CACHE_HOME/caf3 or
+# ~/.cache/caf3). Set CAF3_CACHE_DIR (e.g. to a local SSD) to override it. The caches
+# refuse directories other users can write to (utils.disk_cache.make_private_dir).
+template_cache_root = os.environ.get("CAF3_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "caf3")
+# Store of single-chain template CIFs, filled lazily from pdb_mmcif_database_dir.
+template_cif_store_dir = os.path.join(template_cache_root, "cif_store")
+# PDB release date index of the mmCIF mirror, built and refreshed with
+#   python -m template_search.release_dates --mmcif_dir <pdb_mmcif_database_dir> \
+#       --obsolete_pdbs_path <database_dir>/pdb_mmcif/obsolete.dat
+# Set to None (or leave the file unbuilt) to read release dates from the mmCIF files.
+template_release_dates_path = f"{database_dir}/pdb_mmcif/release_dates_index.npz"
+# Backend for utils.convert_to_cif.atom2cif: "streaming" or "biopython".
+atom2cif_backend = "streaming"
 max_template_date = "2024-08-01"
 template_max_hits = 20
+# Number of templates per chain passed to AF3 (templates.return_template_info).
+template_quota = 4
+# Convert/link template CIFs in rank order only until template_quota of them are usable.
+template_lazy_conversion = True
+
+# Template preparation parallelism (process_templates.process_target_templates).
+# Each pdb_seqres chain search runs hmmsearch with hmmsearch_num_cpu threads (1 with
+# the hmmpgmd backend below), then template_featurize_num_workers featurizer threads,
+# so searches hold the larger of the two; template conversion gets the cores left
+# over, at least one (see process_templates._get_pool_sizes).
+hmmsearch_num_cpu = 8
+template_num_workers = 4
+template_cpu_budget = 32
+
+# pdb_seqres template search backend: "hmmsearch" runs the hmmsearch binary for every
+# search, "hmmpgmd" sends searches to an hmmpgmd daemon holding pdb_seqres in memory
+# (see template_search/hmmpgmd.py to convert the database and start the daemon).
+template_search_backend = "hmmsearch"
+hmmpgmd_host = "127.0.0.1"
+hmmpgmd_port = 51371
+
+# Cache of per-chain pdb_seqres template search results. Set to None to disable.
+template_search_cache_dir = os.path.join(template_cache_root, "template_search")
+template_search_cache_max_bytes = 1 << 30
+
+# Parsed template mmCIF entries, kept on disk under template_mmcif_cache_dir (None
+# to disable) up to template_mmcif_cache_max_disk_bytes, least recently used entries
+# evicted first, and in memory up to template_mmcif_cache_max_bytes per process.
+template_mmcif_cache_dir = os.path.join(template_cache_root, "mmcif_parse")
+template_mmcif_cache_max_bytes = 256 << 20
+template_mmcif_cache_max_disk_bytes = 8 << 30
+
+# Template mmCIF parser: "tokenizer" reads only the categories used for template
+# features, "biopython" builds the full Biopython structure.
+template_mmcif_parser = "tokenizer"
+
+# Realignment of template hits to their mmCIF SEQRES: "kalign" runs the kalign binary
+# for every hit; "pairwise" aligns in-process (falling back to kalign) and is opt-in,
+# since its mappings can differ from kalign's and change which templates are accepted.
+template_realign_backend = "kalign"
+
+# Memo of template realignments by (hit sequence, SEQRES) pair, shared by all runs on
+# this node. Set template_realign_cache_dir to None to disable.
+template_realign_cache_dir = os.path.join(template_cache_root, "realign")
+template_realign_cache_max_bytes = 64 << 20
+
+# Residue numbers of template CIFs (utils.cif_residues), kept out of the template store.
+# Set to None to rescan the CIFs in every process.
+template_residue_cache_dir = os.path.join(template_cache_root, "cif_residues")
+
+# Threads featurizing pdb_seqres template hits ahead of the one being accepted (runs
+# after hmmsearch, inside the same search job). 1 featurizes hits one at a time.
+template_featurize_num_workers = 4
 
 num_models_subunit = 25
 
@@ -4,11 +4,13 @@ import re
 import pandas as pd
 import string
 import shutil
-from common.config import pdb_mmcif_database_dir
-from templates import return_template_info
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from common.config import template_num_workers,template_cpu_budget,template_lazy_conversion,template_quota
+from common.config import template_featurize_num_workers
+from templates import return_template_info,materialize_templates,missing_templates
 import os
 from pathlib import Path
-from utils.convert_to_cif import atom2cif
+from utils.convert_to_cif import convert_templates
 from utils import parse_hhr
 from utils import parse_seq_temp
 from utils import parse_seq_temp_tmsearch
@@ -17,10 +19,10 @@ import csv
 import ast
 from utils.utils import makedir_if_not_exists
 import pandas as pd
-from utils.extract_cif_chains import filter_cif_by_chain
+from utils.template_registry import STORE_DIRNAME,get_store_dir,atom_cif_name,pdb_chain_cif_name,write_template_index,register_pdb_templates
+from utils.cif_store import link_chain_cif,link_template_cifs
 from utils.generate_jsons import read_fasta
-from template_search.pipeline import _process_single_chain
-from utils.repair_atom import repair_atom
+from template_search.pipeline import template_searcher,_process_single_chain
 
 
 def transform_csv_all(input_csv: str, output_csv: str):
@@ -118,7 +120,8 @@ def transform_csv_pdb70_seq(input_csv: str, output_csv: str):
     out_df.to_csv(output_csv, index=False)
 
 
-def split_chains_csv(input_csv, output_dir,template_type_dir,template_type,is_pdb70_seq=False):
+def split_chains_csv(input_csv, output_dir,template_type_dir,template_type,store_dir,is_pdb70_seq=False):
+    """Splits a concatenated template CSV per chain and returns the template conversions still needed."""
     os.makedirs(output_dir, exist_ok=True)
 
     # Load CSV, drop dummy first index column if present
@@ -134,8 +137,9 @@ def split_chains_csv(input_csv, output_dir,template_type_dir,template_type,is_pd
             chain_groups.setdefault(num, []).append((col, base))
         # else: skip non-numbered columns like "index", "tpdbcode"
     # Create per-chain CSVs
-    templates_atom_dir = os.path.join(output_dir,"templates")
-    os.makedirs(templates_atom_dir, exist_ok=True)
+    templates_atom_dir = os.path.join(template_type_dir,"templates")
+    conversion_jobs = []
+    lazy_indexes = []
     for idx, (chain_num, col_pairs) in enumerate(sorted(chain_groups.items(), key=lambda x: int(x[0]))):
         selected_cols = [c[0] for c in col_pairs]
         base_names = [c[1] for c in col_pairs]
@@ -155,22 +159,20 @@ def split_chains_csv(input_csv, output_dir,template_type_dir,template_type,is_pd
             transform_csv_pdb70_seq(output_path_temp,output_path_temp_pdb70_seq)
             output_path_temp = output_path_temp_pdb70_seq
             transform_csv_all(output_path_temp,output_path_final)
-            handle_pdb70_templates(output_path_final,"",output_dir,dest_template_csv)
+            handle_pdb70_templates(output_path_final,"",store_dir,dest_template_csv)
             # shutil.copytree
         else:
-            for template_atom in os.listdir(os.path.join(template_type_dir,"templates")):
-                if template_atom.endswith(".atom") and not os.path.exists(os.path.join(templates_atom_dir,template_atom)):
-                    shutil.copy(os.path.join(template_type_dir,"templates",template_atom),os.path.join(templates_atom_dir,template_atom))
-         
             transform_csv_all(output_path_temp,output_path_final)
         
             # dest_template_csv = os.path.join(output_dir, f"{chain_letter}_templates.csv")
             if template_type=="tmsearch":
-                handle_inhouse_templates(output_path_final, templates_atom_dir, templates_atom_dir, dest_template_csv,is_tmsearch=True)
+                jobs, indexes = collect_inhouse_template_jobs(output_path_final, templates_atom_dir, store_dir, dest_template_csv,is_tmsearch=True)
             else:
-                handle_inhouse_templates(output_path_final, templates_atom_dir, templates_atom_dir, dest_template_csv)
+                jobs, indexes = collect_inhouse_template_jobs(output_path_final, templates_atom_dir, store_dir, dest_template_csv)
+            conversion_jobs += jobs
+            lazy_indexes += indexes
 
-        # return(output_path_final)
+    return conversion_jobs, lazy_indexes
 
 def prepare_template_csv_for_af3(input_file, output_csv, is_tmsearch=False):
     ext = input_file.split(".")[-1].lower()
@@ -191,163 +193,358 @@ def prepare_template_csv_for_af3(input_file, output_csv, is_tmsearch=False):
         return 0
 
 
-def handle_inhouse_templates(input_csv, template_atom_path, template_cif_path, dest_template_csv,is_tmsearch=False):
+def collect_inhouse_template_jobs(input_csv, template_atom_path, store_dir, dest_template_csv,is_tmsearch=False):
+    """Writes the dest_template_csv index and returns its (conversion_jobs, lazy_indexes), see _collect_atom_jobs."""
     template_path = input_csv
     if not os.path.exists(template_path):
-        return []
+        return [], []
     if is_tmsearch:
         # print
         output_csv_path = prepare_template_csv_for_af3(template_path, dest_template_csv,is_tmsearch=True)
     else:
         output_csv_path = prepare_template_csv_for_af3(template_path, dest_template_csv)
 
-    template_cif_destination_path = template_cif_path
-    makedir_if_not_exists(template_cif_destination_path)
+    makedir_if_not_exists(store_dir)
     inhouse_template_dataset_dir = template_atom_path
 
     if output_csv_path:
         df = pd.read_csv(output_csv_path)
-        for template_name in df["template_name"]:
-            atom_input = os.path.join(inhouse_template_dataset_dir, template_name + ".atom")
-            atom_output = os.path.join(template_cif_destination_path, template_name + ".atom")
+        atom_inputs = [os.path.join(inhouse_template_dataset_dir, template_name + ".atom") for template_name in df["template_name"]]
+        return _collect_atom_jobs(output_csv_path, atom_inputs, store_dir, is_tmsearch)
 
-            cif_output = atom_output[:-4] + "cif"
-            if os.path.exists(cif_output):
-                continue
-            if os.path.exists(atom_input):
-                # print("Found:", atom_input)
-                # shutil.copy(atom_input, atom_output)
-                try:
-                    if is_tmsearch:
-                        repaired_atom = atom_output.replace(".atom",".atom_repaired")
-                        repair_atom(atom_output,repaired_atom)
-                        atom_output = repaired_atom
-
-                    atom2cif(atom_output, cif_output)
-                except Exception as e:
-                    print(e)
-                    continue
-
-    return return_template_info(dest_template_csv, "inhouse_templates", template_cif_destination_path)
-
-def handle_foldseek_template(predictor_directory,output_dir):
-    template_cif_destination_path = os.path.join(output_dir,"templates")
+    return [], []
+
+
+def _collect_atom_jobs(template_csv, atom_inputs, store_dir, repair):
+    """
+    Indexes the .atom templates of template_csv and returns the conversions the store still needs.
+
+    With template_lazy_conversion, only the top ranked templates up to template_quota are
+    named (store names hash the .atom files, see atom_cif_name) and converted here, and
+    template_csv is returned as a lazy index so that convert_collected_templates can name
+    and convert lower ranked ones if some of these fail.
+
+    Returns:
+        (list, list): (atom, cif, repair) conversion jobs, and lazy indexes (see
+            convert_collected_templates).
+    """
+    cif_names = [""] * len(atom_inputs)
+    rows = [row for row, atom_input in enumerate(atom_inputs) if os.path.exists(atom_input)]
+    if template_lazy_conversion:
+        rows, deferred_rows = rows[:template_quota], rows[template_quota:]
+    jobs_by_cif = _name_atom_templates(atom_inputs, rows, store_dir, repair, cif_names)
+    write_template_index(template_csv, cif_names)
+
+    if not template_lazy_conversion:
+        return list(jobs_by_cif.values()), []
+
+    planned_jobs = [jobs_by_cif[cif_file] for cif_file in missing_templates(template_csv, store_dir)
+                    if cif_file in jobs_by_cif]
+    return planned_jobs, [(template_csv, store_dir, atom_inputs, repair, cif_names, deferred_rows)]
+
+
+def _name_atom_templates(atom_inputs, rows, store_dir, repair, cif_names):
+    """Sets cif_names of the given rows and returns the conversion jobs of those missing from the store, by CIF."""
+    jobs_by_cif = {}
+    for row in rows:
+        cif_name = atom_cif_name(atom_inputs[row], repair)
+        cif_names[row] = cif_name
+        cif_output = os.path.join(store_dir, cif_name)
+        if not os.path.exists(cif_output):
+            jobs_by_cif[cif_output] = (atom_inputs[row], cif_output, repair)
+    return jobs_by_cif
+
+
+def convert_collected_templates(conversion_jobs, lazy_indexes, executor=None):
+    """
+    Converts the pooled jobs of the collect functions, then fills the quota of lazy indexes.
+
+    conversion_jobs go through one convert_templates batch (on executor if given). Lazy
+    indexes, (template_csv, store_dir, atom_inputs, repair, cif_names, deferred_rows) as
+    returned by _collect_atom_jobs, whose top ranked templates failed are then topped up in
+    rank order: deferred rows are named as needed, and templates converted one at a time
+    until template_quota of them are usable.
+    """
+    report_conversion_results(convert_templates(conversion_jobs, executor=executor))
+
+    for template_csv, store_dir, atom_inputs, repair, cif_names, deferred_rows in lazy_indexes:
+        atom_inputs_by_cif = {cif_name: atom_inputs[row] for row, cif_name in enumerate(cif_names) if cif_name}
+        attempted = set()
+
+        def convert(cif_name, cif_file):
+            atom_input = atom_inputs_by_cif.get(cif_name)
+            if atom_input is None or cif_file in attempted:
+                return  # No .atom source for this CIF, or it failed to convert already.
+            attempted.add(cif_file)
+            for cif_output, error in convert_templates([(atom_input, cif_file, repair)]).items():
+                if error is not None:
+                    print(f"[ERROR] Failed to convert template {cif_output}: {error}")
+
+        num_usable = materialize_templates(template_csv, store_dir, convert)
+        while num_usable < template_quota and deferred_rows:
+            rows = deferred_rows[:template_quota - num_usable]
+            deferred_rows = deferred_rows[len(rows):]
+            _name_atom_templates(atom_inputs, rows, store_dir, repair, cif_names)
+            atom_inputs_by_cif.update((cif_names[row], atom_inputs[row]) for row in rows)
+            write_template_index(template_csv, cif_names)
+            num_usable = materialize_templates(template_csv, store_dir, convert)
+
+
+def _stage_pdb_templates(template_csv, pdb_chains, store_dir):
+    """
+    Indexes the PDB chains of template_csv and links them into the store (lazily if configured).
+
+    The chains planned by missing_templates are linked together, extracting the chains of
+    each PDB entry in one pass (see link_template_cifs); failed ones are then topped up in
+    rank order.
+    """
+    if not template_lazy_conversion:
+        register_pdb_templates(template_csv, pdb_chains, store_dir)
+        return
+
+    makedir_if_not_exists(store_dir)
+    cif_names = [pdb_chain_cif_name(pdb_id, chain_id) for pdb_id, chain_id in pdb_chains]
+    write_template_index(template_csv, cif_names)
+    chains_by_cif = dict(zip(cif_names, pdb_chains))
+
+    link_template_cifs([(*chains_by_cif[os.path.basename(cif_file)], cif_file)
+                        for cif_file in missing_templates(template_csv, store_dir)])
+
+    def link(cif_name, cif_file):
+        pdb_id, chain_id = chains_by_cif[cif_name]
+        link_chain_cif(pdb_id, chain_id, cif_file)
+
+    materialize_templates(template_csv, store_dir, link)
+
+
+def handle_inhouse_templates(input_csv, template_atom_path, store_dir, dest_template_csv,is_tmsearch=False):
+    if not os.path.exists(input_csv):
+        return []
+    conversion_jobs, lazy_indexes = collect_inhouse_template_jobs(input_csv, template_atom_path, store_dir, dest_template_csv, is_tmsearch=is_tmsearch)
+    convert_collected_templates(conversion_jobs, lazy_indexes)
+    return return_template_info(dest_template_csv, STORE_DIRNAME, store_dir)
+
+
+def collect_foldseek_template_jobs(predictor_directory,output_dir,store_dir):
+    """Writes the foldseek template index CSVs and returns their (conversion_jobs, lazy_indexes), see _collect_atom_jobs."""
     inhouse_template_dataset_dir = os.path.join(predictor_directory,"templates")
-    makedir_if_not_exists(template_cif_destination_path)
+    makedir_if_not_exists(output_dir)
+    makedir_if_not_exists(store_dir)
 
+    conversion_jobs = []
+    lazy_indexes = []
     for f in os.listdir(predictor_directory):
         if f.endswith(".top50"):
-            # print(f)
             destination_template_csv = os.path.join(output_dir,f.replace(".top50","_templates.csv"))
             parse_seq_temp_foldseek.run_seq_temp_parser(template_file=os.path.join(predictor_directory,f),output=destination_template_csv)
             df = pd.read_csv(destination_template_csv)
+            atom_inputs = []
             for template_name in df["template_name"]:
                 template_name = template_name.replace(".atom.gz","")
                 template_name = template_name.replace(".pdb","")
-                # print(template_name)
-                atom_input = os.path.join(inhouse_template_dataset_dir, template_name + ".atom")
-                # print(atom_input)
-                atom_output = os.path.join(template_cif_destination_path, template_name + ".atom")
-
-                cif_output = atom_output[:-4] + "cif"
-                if os.path.exists(cif_output):
-                    continue
-                if os.path.exists(atom_input):
-                    # print("yes",atom_input)
-                    try:
-                        shutil.copy(atom_input,atom_output)
-                        atom2cif(atom_output, cif_output)
-                    except Exception as e:
-                        print(e)
-                        continue
+                atom_inputs.append(os.path.join(inhouse_template_dataset_dir, template_name + ".atom"))
+            jobs, indexes = _collect_atom_jobs(destination_template_csv, atom_inputs, store_dir, False)
+            conversion_jobs += jobs
+            lazy_indexes += indexes
+
+    return conversion_jobs, lazy_indexes
+
+
+def handle_foldseek_template(predictor_directory,output_dir,store_dir):
+    convert_collected_templates(*collect_foldseek_template_jobs(predictor_directory, output_dir, store_dir))
+
+
+def report_conversion_results(results):
+    """Prints the failures from convert_templates and returns the number of converted templates."""
+    num_converted = 0
+    for cif_output, error in sorted(results.items()):
+        if error is None:
+            num_converted += 1
+        else:
+            print(f"[ERROR] Failed to convert template {cif_output}: {error}")
+    if results:
+        print(f"[INFO] Converted {num_converted}/{len(results)} templates to mmCIF")
+    return num_converted
 
 # handle_foldseek_template("/bmlfast/casp16_ts_qs_qa/TS_run/valid/T1235_human/N6_multimer_structure_generation/folds_iter_1","/bmlfast/bml_casp17/installation_test/MULTICOM5/test_targets/H1202_redo_template_2/T1235/input_files/templates/foldseek")
 
 
-def handle_pdb_templates(N2_path, predictor, destination_path, dest_template_csv):
+def handle_pdb_templates(N2_path, predictor, store_dir, dest_template_csv):
     # template_path = os.path.join(predictor_path, "msas", "pdb_hits.hhr")
     template_path = os.path.join(N2_path, "output.hhr")
     output_csv_path = prepare_template_csv_for_af3(template_path, dest_template_csv)
 
-    template_cif_destination_path = os.path.join(destination_path, "templates")
-    makedir_if_not_exists(template_cif_destination_path)
-
     if output_csv_path:
         df = pd.read_csv(output_csv_path)
-        for template_name in df["template_name"]:
-            input_cif = os.path.join(pdb_mmcif_database_dir, template_name[:4].lower() + ".cif")
-            temp_cif_path = os.path.join(template_cif_destination_path, template_name[:4] + ".cif")
-            final_cif_path = os.path.join(template_cif_destination_path, template_name + ".cif")
-
-            if  os.path.exists(final_cif_path):
-                continue
-
-            if os.path.exists(input_cif):
-                # print("Found:", input_cif)
-                shutil.copy(input_cif, temp_cif_path)
-                filter_cif_by_chain(temp_cif_path, template_name[4:], final_cif_path)
-
-    return return_template_info(dest_template_csv, "pdb_templates", template_cif_destination_path)
+        pdb_chains = [(template_name[:4], template_name[4:]) for template_name in df["template_name"]]
+        _stage_pdb_templates(output_csv_path, pdb_chains, store_dir)
 
-def handle_pdb_seqres_templates(destination_path, dest_template_csv):
-    template_cif_destination_path = os.path.join(destination_path, "templates")
-    makedir_if_not_exists(template_cif_destination_path)
+    return return_template_info(dest_template_csv, STORE_DIRNAME, store_dir)
 
+def handle_pdb_seqres_templates(store_dir, dest_template_csv):
     if dest_template_csv:
         df = pd.read_csv(dest_template_csv)
-        for template_name in df["template_name"]:
-            input_cif = os.path.join(pdb_mmcif_database_dir, template_name[:4].lower() + ".cif")
-            temp_cif_path = os.path.join(template_cif_destination_path, template_name[:4] + ".cif")
-            final_cif_path = os.path.join(template_cif_destination_path, template_name + ".cif")
-
-            if  os.path.exists(final_cif_path):
-                continue
-
-            if os.path.exists(input_cif):
-                shutil.copy(input_cif, temp_cif_path)
-                filter_cif_by_chain(temp_cif_path, template_name.split("_")[-1], final_cif_path)
+        pdb_chains = [(template_name[:4], template_name.split("_")[-1]) for template_name in df["template_name"]]
+        _stage_pdb_templates(dest_template_csv, pdb_chains, store_dir)
 
-    return return_template_info(dest_template_csv, "pdb_templates", template_cif_destination_path)
+    return return_template_info(dest_template_csv, STORE_DIRNAME, store_dir)
 
-def handle_pdb70_templates(input_csv, predictor, destination_path, dest_template_csv):
+def handle_pdb70_templates(input_csv, predictor, store_dir, dest_template_csv):
     # template_path = os.path.join(predictor_path, "msas", "pdb_hits.hhr")
     template_path = input_csv
     output_csv_path = prepare_template_csv_for_af3(template_path, dest_template_csv)
 
-    template_cif_destination_path = os.path.join(destination_path, "templates")
-    makedir_if_not_exists(template_cif_destination_path)
-
     if output_csv_path:
         df = pd.read_csv(output_csv_path)
+        pdb_chains = []
         for template_name in df["template_name"]:
             template_name = template_name.replace("_","")
-            input_cif = os.path.join(pdb_mmcif_database_dir, template_name[:4].lower() + ".cif")
-            temp_cif_path = os.path.join(template_cif_destination_path, template_name[:4] + ".cif")
-            final_cif_path = os.path.join(template_cif_destination_path, template_name + ".cif")
+            pdb_chains.append((template_name[:4], template_name[4:]))
+        _stage_pdb_templates(output_csv_path, pdb_chains, store_dir)
+
+    return return_template_info(dest_template_csv, STORE_DIRNAME, store_dir)
+
+def _process_pdb_seqres_chain(chain_path, chain, output_root_dir):
+    destination_path = os.path.join(output_root_dir, "pdb_seqres")
+    makedir_if_not_exists(destination_path)
+
+    fasta_path = os.path.join(chain_path,f"{chain}.fasta")
+    target,sequences = read_fasta(fasta_path)
+    uniref_sto_path = os.path.join(chain_path,f"{chain}_uniref90.sto")
+
+    dest_template_csv = os.path.join(destination_path, f"{chain}_templates.csv")
+    try:
+        # handle_pdb_templates(chain_path, "", destination_path, dest_template_csv)
+        _process_single_chain(sequences[0],uniref_sto_path,destination_path,chain,dest_template_csv)
+        handle_pdb_seqres_templates(get_store_dir(output_root_dir),dest_template_csv)
+        print(f"[INFO] Processed PDB templates for chain {chain}")
+    except Exception as e:
+        print(f"[ERROR] Failed to handle_pdb_templates for chain {chain}: {e}")
+
+
+def _process_template_type(template_type_dir, template_type, output_root_dir):
+    # Find the relevant *_templates.csv
+    input_csv = None
+    for fl in os.listdir(template_type_dir):
+        if fl.endswith("_templates.csv"):
+            input_csv = os.path.join(template_type_dir, fl)
+            break
+
+    if not input_csv or not os.path.isfile(input_csv):
+        print(f"[WARNING] No valid *_templates.csv found in {template_type_dir}")
+        return [], []
+
+    output_dir = os.path.join(output_root_dir, template_type)
+    makedir_if_not_exists(output_dir)
+    store_dir = get_store_dir(output_root_dir)
+
+    try:
+        if template_type == "pdb70_seq":
+            conversion_jobs = split_chains_csv(input_csv, output_dir, template_type_dir,template_type, store_dir, is_pdb70_seq=True)
+        else:
+            conversion_jobs = split_chains_csv(input_csv, output_dir, template_type_dir,template_type, store_dir)
+        print(f"[INFO] Processed chain-split for template_type: {template_type}")
+        return conversion_jobs
+    except Exception as e:
+        print(f"[ERROR] Failed to split_chains_csv for {template_type}: {e}")
+        return [], []
+
+
+def _get_pool_sizes(num_workers, cpu_budget, cpus_per_search, featurize_workers=1):
+    """
+    Splits the worker and CPU budget between search jobs and single-core jobs.
+
+    A pdb_seqres chain search job runs hmmsearch on `cpus_per_search` cores
+    (hmmsearch_num_cpu, or 1 when an hmmpgmd daemon searches), then featurizes the
+    hits on `featurize_workers` threads, each running kalign, and finally links its
+    templates on one core. These phases run one after the other, so a search job
+    holds the largest of them; foldseek/N5 conversion jobs hold one core each.
+
+    Search workers are limited so that one core stays free for conversion, and the
+    conversion workers get the rest, keeping the total within cpu_budget unless
+    cpu_budget is smaller than one search job plus one core.
+
+    Returns:
+        (int, int): Number of search workers and number of conversion workers.
+    """
+    cpus_per_job = max(cpus_per_search, featurize_workers, 1)
+    search_workers = max(1, min(num_workers, (cpu_budget - 1) // cpus_per_job))
+    remaining_cpus = cpu_budget - search_workers * cpus_per_job
+    other_workers = max(1, min(num_workers, remaining_cpus))
+    return search_workers, other_workers
+
+
+def _run_template_jobs(search_jobs, collect_jobs, num_workers, cpu_budget):
+    """
+    Runs (function, args) jobs, concurrently when num_workers > 1.
+
+    collect_jobs return (conversion_jobs, lazy_indexes); these are pooled for the
+    whole target and converted in one batch (see convert_collected_templates).
+    Search jobs and conversion work go to separate process pools so the hmmsearch
+    threads never oversubscribe the CPU budget.
+    """
+    if num_workers <= 1:
+        for func, args in search_jobs:
+            func(*args)
+        conversion_jobs = []
+        lazy_indexes = []
+        for func, args in collect_jobs:
+            jobs, indexes = func(*args)
+            conversion_jobs += jobs
+            lazy_indexes += indexes
+        convert_collected_templates(conversion_jobs, lazy_indexes)
+        return
+
+    search_workers, other_workers = _get_pool_sizes(num_workers, cpu_budget, template_searcher.num_cpu,
+                                                     template_featurize_num_workers)
+    print(f"[INFO] Running {len(search_jobs)} template search jobs on {search_workers} workers "
+          f"and {len(collect_jobs)} template conversion jobs on {other_workers} workers")
 
-            if  os.path.exists(final_cif_path):
+    with ProcessPoolExecutor(max_workers=search_workers) as search_pool, \
+            ProcessPoolExecutor(max_workers=other_workers) as other_pool:
+        search_futures = {search_pool.submit(func, *args): args for func, args in search_jobs}
+        collect_futures = {other_pool.submit(func, *args): args for func, args in collect_jobs}
+
+        conversion_jobs = []
+        lazy_indexes = []
+        for future in as_completed(collect_futures):
+            try:
+                jobs, indexes = future.result()
+            except Exception as e:
+                print(f"[ERROR] Template job {collect_futures[future]} failed: {e}")
                 continue
+            conversion_jobs += jobs
+            lazy_indexes += indexes
+        convert_collected_templates(conversion_jobs, lazy_indexes, executor=other_pool)
 
-            if os.path.exists(input_cif):
-                shutil.copy(input_cif, temp_cif_path)
-                filter_cif_by_chain(temp_cif_path, template_name[4:], final_cif_path)
+        for future in as_completed(search_futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"[ERROR] Template job {search_futures[future]} failed: {e}")
 
-    return return_template_info(dest_template_csv, "pdb_templates", template_cif_destination_path)
 
-def process_target_templates(root_dir, output_root_dir):
+def process_target_templates(root_dir, output_root_dir, num_workers=template_num_workers,
+                             cpu_budget=template_cpu_budget):
     """
     Process monomer templates (N2) and concatenated templates (N5) for a given target.
 
+    Chains, foldseek predictors and N5 template types are independent, so they
+    are scheduled on process pools (see _run_template_jobs). Template structures
+    are stored once per target under <output_root_dir>/store; each source
+    directory only holds the *_templates.csv files indexing into it.
+
     Args:
         root_dir (str): Root directory for the target (e.g., ".../H1245_human")
         output_root_dir (str): Output directory where all results will be saved
+        num_workers (int): Maximum number of concurrent jobs per pool. 1 runs serially.
+        cpu_budget (int): Number of cores the jobs may use, counting hmmsearch threads.
 
     Returns:
         None
     """
-    # from your_module import makedir_if_not_exists, handle_pdb_templates, split_chains_csv  # replace with actual imports
-
-    target_name = os.path.basename(root_dir)
+    search_jobs = []
+    collect_jobs = []
 
     # -------------------------------
     # Step 1: Handle pdb_seqres templates
@@ -356,85 +553,38 @@ def process_target_templates(root_dir, output_root_dir):
     if not os.path.isdir(n1_path):
         print(f"[WARNING] N1 path not found: {n1_path}")
     else:
-        for chain in sorted(os.listdir(n1_path)):
-            chain_path = os.path.join(n1_path, chain)
-            if not os.path.isdir(chain_path):
-                continue  # skip non-directories
-
-            destination_path = os.path.join(output_root_dir, "pdb_seqres")
-            makedir_if_not_exists(destination_path)
-
-            fasta_path = os.path.join(chain_path,f"{chain}.fasta")
-            target,sequences = read_fasta(fasta_path)
-            uniref_sto_path = os.path.join(chain_path,f"{chain}_uniref90.sto")
-
-            dest_template_csv = os.path.join(destination_path, f"{chain}_templates.csv")
-            # _process_single_chain(sequences[0],uniref_sto_path,destination_path,chain,dest_template_csv)
-            # _process_single_chain(sequences[0],uniref_sto_path,destination_path,chain,dest_template_csv)
-            # handle_pdb_seqres_templates(destination_path,dest_template_csv)
-            try:
-                # handle_pdb_templates(chain_path, "", destination_path, dest_template_csv)
-                _process_single_chain(sequences[0],uniref_sto_path,destination_path,chain,dest_template_csv)
-                handle_pdb_seqres_templates(destination_path,dest_template_csv)
-                print(f"[INFO] Processed PDB templates for chain {chain}")
-            except Exception as e:
-                print(f"[ERROR] Failed to handle_pdb_templates for chain {chain}: {e}")
+        chains = [chain for chain in sorted(os.listdir(n1_path))
+                  if os.path.isdir(os.path.join(n1_path, chain))]
+        for chain in chains:
+            search_jobs.append((_process_pdb_seqres_chain, (os.path.join(n1_path, chain), chain, output_root_dir)))
 
 
     # -------------------------------
     # Step 2: Handle foldseek templates
     # -------------------------------
-    print("Handling foldseek templates")
     N6_directory = os.path.join(root_dir, "N6_multimer_structure_generation")
     for predictor in os.listdir(N6_directory):
         if predictor not in ["folds_iter_1","folds_iter_2","folds_iter_o_1","folds_iter_o_2","folds_iter_nop_1","folds_iter_nop_2"]:
             continue
         predictor_dir = os.path.join(N6_directory,predictor)
         output_dir = os.path.join(output_root_dir, predictor)
-
-        handle_foldseek_template(predictor_dir,output_dir)
+        collect_jobs.append((collect_foldseek_template_jobs, (predictor_dir, output_dir, get_store_dir(output_root_dir))))
 
 
-    # return
     # -------------------------------
     # Step 3: Handle concatenated (N5) templates
     # -------------------------------
     template_concat_dir = os.path.join(root_dir, "N5_monomer_templates_concatenation")
     if not os.path.isdir(template_concat_dir):
         print(f"[WARNING] N5 path not found: {template_concat_dir}")
-        return
-
-    for template_type in os.listdir(template_concat_dir):
-        # if template_type != "tmsearch":
-        #     continue
-        template_type_dir = os.path.join(template_concat_dir, template_type)
-        if not os.path.isdir(template_type_dir):
-            continue
-
-        # Find the relevant *_templates.csv
-        input_csv = None
-        for fl in os.listdir(template_type_dir):
-            if fl.endswith("_templates.csv"):
-                input_csv = os.path.join(template_type_dir, fl)
-                break
-
-        if not input_csv or not os.path.isfile(input_csv):
-            print(f"[WARNING] No valid *_templates.csv found in {template_type_dir}")
-            continue
-
-        output_dir = os.path.join(output_root_dir, template_type)
-        makedir_if_not_exists(output_dir)
+    else:
+        for template_type in os.listdir(template_concat_dir):
+            template_type_dir = os.path.join(template_concat_dir, template_type)
+            if not os.path.isdir(template_type_dir):
+                continue
+            collect_jobs.append((_process_template_type, (template_type_dir, template_type, output_root_dir)))
 
-        try:
-            if template_type == "pdb70_seq":
-                _ = split_chains_csv(input_csv, output_dir, template_type_dir,template_type, is_pdb70_seq=True)
-            else:
-                # print("############3")
-                # print(input_csv, output_dir, template_type_dir,template_type)
-                _ = split_chains_csv(input_csv, output_dir, template_type_dir,template_type)
-            print(f"[INFO] Processed chain-split for template_type: {template_type}")
-        except Exception as e:
-            print(f"[ERROR] Failed to split_chains_csv for {template_type}: {e}")
+    _run_template_jobs(search_jobs, collect_jobs, num_workers, cpu_budget)
 
 
 # process_target_templates(
@@ -0,0 +1,467 @@
+"""A client for an hmmpgmd daemon, with the interface of hmmsearch.Hmmsearch.
+
+hmmsearch re-reads the whole sequence database for every query. HMMER's
+hmmpgmd keeps the database in memory and serves searches over a socket, so a
+warm node only pays for the search itself. The daemon returns hits in a binary
+format. This client turns them into the Stockholm alignment that hmmsearch -A
+writes, so get_template_hits and parse_sto_with_indices work unchanged.
+
+hmmpgmd needs the database in its own FASTA layout. Convert pdb_seqres.txt and
+start a master and a worker with:
+
+  python -m template_search.hmmpgmd \\
+      --database_path <database_dir>/pdb_seqres/pdb_seqres.txt \\
+      --output_path <database_dir>/pdb_seqres/pdb_seqres.hmmpgmd
+  hmmpgmd --master --seqdb <database_dir>/pdb_seqres/pdb_seqres.hmmpgmd
+  hmmpgmd --worker 127.0.0.1 --cpu 8
+
+The reply format is the one of HMMER 3.4.
+"""
+import argparse
+import os
+import socket
+import struct
+import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from absl import logging
+import numpy as np
+from template_search import hmmbuild
+from template_search import hmmsearch
+from template_search import utils
+
+DEFAULT_PORT = 51371
+
+# Stockholm blocks are as wide as those of hmmsearch -A.
+_STOCKHOLM_LINE_WIDTH = 200
+_GAPS = frozenset('-._')
+
+# Fixed-size parts of the serialized HMMD_SEARCH_STATUS, HMMD_SEARCH_STATS,
+# P7_HIT, P7_DOMAIN and P7_ALIDISPLAY structures. Everything is big-endian.
+_STATUS = struct.Struct('>IQ')
+_STATS = struct.Struct('>5d2B9Q')
+_HIT = struct.Struct('>Iid3f3df9I2qB')
+_DOMAIN = struct.Struct('>I6q5fd3I')
+_ALIDISPLAY = struct.Struct('>5I3QB')
+_HIT_IS_INCLUDED = 1 << 0
+_ACC_PRESENT = 1 << 0
+_DESC_PRESENT = 1 << 1
+_RFLINE_PRESENT = 1 << 0
+_MMLINE_PRESENT = 1 << 1
+_CSLINE_PRESENT = 1 << 2
+_PPLINE_PRESENT = 1 << 3
+_ASEQ_PRESENT = 1 << 4
+_NTSEQ_PRESENT = 1 << 5
+
+
+class _Domain(NamedTuple):
+  is_included: bool
+  model_length: int
+  hmmfrom: int
+  model: str
+  aseq: str
+  ppline: Optional[str]
+  sqfrom: int
+  sqto: int
+  hmm_name: str
+  hmm_acc: str
+  hmm_desc: str
+
+
+class _Hit(NamedTuple):
+  name: str
+  desc: str
+  sortkey: float
+  is_included: bool
+  domains: List[_Domain]
+
+
+def convert_database(database_path: str, output_path: str) -> None:
+  """Writes a FASTA database in the layout hmmpgmd loads.
+
+  hmmpgmd replaces sequence names by their index and uses the first word of
+  the description as a database bitmask. The original name goes into the
+  description, after the bitmask, from where the client restores it.
+
+  Args:
+    database_path: FASTA database, such as pdb_seqres.txt.
+    output_path: Where to write the converted database.
+  """
+  headers = []
+  lengths = []
+  tmp_path = output_path + '.tmp'
+  with open(database_path) as f, open(tmp_path + '.body', 'w') as body:
+    for line in f:
+      if line.startswith('>'):
+        headers.append(' '.join(line[1:].rstrip().split(maxsplit=1)))
+        lengths.append(0)
+        body.write(f'>{len(headers)} 1 {headers[-1]}\n')
+      elif headers:
+        lengths[-1] += len(''.join(line.split()))
+        body.write(line)
+  stat = os.stat(database_path)
+  with open(tmp_path, 'w') as out, open(tmp_path + '.body') as body:
+    out.write(f'#{sum(lengths)} {len(lengths)} 1 {len(lengths)} '
+              f'{len(lengths)} {stat.st_size}:{stat.st_mtime_ns}\n')
+    for chunk in iter(lambda: body.read(1 << 20), ''):
+      out.write(chunk)
+  os.remove(tmp_path + '.body')
+  os.replace(tmp_path, output_path)
+
+
+def _read_c_strings(data: bytes, count: int) -> Tuple[List[str], int]:
+  """Reads `count` NUL-terminated strings. Returns them and the end offset."""
+  strings = []
+  offset = 0
+  for _ in range(count):
+    end = data.index(b'\0', offset)
+    strings.append(data[offset:end].decode())
+    offset = end + 1
+  return strings, offset
+
+
+def _parse_alidisplay(data: bytes, offset: int,
+                      is_included: bool) -> Tuple[_Domain, int]:
+  """Parses a serialized P7_ALIDISPLAY. Returns it and the end offset."""
+  (ser_size, _, hmmfrom, _, model_length, sqfrom, sqto, _,
+   flags) = _ALIDISPLAY.unpack_from(data, offset)
+  optional_lines = [bool(flags & flag) for flag in (
+      _RFLINE_PRESENT, _MMLINE_PRESENT, _CSLINE_PRESENT, _ASEQ_PRESENT,
+      _NTSEQ_PRESENT, _PPLINE_PRESENT)]
+  # rf, mm, cs, model, mline, aseq, ntseq and pp lines, then the hmm name,
+  # accession and description and the sequence name, accession and
+  # description. Absent lines are skipped.
+  strings, _ = _read_c_strings(
+      data[offset + _ALIDISPLAY.size:offset + ser_size], sum(optional_lines) + 8)
+  strings = iter(strings)
+  for present in optional_lines[:3]:  # rf, mm and cs lines.
+    if present:
+      next(strings)
+  model = next(strings)
+  next(strings)  # mline
+  aseq, _, ppline = [next(strings) if present else None
+                     for present in optional_lines[3:]]
+  hmm_name, hmm_acc, hmm_desc = next(strings), next(strings), next(strings)
+  domain = _Domain(is_included=is_included, model_length=model_length,
+                   hmmfrom=hmmfrom, model=model, aseq=aseq or '',
+                   ppline=ppline, sqfrom=sqfrom, sqto=sqto, hmm_name=hmm_name,
+                   hmm_acc=hmm_acc, hmm_desc=hmm_desc)
+  return domain, offset + ser_size
+
+
+def _parse_hits(data: bytes) -> List[_Hit]:
+  """Parses the serialized search stats and hits of an hmmpgmd reply."""
+  stats = _STATS.unpack_from(data, 0)
+  num_hits = stats[-3]
+  offset = _STATS.size + 8 * max(num_hits, 1)  # Skips the hit offsets.
+  hits = []
+  for _ in range(num_hits):
+    fields = _HIT.unpack_from(data, offset)
+    ser_size, sortkey = fields[0], fields[2]
+    num_domains, flags, presence = fields[14], fields[15], fields[-1]
+    # The daemon names sequences by index. The description holds the original
+    # name and description (see convert_database).
+    strings, _ = _read_c_strings(
+        data[offset + _HIT.size:offset + ser_size],
+        1 + bool(presence & _ACC_PRESENT) + bool(presence & _DESC_PRESENT))
+    name_and_desc = strings[-1] if presence & _DESC_PRESENT else ''
+    name, _, desc = name_and_desc.partition(' ')
+    offset += ser_size
+    domains = []
+    for _ in range(num_domains):
+      domain_fields = _DOMAIN.unpack_from(data, offset)
+      is_included = bool(domain_fields[-2])
+      offset += domain_fields[0]
+      domain, offset = _parse_alidisplay(data, offset, is_included)
+      domains.append(domain)
+    hits.append(_Hit(name=name, desc=desc, sortkey=sortkey,
+                     is_included=bool(flags & _HIT_IS_INCLUDED),
+                     domains=domains))
+  return hits
+
+
+def _encode_posterior(p: float) -> str:
+  """p7_alidisplay_EncodePostProb on a float32 probability."""
+  p = float(np.float32(p))
+  return '*' if p + 0.05 >= 1.0 else chr(int((p + 0.05) * 10.0) + ord('0'))
+
+
+def _decode_posterior(code: str) -> float:
+  """p7_alidisplay_DecodePostProb, as the float32 HMMER stores."""
+  if code == '0':
+    return float(np.float32(0.01))
+  if code == '*':
+    return 1.0
+  if code == '.':
+    return 0.0
+  return float(np.float32((ord(code) - ord('0')) / 10.))
+
+
+def _build_alignment(domains: Sequence[_Domain], model_length: int):
+  """Aligns domains to the profile consensus as p7_tracealign_Seqs does.
+
+  Every consensus column is kept, insertions are lowercase and split between
+  the flanking consensus columns.
+
+  Returns:
+    The aligned sequences, their posterior probability lines (None where the
+    domain has none), the PP_cons line (or None) and the RF line.
+  """
+  traces = []
+  inscount = [0] * (model_length + 1)
+  for domain in domains:
+    insnum = [0] * (model_length + 1)
+    trace = []
+    k = domain.hmmfrom - 1
+    ppline = domain.ppline or '.' * len(domain.model)
+    for model_char, residue, pp in zip(domain.model, domain.aseq, ppline):
+      if model_char not in _GAPS:
+        k += 1
+        state = 'D' if residue in _GAPS else 'M'
+      else:
+        state = 'I'
+        insnum[k] += 1
+      trace.append((state, k, residue, pp))
+    traces.append(trace)
+    inscount = [max(a, b) for a, b in zip(inscount, insnum)]
+
+  matmap = [0] * (model_length + 1)
+  alen = inscount[0]
+  for k in range(1, model_length + 1):
+    matmap[k] = alen + 1
+    alen += 1 + inscount[k]
+
+  rows = []
+  pp_rows = []
+  total_pp = np.zeros(alen)
+  num_pp = np.zeros(alen, dtype=np.int64)
+  for domain, trace in zip(domains, traces):
+    row = ['.'] * alen
+    for k in range(1, model_length + 1):
+      row[matmap[k] - 1] = '-'
+    pp_row = ['.'] * alen
+    has_pp = domain.ppline is not None
+    apos = 0
+    for state, k, residue, pp in trace:
+      if state == 'M':
+        row[matmap[k] - 1] = residue.upper()
+        pp_row[matmap[k] - 1] = pp
+        if has_pp:
+          total_pp[matmap[k] - 1] += _decode_posterior(pp)
+          num_pp[matmap[k] - 1] += 1
+        apos = matmap[k]
+      elif state == 'D':
+        row[matmap[k] - 1] = '-'
+        apos = matmap[k]
+      else:
+        row[apos] = residue.lower()
+        pp_row[apos] = pp
+        apos += 1
+    _rejustify_insertions(row, pp_row if has_pp else None, inscount, matmap)
+    rows.append(''.join(row))
+    pp_rows.append(''.join(pp_row) if has_pp else None)
+
+  pp_cons = None
+  if any(pp_row is not None for pp_row in pp_rows):
+    pp_cons = ''.join(
+        _encode_posterior(total / count) if count else '.'
+        for total, count in zip(total_pp.tolist(), num_pp.tolist()))
+  rf = ['.'] * alen
+  for k in range(1, model_length + 1):
+    rf[matmap[k] - 1] = 'x'
+  return rows, pp_rows, pp_cons, ''.join(rf)
+
+
+def _rejustify_insertions(row: List[str], pp_row: Optional[List[str]],
+                          inscount: Sequence[int],
+                          matmap: Sequence[int]) -> None:
+  """Splits insertions between their flanking consensus columns, in place."""
+  for k in range(len(matmap) - 1):
+    if inscount[k] <= 1:
+      continue
+    start = matmap[k]
+    end = matmap[k + 1] - 1
+    num_left = 0 if k == 0 else sum(
+        c.isalpha() for c in row[start:end]) // 2
+    old = new = end - 1
+    while old >= start + num_left:
+      if row[old] in _GAPS:
+        old -= 1
+        continue
+      row[new] = row[old]
+      if pp_row is not None:
+        pp_row[new] = pp_row[old]
+      new -= 1
+      old -= 1
+    while new >= start + num_left:
+      row[new] = '.'
+      if pp_row is not None:
+        pp_row[new] = '.'
+      new -= 1
+
+
+def _format_stockholm(hits: Sequence[_Hit]) -> str:
+  """Writes the included domains of hits as hmmsearch -A does."""
+  domains = []
+  names = []
+  descs = []
+  for hit in hits:
+    if not hit.is_included:
+      continue
+    for domain in hit.domains:
+      if domain.is_included:
+        domains.append(domain)
+        names.append(f'{hit.name}/{domain.sqfrom}-{domain.sqto}')
+        descs.append(f'[subseq from] {hit.desc or hit.name}')
+  if not domains:
+    return ''
+
+  first = domains[0]
+  rows, pp_rows, pp_cons, rf = _build_alignment(domains, first.model_length)
+
+  max_name = max(len(name) for name in names)
+  max_gc = 7 if pp_cons is not None else 2
+  max_gr = 2 if any(pp_row is not None for pp_row in pp_rows) else 0
+  margin = max(max_name + 1, max_gc + 6)
+  if max_gr:
+    margin = max(margin, max_name + max_gr + 7)
+
+  lines = ['# STOCKHOLM 1.0', f'#=GF ID {first.hmm_name}']
+  if first.hmm_acc:
+    lines.append(f'#=GF AC {first.hmm_acc}')
+  if first.hmm_desc:
+    lines.append(f'#=GF DE {first.hmm_desc}')
+  lines.append('#=GF AU hmmpgmd')
+  lines.append('')
+  for name, desc in zip(names, descs):
+    lines.append(f'#=GS {name:<{max_name}} DE {desc}')
+  lines.append('')
+  for start in range(0, len(rf), _STOCKHOLM_LINE_WIDTH):
+    end = start + _STOCKHOLM_LINE_WIDTH
+    if start:
+      lines.append('')
+    for name, row, pp_row in zip(names, rows, pp_rows):
+      lines.append(f'{name:<{margin - 1}} {row[start:end]}')
+      if pp_row is not None:
+        lines.append(f'#=GR {name:<{max_name}} {"PP":<{margin - max_name - 7}}'
+                     f' {pp_row[start:end]}')
+    if pp_cons is not None:
+      lines.append(f'#=GC {"PP_cons":<{margin - 6}} {pp_cons[start:end]}')
+    lines.append(f'#=GC {"RF":<{margin - 6}} {rf[start:end]}')
+  lines.append('//')
+  return '\n'.join(lines) + '\n'
+
+
+def _split_profiles(hmm: str) -> List[str]:
+  """Splits a (multi-)profile HMM file into single profiles."""
+  profiles = []
+  lines = []
+  for line in hmm.splitlines(keepends=True):
+    lines.append(line)
+    if line.startswith('//'):
+      profiles.append(''.join(lines))
+      lines = []
+  if any(line.strip() for line in lines):
+    raise ValueError('HMM does not end with a // line.')
+  return profiles
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+  chunks = []
+  while size:
+    chunk = sock.recv(min(size, 1 << 20))
+    if not chunk:
+      raise RuntimeError('hmmpgmd closed the connection mid-reply.')
+    chunks.append(chunk)
+    size -= len(chunk)
+  return b''.join(chunks)
+
+
+class Hmmpgmd(hmmsearch.Hmmsearch):
+  """Python client of an hmmpgmd daemon serving a sequence database."""
+
+  def __init__(self,
+               *,
+               hmmbuild_binary_path: str,
+               database_path: str,
+               host: str = '127.0.0.1',
+               port: int = DEFAULT_PORT,
+               flags: Optional[Sequence[str]] = None,
+               timeout: Optional[float] = None):
+    """Initializes the hmmpgmd client.
+
+    Args:
+      hmmbuild_binary_path: The path to the hmmbuild executable. Used to build
+        an hmm from an input msa.
+      database_path: The path to the FASTA database the daemon serves, before
+        conversion by convert_database. Only used to identify the database.
+      host: Host running the hmmpgmd master.
+      port: Client port of the hmmpgmd master (its --cport).
+      flags: List of hmmsearch flags to be used by the search. Defaults to
+        those of hmmsearch.Hmmsearch.
+      timeout: Seconds to wait for the daemon, or None to wait forever.
+
+    Raises:
+      ValueError: If the database is not found, as in hmmsearch.Hmmsearch.
+    """
+    # The daemon workers do the search, so there is no local binary and a
+    # query only holds one local core (for hmmbuild).
+    super().__init__(binary_path=None,
+                     hmmbuild_binary_path=hmmbuild_binary_path,
+                     database_path=database_path,
+                     flags=flags,
+                     num_cpu=1)
+    self.host = host
+    self.port = port
+    self.timeout = timeout
+
+  def query_with_hmm(self, hmm: str) -> str:
+    """Queries the daemon using a given hmm.
+
+    The hmm may hold several profiles, in which case the output holds one
+    Stockholm block per profile with hits.
+    """
+    return ''.join(self._search_profile(profile)
+                   for profile in _split_profiles(hmm))
+
+  def _search_profile(self, profile: str) -> str:
+    request = f'@--seqdb 1 {" ".join(self.flags)}\n{profile}'.encode()
+    logging.info('Sending query to hmmpgmd at %s:%d', self.host, self.port)
+    with utils.timing(f'hmmpgmd ({self.host}:{self.port}) query'):
+      try:
+        with socket.create_connection((self.host, self.port),
+                                      timeout=self.timeout) as sock:
+          sock.sendall(request)
+          status, msg_size = _STATUS.unpack(_recv_exactly(sock, _STATUS.size))
+          reply = _recv_exactly(sock, msg_size)
+      except OSError as e:
+        raise RuntimeError(
+            f'hmmpgmd at {self.host}:{self.port} failed: {e}') from e
+    if status:
+      raise RuntimeError(
+          f'hmmpgmd search failed ({status}): '
+          f'{reply.rstrip(bytes(1)).decode(errors="replace")}')
+    hits = _parse_hits(reply)
+    # The daemon names sequences by index and breaks ties in the sort key
+    # arbitrarily. hmmsearch breaks them by name, then alignment start.
+    hits.sort(key=lambda hit: (-hit.sortkey, hit.name,
+                               hit.domains[0].sqfrom if hit.domains else 0))
+    return _format_stockholm(hits)
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Convert a FASTA database for hmmpgmd --seqdb.')
+  parser.add_argument('--database_path', required=True,
+                      help='FASTA database, such as pdb_seqres.txt.')
+  parser.add_argument('--output_path', required=True)
+  args = parser.parse_args()
+  start = time.perf_counter()
+  convert_database(args.database_path, args.output_path)
+  logging.info('Converted %s in %.1fs', args.database_path,
+               time.perf_counter() - start)
+  print(f'[INFO] Wrote {args.output_path}')
+
+
+if __name__ == '__main__':
+  main()
@@ -33,7 +33,8 @@ class Hmmsearch(object):
                binary_path: str,
                hmmbuild_binary_path: str,
                database_path: str,
-               flags: Optional[Sequence[str]] = None):
+               flags: Optional[Sequence[str]] = None,
+               num_cpu: int = 8):
     """Initializes the Python hmmsearch wrapper.
 
     Args:
@@ -42,6 +43,7 @@ class Hmmsearch(object):
         an hmm from an input a3m.
       database_path: The path to the hmmsearch database (FASTA format).
       flags: List of flags to be used by hmmsearch.
+      num_cpu: The number of worker threads hmmsearch is allowed to use.
 
     Raises:
       RuntimeError: If hmmsearch binary not found within the path.
@@ -59,11 +61,20 @@ class Hmmsearch(object):
                '--domE', '100',
                '--incdomE', '100']
     self.flags = flags
+    self.num_cpu = num_cpu
 
     if not os.path.exists(self.database_path):
       logging.error('Could not find hmmsearch database %s', database_path)
       raise ValueError(f'Could not find hmmsearch database {database_path}')
 
+  def cache_fingerprint(self) -> str:
+    """Returns a string that changes whenever the search may return other hits.
+
+    Covers the search backend and its flags (num_cpu does not change the
+    hits). Used to key cached template search results (search_cache).
+    """
+    return f'{type(self).__name__}:{" ".join(self.flags)}'
+
   @property
   def output_format(self) -> str:
     return 'sto'
@@ -89,7 +100,7 @@ class Hmmsearch(object):
       cmd = [
           self.binary_path,
           '--noali',  # Don't include the alignment in stdout.
-          '--cpu', '8'
+          '--cpu', str(self.num_cpu)
       ]
       # If adding flags, we have to do so before the output and input:
       if self.flags:
@@ -0,0 +1,123 @@
+"""Persistent cache of parsed template mmCIF entries.
+
+Parsing a PDB entry with Biopython dominates the cost of featurizing a template
+hit, and popular entries are hit by many chains, targets and runs. Entries are
+stored as pickles of the compact parse products built by the caller (see
+templates._compact_parsing_result), keyed by the mmCIF path, its mtime and
+size, and PARSER_VERSION. A byte-bounded in-memory LRU of unpickled values
+sits in front of the on-disk store (utils.disk_cache), so a process unpickles
+each popular entry once.
+"""
+import collections
+import hashlib
+import os
+import pickle
+import threading
+from typing import Any, Callable, Optional
+
+from absl import logging
+from utils import disk_cache
+
+# Bump whenever the cached parse products change shape or meaning.
+PARSER_VERSION = 3
+_ENTRY_SUFFIX = '.pkl'
+
+
+class MmcifCache:
+    """Size-bounded on-disk LRU of parse results behind a byte-bounded in-memory LRU.
+
+    Safe to share between the threads of a featurizer.
+    """
+
+    def __init__(self,
+                 cache_dir: Optional[str],
+                 max_memory_bytes: int,
+                 max_disk_bytes: Optional[int] = None):
+        """Initializes the cache.
+
+        Args:
+            cache_dir: Directory for the on-disk entries, or None to keep
+                entries in memory only. Created if missing.
+            max_memory_bytes: Upper bound for the total (pickled) size of the
+                entries held in memory.
+            max_disk_bytes: Upper bound for the total size of the entries in
+                cache_dir, or None for no bound.
+
+        Raises:
+            PermissionError: If cache_dir may be written by other users.
+        """
+        self._entries = None
+        if cache_dir:
+            self._entries = disk_cache.DiskCache(cache_dir, _ENTRY_SUFFIX,
+                                                 max_disk_bytes)
+        self._max_memory_bytes = max_memory_bytes
+        self._memory = collections.OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(cif_path: str, variant: str = '') -> str:
+        stat = os.stat(cif_path)
+        fingerprint = (f'{os.path.realpath(cif_path)}:{stat.st_mtime_ns}:'
+                       f'{stat.st_size}:{PARSER_VERSION}:{variant}')
+        return hashlib.sha1(fingerprint.encode()).hexdigest()
+
+    def _remember(self, key: str, value: Any, num_bytes: int) -> None:
+        if num_bytes > self._max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = (value, num_bytes)
+            self._memory_bytes += num_bytes
+            while self._memory_bytes > self._max_memory_bytes:
+                _, (_, evicted_bytes) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_bytes
+
+    def get(self,
+            cif_path: str,
+            build: Callable[[str], Any],
+            variant: str = '') -> Any:
+        """Returns the cached value for cif_path, calling build(cif_path) on a miss.
+
+        Args:
+            cif_path: Path of the mmCIF file.
+            build: Computes the value to cache from cif_path.
+            variant: Distinguishes differently built values for the same file.
+        """
+        key = self.key(cif_path, variant)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key][0]
+
+        blob = self._entries.read(key) if self._entries else None
+        if blob is not None:
+            try:
+                value = pickle.loads(blob)
+            except Exception as e:  # pylint:disable=broad-except
+                logging.warning('Ignoring unreadable mmCIF cache entry for %s: %s',
+                                cif_path, e)
+                blob = None
+        if blob is None:
+            value = build(cif_path)
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            if self._entries:
+                self._entries.write(key, blob)
+
+        self._remember(key, value, len(blob))
+        return value
+
+
+def create_cache(cache_dir: Optional[str],
+                 max_memory_bytes: int,
+                 max_disk_bytes: Optional[int] = None) -> Optional[MmcifCache]:
+    """Returns an MmcifCache, or None when neither memory nor disk caching is enabled."""
+    if not cache_dir and max_memory_bytes <= 0:
+        return None
+    try:
+        return MmcifCache(cache_dir=cache_dir, max_memory_bytes=max_memory_bytes,
+                          max_disk_bytes=max_disk_bytes)
+    except PermissionError as e:
+        logging.warning('Disabling mmCIF parse cache: %s', e)
+        return None
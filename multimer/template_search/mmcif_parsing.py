@@ -22,6 +22,8 @@ from typing import Any, Mapping, Optional, Sequence, Tuple
 from absl import logging
 from Bio import PDB
 from Bio.Data import SCOPData
+import numpy as np
+from template_search import mmcif_tokenizer
 
 # Type aliases:
 ChainId = str
@@ -67,6 +69,32 @@ class ResidueAtPosition:
   hetflag: str
 
 
+@dataclasses.dataclass(frozen=True)
+class ChainAtoms:
+  """Array-backed atoms of one chain of the first model.
+
+  Built by the 'tokenizer' parse backend in place of a Biopython chain, with
+  the residue and atom selection Biopython would make: point mutations keep
+  the last listed residue and alternative locations keep the first atom with
+  the highest occupancy. Residue r has name residue_names[r] and the atoms
+  atom_names[atom_starts[r]:atom_starts[r + 1]] at the same rows of coords.
+
+  Contains:
+    residue_index: Dict mapping Biopython residue ids (hetflag, residue number,
+      insertion code) to residue indices.
+    residue_names: Residue names, by residue index.
+    atom_starts: int array of the first atom of each residue, with a final
+      entry for the total number of atoms.
+    atom_names: Atom names.
+    coords: float32 array of shape [num_atoms, 3].
+  """
+  residue_index: Mapping[Tuple[str, int, str], int]
+  residue_names: Sequence[str]
+  atom_starts: np.ndarray
+  atom_names: Sequence[str]
+  coords: np.ndarray
+
+
 @dataclasses.dataclass(frozen=True)
 class MmcifObject:
   """Representation of a parsed mmCIF file.
@@ -75,7 +103,7 @@ class MmcifObject:
     file_id: A meaningful name, e.g. a pdb_id. Should be unique amongst all
       files being processed.
     header: Biopython header.
-    structure: Biopython structure.
+    structure: Biopython structure, or None for the 'tokenizer' backend.
     chain_to_seqres: Dict mapping chain_id to 1 letter amino acid sequence. E.g.
       {'A': 'ABCDEFG'}
     seqres_to_structure: Dict; for each chain_id contains a mapping between
@@ -83,6 +111,17 @@ class MmcifObject:
                                                         1: ResidueAtPosition,
                                                         ...}}
     raw_string: The raw string used to construct the MmcifObject.
+    atom_positions: Optional precomputed atom37 (positions, mask) arrays or the
+      exception raised computing them, per chain. Set on the compact objects
+      kept by mmcif_cache, which carry no structure or raw_string, and filled
+      in from atom_data as other chains are used.
+    atom_data: Dict mapping author chain_id to the ChainAtoms of the first
+      model. Set by the 'tokenizer' backend instead of structure. Compact
+      objects keep it only for the chains not computed yet.
+    atom_summaries: Optional precomputed (CA positions, CA mask, number of atoms
+      per residue) arrays or the exception raised computing them, per chain.
+      Set instead of atom_positions on the compact objects of identity-only
+      featurization.
   """
   file_id: str
   header: PdbHeader
@@ -90,6 +129,9 @@ class MmcifObject:
   chain_to_seqres: Mapping[ChainId, SeqRes]
   seqres_to_structure: Mapping[ChainId, Mapping[int, ResidueAtPosition]]
   raw_string: Any
+  atom_positions: Optional[Mapping[ChainId, Any]] = None
+  atom_data: Optional[Mapping[ChainId, ChainAtoms]] = None
+  atom_summaries: Optional[Mapping[ChainId, Any]] = None
 
 
 @dataclasses.dataclass(frozen=True)
@@ -109,6 +151,15 @@ class ParseError(Exception):
   """An error indicating that an mmCIF file could not be parsed."""
 
 
+BACKENDS = ('biopython', 'tokenizer')
+
+# Categories read by the 'tokenizer' backend; everything parse uses.
+_TOKENIZER_CATEGORIES = (
+    '_atom_site.', '_entity_poly_seq.', '_chem_comp.', '_struct_asym.',
+    '_exptl.', '_pdbx_audit_revision_history.', '_refine.',
+    '_em_3d_reconstruction.', '_reflns.', '_entry.')
+
+
 def mmcif_loop_to_list(prefix: str,
                        parsed_info: MmCIFDict) -> Sequence[Mapping[str, str]]:
   """Extracts loop associated with a prefix from mmCIF data as a list.
@@ -165,7 +216,8 @@ def mmcif_loop_to_dict(prefix: str,
 def parse(*,
           file_id: str,
           mmcif_string: str,
-          catch_all_errors: bool = True) -> ParsingResult:
+          catch_all_errors: bool = True,
+          backend: str = 'biopython') -> ParsingResult:
   """Entry point, parses an mmcif_string.
 
   Args:
@@ -175,19 +227,32 @@ def parse(*,
     catch_all_errors: If True, all exceptions are caught and error messages are
       returned as part of the ParsingResult. If False exceptions will be allowed
       to propagate.
+    backend: 'biopython' builds a Biopython structure from the full mmCIF
+      dictionary. 'tokenizer' only tokenizes the categories used here (see
+      mmcif_tokenizer) and sets atom_data instead of structure.
 
   Returns:
     A ParsingResult.
   """
+  if backend not in BACKENDS:
+    raise ValueError(f'Unknown mmCIF parser backend {backend}, '
+                     f'expected one of {BACKENDS}.')
   errors = {}
   try:
-    parser = PDB.MMCIFParser(QUIET=True)
-    handle = io.StringIO(mmcif_string)
-    full_structure = parser.get_structure('', handle)
-    first_model_structure = _get_first_model(full_structure)
-    # Extract the _mmcif_dict from the parser, which contains useful fields not
-    # reflected in the Biopython structure.
-    parsed_info = parser._mmcif_dict  # pylint:disable=protected-access
+    if backend == 'tokenizer':
+      parsed_info = mmcif_tokenizer.tokenize(mmcif_string,
+                                             _TOKENIZER_CATEGORIES)
+      first_model_structure = None
+      atom_data = _get_first_model_atoms(parsed_info)
+    else:
+      parser = PDB.MMCIFParser(QUIET=True)
+      handle = io.StringIO(mmcif_string)
+      full_structure = parser.get_structure('', handle)
+      first_model_structure = _get_first_model(full_structure)
+      atom_data = None
+      # Extract the _mmcif_dict from the parser, which contains useful fields
+      # not reflected in the Biopython structure.
+      parsed_info = parser._mmcif_dict  # pylint:disable=protected-access
 
     # Ensure all values are lists, even if singletons.
     for key, value in parsed_info.items():
@@ -269,7 +334,8 @@ def parse(*,
         structure=first_model_structure,
         chain_to_seqres=author_chain_to_sequence,
         seqres_to_structure=seq_to_structure_mappings,
-        raw_string=parsed_info)
+        raw_string=parsed_info,
+        atom_data=atom_data)
 
     return ParsingResult(mmcif_object=mmcif_object, errors=errors)
   except Exception as e:  # pylint:disable=broad-except
@@ -283,6 +349,163 @@ def _get_first_model(structure: PdbStructure) -> PdbStructure:
   """Returns the first model in a Biopython structure."""
   return next(structure.get_models())
 
+
+class _ResidueAtoms:
+  """Atoms of one residue while building ChainAtoms.
+
+  atoms maps an atom name to [row, occupancy, is_disordered], where row is the
+  _atom_site row of the selected altloc.
+  """
+
+  __slots__ = ('atoms', 'has_blank_altloc')
+
+  def __init__(self):
+    self.atoms = {}
+    self.has_blank_altloc = False
+
+
+class _ResidueEntry:
+  """A residue id of a chain; several residues for point mutations."""
+
+  __slots__ = ('children', 'selected', 'is_disordered')
+
+  def __init__(self, resname: str):
+    self.children = {resname: _ResidueAtoms()}
+    self.selected = resname
+    self.is_disordered = False
+
+
+def _init_residue(chain: Mapping[Tuple[str, int, str], _ResidueEntry],
+                  res_id: Tuple[str, int, str], resname: str) -> _ResidueEntry:
+  """Starts (or resumes) a residue, as Bio.PDB.StructureBuilder.init_residue."""
+  entry = chain.get(res_id)
+  if entry is None:
+    entry = _ResidueEntry(resname)
+    chain[res_id] = entry
+    return entry
+  if res_id[0] != ' ' or (entry.is_disordered and resname in entry.children):
+    raise ParseError(f'Residue {res_id} defined twice.')
+  if entry.is_disordered:
+    entry.children[resname] = _ResidueAtoms()
+    entry.selected = resname
+  elif resname != entry.selected:
+    if entry.children[entry.selected].has_blank_altloc:
+      raise ParseError(
+          f'Blank altlocs in duplicate residue {resname} {res_id}.')
+    entry.children[resname] = _ResidueAtoms()
+    entry.selected = resname
+    entry.is_disordered = True
+  return entry
+
+
+def _add_atom(entry: _ResidueEntry, name: str, altloc: str, occupancy: float,
+              row: int) -> None:
+  """Adds an atom, as Bio.PDB.StructureBuilder.init_atom."""
+  residue = entry.children[entry.selected]
+  atom = residue.atoms.get(name)
+  if altloc == ' ':
+    if entry.is_disordered:
+      raise ParseError(f'Blank altlocs in duplicate residue {entry.selected}.')
+    if atom is not None:
+      raise ParseError(f'Atom {name} defined twice in residue {entry.selected}.')
+    residue.atoms[name] = [row, occupancy, False]
+    residue.has_blank_altloc = True
+  elif atom is None:
+    residue.atoms[name] = [row, occupancy, True]
+  elif atom[2]:
+    if occupancy > atom[1]:
+      atom[0], atom[1] = row, occupancy
+  else:
+    # A blank altloc atom followed by the same atom with an altloc: Biopython
+    # adds the new atom before the old one to the DisorderedAtom.
+    if atom[1] > occupancy:
+      residue.atoms[name] = [atom[0], atom[1], True]
+    else:
+      residue.atoms[name] = [row, occupancy, True]
+
+
+def _get_first_model_atoms(
+    parsed_info: MmCIFDict) -> Mapping[ChainId, ChainAtoms]:
+  """Builds the ChainAtoms of the first model, keyed by author chain id.
+
+  Follows Bio.PDB.MMCIFParser so that the same residues and atoms are selected
+  as in the structure of the 'biopython' backend.
+  """
+  atom_ids = parsed_info['_atom_site.label_atom_id']
+  resnames = parsed_info['_atom_site.label_comp_id']
+  chain_ids = parsed_info['_atom_site.auth_asym_id']
+  if '_atom_site.auth_seq_id' in parsed_info:
+    seq_ids = parsed_info['_atom_site.auth_seq_id']
+  else:
+    seq_ids = parsed_info['_atom_site.label_seq_id']
+  alt_ids = parsed_info['_atom_site.label_alt_id']
+  insertion_codes = parsed_info['_atom_site.pdbx_PDB_ins_code']
+  groups = parsed_info['_atom_site.group_PDB']
+  occupancies = parsed_info['_atom_site.occupancy']
+  b_factors = parsed_info['_atom_site.B_iso_or_equiv']
+  model_nums = parsed_info.get('_atom_site.pdbx_PDB_model_num')
+  first_model = int(model_nums[0]) if model_nums else None
+
+  chains = {}
+  chain = None
+  current_chain_id = None
+  current_res_id = None
+  current_resname = None
+  entry = None
+  for row, seq_id in enumerate(seq_ids):
+    if model_nums is not None and int(model_nums[row]) != first_model:
+      break
+    if seq_id == '.':
+      continue
+    resname = resnames[row]
+    if groups[row] == 'HETATM':
+      hetflag = 'W' if resname in ('HOH', 'WAT') else 'H_' + resname
+    else:
+      hetflag = ' '
+    insertion_code = insertion_codes[row]
+    if not _is_set(insertion_code):
+      insertion_code = ' '
+    res_id = (hetflag, int(seq_id), insertion_code)
+    float(b_factors[row])  # Biopython rejects entries with invalid B factors.
+    occupancy = float(occupancies[row])
+    altloc = alt_ids[row]
+    if not _is_set(altloc):
+      altloc = ' '
+
+    if chain_ids[row] != current_chain_id:
+      current_chain_id = chain_ids[row]
+      chain = chains.setdefault(current_chain_id, {})
+      current_res_id = None
+    if res_id != current_res_id or resname != current_resname:
+      current_res_id, current_resname = res_id, resname
+      entry = _init_residue(chain, res_id, resname)
+    _add_atom(entry, atom_ids[row], altloc, occupancy, row)
+
+  xs = parsed_info['_atom_site.Cartn_x']
+  ys = parsed_info['_atom_site.Cartn_y']
+  zs = parsed_info['_atom_site.Cartn_z']
+  atom_data = {}
+  for chain_id, residues in chains.items():
+    residue_names = []
+    atom_starts = [0]
+    atom_names = []
+    rows = []
+    for entry in residues.values():
+      atoms = entry.children[entry.selected].atoms
+      residue_names.append(entry.selected)
+      atom_names.extend(atoms)
+      rows.extend(atom[0] for atom in atoms.values())
+      atom_starts.append(len(rows))
+    atom_data[chain_id] = ChainAtoms(
+        residue_index={res_id: i for i, res_id in enumerate(residues)},
+        residue_names=residue_names,
+        atom_starts=np.array(atom_starts, dtype=np.int64),
+        atom_names=atom_names,
+        coords=np.array([(float(xs[r]), float(ys[r]), float(zs[r]))
+                         for r in rows], dtype=np.float32).reshape(-1, 3))
+  return atom_data
+
+
 _MIN_LENGTH_OF_CHAIN_TO_BE_COUNTED_AS_PEPTIDE = 21
 
 
@@ -0,0 +1,102 @@
+"""Minimal mmCIF tokenizer that only reads selected categories.
+
+Returns the same {tag: [values]} layout as Biopython's MMCIF2Dict, restricted
+to the requested category prefixes. Every other category is skipped line by
+line without being tokenized, which is most of the work for the template
+entries used by mmcif_parsing.
+"""
+import re
+from typing import Dict, List, Sequence
+
+# A CIF token: a quoted string (closed by the same quote followed by whitespace
+# or the end of the line) or a run of non-whitespace characters.
+_TOKEN_RE = re.compile(r"""'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(\S+)""")
+
+
+def _split_line(line: str) -> List[str]:
+  if "'" not in line and '"' not in line:
+    return line.split()
+  return [match.group(match.lastindex) for match in _TOKEN_RE.finditer(line)]
+
+
+def _read_text_field(lines: Sequence[str], i: int):
+  """Reads a ;-delimited text field starting at lines[i]. Returns (value, next i)."""
+  parts = [lines[i][1:]]
+  i += 1
+  while i < len(lines) and not lines[i].startswith(';'):
+    parts.append(lines[i])
+    i += 1
+  return '\n'.join(parts).strip(), i + 1
+
+
+def _is_item_boundary(line: str) -> bool:
+  return (line.startswith('_') or line.startswith('loop_') or
+          line.startswith('data_') or line.startswith('save_'))
+
+
+def tokenize(mmcif_string: str, categories: Sequence[str]) -> Dict[str, List[str]]:
+  """Tokenizes the requested categories of an mmCIF string.
+
+  Args:
+    mmcif_string: Contents of an mmCIF file.
+    categories: Category prefixes to keep, e.g. '_atom_site.'. Should include
+      the trailing period.
+
+  Returns:
+    A dict mapping each data item of the requested categories to its list of
+    values, as MMCIF2Dict does for all categories.
+  """
+  categories = tuple(categories)
+  parsed = {}
+  lines = mmcif_string.splitlines()
+  num_lines = len(lines)
+  i = 0
+  while i < num_lines:
+    line = lines[i]
+    if line.startswith('loop_'):
+      i += 1
+      tags = []
+      while i < num_lines and lines[i].startswith('_'):
+        tags.extend(lines[i].split())
+        i += 1
+      keep = bool(tags) and tags[0].startswith(categories)
+      values = []
+      while i < num_lines:
+        line = lines[i]
+        if line.startswith(';'):
+          value, i = _read_text_field(lines, i)
+          if keep:
+            values.append(value)
+          continue
+        if _is_item_boundary(line):
+          break
+        if keep and not line.startswith('#'):
+          values.extend(_split_line(line))
+        i += 1
+      if keep:
+        num_tags = len(tags)
+        if len(values) % num_tags:
+          raise ValueError(f'Loop of {tags[0]} has {len(values)} values for '
+                           f'{num_tags} data items.')
+        for col, tag in enumerate(tags):
+          parsed[tag] = values[col::num_tags]
+    elif line.startswith('_'):
+      tokens = _split_line(line)
+      tag = tokens[0]
+      keep = tag.startswith(categories)
+      if len(tokens) > 1:
+        value = tokens[1]
+        i += 1
+      elif i + 1 < num_lines and lines[i + 1].startswith(';'):
+        value, i = _read_text_field(lines, i + 1)
+      else:
+        i += 1
+        value = _split_line(lines[i])[0] if i < num_lines else ''
+        i += 1
+      if keep:
+        parsed.setdefault(tag, []).append(value)
+    elif line.startswith(';'):
+      _, i = _read_text_field(lines, i)
+    else:
+      i += 1
+  return parsed
@@ -0,0 +1,217 @@
+"""Benchmarks of the Stockholm MSA preparation in parsers.
+
+_prepare_template_msa truncates the chain's uniref90 MSA to 50,000 sequences,
+deduplicates it and removes its empty columns before building the template
+search profile. Time these steps, compare the wall time and peak memory of
+the column removal with its previous implementation, and those of the three
+steps with iter_template_stockholm_msa, which fuses them, on a real MSA:
+
+  python -m template_search.msa_benchmark --sto_path <msa_dir>/uniref90_hits.sto
+
+or on a synthetic jackhmmer-like MSA of the same size:
+
+  python -m template_search.msa_benchmark --num_sequences 50000
+"""
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from template_search import parsers
+
+_AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def _reference_remove_empty_columns(stockholm_msa: str) -> str:
+  """Previous parsers.remove_empty_columns_from_stockholm_msa."""
+  processed_lines = {}
+  unprocessed_lines = {}
+  for i, line in enumerate(stockholm_msa.splitlines()):
+    if line.startswith('#=GC RF'):
+      reference_annotation_i = i
+      reference_annotation_line = line
+      _, _, first_alignment = line.rpartition(' ')
+      mask = []
+      for j in range(len(first_alignment)):
+        for _, unprocessed_line in unprocessed_lines.items():
+          prefix, _, alignment = unprocessed_line.rpartition(' ')
+          if alignment[j] != '-':
+            mask.append(True)
+            break
+        else:
+          mask.append(False)
+      unprocessed_lines[reference_annotation_i] = reference_annotation_line
+
+      if not any(mask):
+        for line_index in unprocessed_lines:
+          processed_lines[line_index] = ''
+      else:
+        for line_index, unprocessed_line in unprocessed_lines.items():
+          prefix, _, alignment = unprocessed_line.rpartition(' ')
+          masked_alignment = ''.join(itertools.compress(alignment, mask))
+          processed_lines[line_index] = f'{prefix} {masked_alignment}'
+
+      unprocessed_lines = {}
+    elif line.strip() and not line.startswith(('#', '//')):
+      unprocessed_lines[i] = line
+    else:
+      processed_lines[i] = line
+  return '\n'.join((processed_lines[i] for i in range(len(processed_lines))))
+
+
+def _synthetic_stockholm(num_sequences: int, query_length: int,
+                         seed: int) -> str:
+  """Builds a jackhmmer-like Stockholm MSA in blocks of 200 columns.
+
+  Hits are local and cover a random part of the query, with substitutions,
+  deletions and insertions. A fifth of them duplicate the previous hit, and a
+  few match columns are deleted in every hit.
+  """
+  rng = random.Random(seed)
+  query = ''.join(rng.choice(_AMINO_ACIDS) for _ in range(query_length))
+  # Insert columns after some match positions, with their widest insertion.
+  insert_widths = [rng.choice((0,) * 12 + (1, 2, 5))
+                   for _ in range(query_length)]
+  always_deleted = set(rng.sample(range(1, query_length), query_length // 50))
+
+  names = ['query']
+  rows = []
+  query_row = []
+  for i, residue in enumerate(query):
+    query_row.append(residue)
+    query_row.append('.' * insert_widths[i])
+  rows.append(''.join(query_row))
+  for n in range(1, num_sequences):
+    start = rng.randrange(0, query_length // 3)
+    end = rng.randrange(2 * query_length // 3, query_length + 1)
+    names.append(f'UniRef90_S{n:06d}/{start + 1}-{end}')
+    if n > 1 and rng.random() < 0.2:
+      rows.append(rows[-1])
+      continue
+    matches = [
+        '-' if i < start or i >= end or i in always_deleted or
+        rng.random() < 0.05 else
+        (query[i] if rng.random() < 0.6 else rng.choice(_AMINO_ACIDS))
+        for i in range(query_length)
+    ]
+    row = []
+    for i, match in enumerate(matches):
+      row.append(match)
+      width = insert_widths[i]
+      if width:
+        inserted = rng.randrange(0, width + 1) if start <= i < end else 0
+        row.append(''.join(rng.choice(_AMINO_ACIDS).lower()
+                           for _ in range(inserted)) + '.' * (width - inserted))
+    rows.append(''.join(row))
+  rf = ''.join('x' + '.' * width for width in insert_widths)
+
+  margin = max(len(name) for name in names) + 9
+  lines = ['# STOCKHOLM 1.0', '#=GF ID query-i1', '#=GF AU jackhmmer', '']
+  lines.extend(f'#=GS {name} DE [subseq from] synthetic hit'
+               for name in names[1:])
+  lines.append('')
+  for block_start in range(0, len(rf), 200):
+    block_end = block_start + 200
+    for name, row in zip(names, rows):
+      lines.append(f'{name:<{margin - 1}} {row[block_start:block_end]}')
+      lines.append(f'#=GR {name} PP {"*" * len(row[block_start:block_end])}')
+    lines.append(f'#=GC {"PP_cons":<{margin - 6}} '
+                 f'{"*" * len(rf[block_start:block_end])}')
+    lines.append(f'#=GC {"RF":<{margin - 6}} {rf[block_start:block_end]}')
+    lines.append('')
+  lines.append('//')
+  return '\n'.join(lines) + '\n'
+
+
+def _time(function, *args):
+  start = time.perf_counter()
+  result = function(*args)
+  return result, time.perf_counter() - start
+
+
+def _peak_memory(function, *args) -> int:
+  """Returns the peak bytes allocated by Python while running function."""
+  tracemalloc.start()
+  try:
+    function(*args)
+    return tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+
+def _chained_template_msa(sto_path: str, max_sequences: int) -> str:
+  """_prepare_template_msa as three steps, each returning a full string."""
+  msa = parsers.truncate_stockholm_msa(sto_path, max_sequences)
+  msa = parsers.deduplicate_stockholm_msa(msa)
+  return parsers.remove_empty_columns_from_stockholm_msa(msa)
+
+
+def _fused_template_msa(sto_path: str, max_sequences: int) -> str:
+  return '\n'.join(parsers.iter_template_stockholm_msa(sto_path,
+                                                       max_sequences))
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Benchmark the Stockholm MSA preparation of the template '
+      'search against its previous implementation.')
+  parser.add_argument('--sto_path',
+                      help='Stockholm MSA, e.g. a chain\'s uniref90_hits.sto. '
+                      'A synthetic MSA is used when not given.')
+  parser.add_argument('--max_sequences', type=int, default=50000)
+  parser.add_argument('--num_sequences', type=int, default=50000,
+                      help='Sequences of the synthetic MSA.')
+  parser.add_argument('--query_length', type=int, default=400,
+                      help='Query length of the synthetic MSA.')
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    sto_path = args.sto_path
+    if sto_path is None:
+      sto_path = os.path.join(tmp_dir, 'synthetic.sto')
+      with open(sto_path, 'w') as f:
+        f.write(_synthetic_stockholm(args.num_sequences, args.query_length,
+                                     args.seed))
+    truncated, elapsed = _time(parsers.truncate_stockholm_msa, sto_path,
+                               args.max_sequences)
+    print(f'[INFO] truncate_stockholm_msa: {elapsed:.3f}s '
+          f'({len(truncated) / 1e6:.1f} MB)')
+    deduplicated, elapsed = _time(parsers.deduplicate_stockholm_msa, truncated)
+    print(f'[INFO] deduplicate_stockholm_msa: {elapsed:.3f}s '
+          f'({len(deduplicated) / 1e6:.1f} MB)')
+
+    reference, reference_elapsed = _time(_reference_remove_empty_columns,
+                                         deduplicated)
+    result, elapsed = _time(parsers.remove_empty_columns_from_stockholm_msa,
+                            deduplicated)
+    reference_peak = _peak_memory(_reference_remove_empty_columns, deduplicated)
+    peak = _peak_memory(parsers.remove_empty_columns_from_stockholm_msa,
+                        deduplicated)
+    print(f'[INFO] remove_empty_columns_from_stockholm_msa: {elapsed:.3f}s, '
+          f'peak {peak / 1e6:.1f} MB; previous implementation '
+          f'{reference_elapsed:.3f}s ({reference_elapsed / elapsed:.1f}x), '
+          f'peak {reference_peak / 1e6:.1f} MB')
+    print(f'[INFO] Identical output: {result == reference}')
+    del truncated, deduplicated, reference, result
+
+    chained, chained_elapsed = _time(_chained_template_msa, sto_path,
+                                     args.max_sequences)
+    fused, fused_elapsed = _time(_fused_template_msa, sto_path,
+                                 args.max_sequences)
+    chained_peak = _peak_memory(_chained_template_msa, sto_path,
+                                args.max_sequences)
+    fused_peak = _peak_memory(_fused_template_msa, sto_path, args.max_sequences)
+    print(f'[INFO] Chained truncate/deduplicate/remove_empty_columns: '
+          f'{chained_elapsed:.3f}s, peak {chained_peak / 1e6:.1f} MB')
+    print(f'[INFO] iter_template_stockholm_msa: {fused_elapsed:.3f}s, '
+          f'peak {fused_peak / 1e6:.1f} MB '
+          f'({len(fused) / 1e6:.1f} MB output)')
+    print(f'[INFO] Identical output: {fused == chained}')
+
+
+if __name__ == '__main__':
+  main()
@@ -1,3 +1,13 @@
+import numpy as np
+
+from utils.alignment_indices import aligned_indices, sequence_codes
+
+_GAP = ord("-")
+_DOT = ord(".")
+_LOWER_A = ord("a")
+_LOWER_Z = ord("z")
+
+
 def parse_sto_with_indices(sto_path, one_based_query=False):
     """
     Parse a Stockholm (.sto) file and extract template alignment indices
@@ -10,8 +20,8 @@ def parse_sto_with_indices(sto_path, one_based_query=False):
     Returns:
       - pdb_id
       - template_range (0-based, inclusive)
-      - queryIndices
-      - templateIndices
+      - queryIndices (int32 array)
+      - templateIndices (int32 array)
       - template_sequence (ungapped, aligned residues only)
     """
     results = {}  # key = "pdb_id/start-end"
@@ -52,40 +62,38 @@ def parse_sto_with_indices(sto_path, one_based_query=False):
             entry = results[key]
             
             # Clean template: remove '.' and lowercase letters
-            cleaned_template = "".join(c for c in aligned_seq if c != "." and not c.islower())
-            
-            # Now align: template has only '-' and uppercase letters
-            template_pos = entry["template_pos"]
-            query_pos = entry["query_pos"]
+            codes = sequence_codes(aligned_seq)
+            cleaned_template = codes[(codes != _DOT) & ~((codes >= _LOWER_A) & (codes <= _LOWER_Z))]
             
-            for c in cleaned_template:
-                if c == "-":
-                    # Template gap - query advances
-                    query_pos += 1
-                else:
-                    # Uppercase letter - aligned residue, both advance
-                    q_idx = query_pos + (1 if one_based_query else 0)
-                    entry["queryIndices"].append(q_idx)
-                    entry["templateIndices"].append(template_pos)
-                    entry["template_sequence"].append(c)
-                    query_pos += 1
-                    template_pos += 1
+            # Now align: template has only '-' and uppercase letters. '-' is a
+            # template gap (query advances), a letter advances both.
+            template_gaps = cleaned_template == _GAP
+            query_indices, template_indices = aligned_indices(
+                np.zeros(len(cleaned_template), dtype=bool), template_gaps,
+                entry["query_pos"] + (1 if one_based_query else 0), entry["template_pos"])
+            entry["queryIndices"].append(query_indices)
+            entry["templateIndices"].append(template_indices)
+            entry["template_sequence"].append(
+                cleaned_template[~template_gaps].astype('<u4').tobytes().decode('utf-32-le'))
             
-            entry["template_pos"] = template_pos
-            entry["query_pos"] = query_pos
+            entry["template_pos"] += len(template_indices)
+            entry["query_pos"] += len(cleaned_template)
     
     # finalize output
     final_results = []
     for entry in results.values():
-        assert len(entry["queryIndices"]) == len(entry["templateIndices"])
-        assert len(entry["queryIndices"]) == len(entry["template_sequence"])
+        query_indices = np.concatenate(entry["queryIndices"])
+        template_indices = np.concatenate(entry["templateIndices"])
+        template_sequence = "".join(entry["template_sequence"])
+        assert len(query_indices) == len(template_indices)
+        assert len(query_indices) == len(template_sequence)
         
         final_results.append({
             "pdb_id": entry["pdb_id"],
             "template_range": entry["template_range"],
-            "queryIndices": entry["queryIndices"],
-            "templateIndices": entry["templateIndices"],
-            "template_sequence": "".join(entry["template_sequence"]),
+            "queryIndices": query_indices,
+            "templateIndices": template_indices,
+            "template_sequence": template_sequence,
         })
     
     return final_results
@@ -15,10 +15,12 @@
 """Functions for parsing various file formats."""
 import collections
 import dataclasses
+import hashlib
 import itertools
 import re
 import string
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Set
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Set
+import numpy as np
 import pandas as pd
 
 # Internal import (7716).
@@ -26,6 +28,10 @@ import pandas as pd
 
 DeletionMatrix = Sequence[Sequence[int]]
 
+# Bump whenever iter_template_stockholm_msa (and the steps it fuses) changes
+# its output; cached template searches (search_cache) are keyed by it.
+TEMPLATE_MSA_VERSION = 1
+
 
 @dataclasses.dataclass(frozen=True)
 class Msa:
@@ -298,36 +304,53 @@ def truncate_stockholm_msa(stockholm_msa_path: str, max_sequences: int) -> str:
     return ''.join(filtered_lines)
 
 
+def _mask_stockholm_block(lines: Sequence[str]) -> List[str]:
+    """Removes the dash-only columns of one Stockholm block.
+
+    `lines` are the block's sequence lines followed by its '#=GC RF' line. The
+    columns are those of the RF line; a column is empty when every sequence
+    line has '-' there.
+    """
+    prefixes, _, alignments = zip(*(line.rpartition(' ') for line in lines))
+    num_columns = len(alignments[-1])
+    block = ''.join(alignments).encode()
+    is_ragged = (len(block) != len(alignments) * num_columns or
+                 any(len(alignment) != num_columns for alignment in alignments))
+    if not is_ragged:
+        matrix = np.frombuffer(block, dtype=np.uint8).reshape(
+            len(alignments), num_columns)
+    else:
+        # Columns missing from a short row count as gaps.
+        matrix = np.full((len(alignments), num_columns), ord('-'),
+                         dtype=np.uint8)
+        for row, alignment in zip(matrix, alignments):
+            row_columns = np.frombuffer(alignment.encode(),
+                                        dtype=np.uint8)[:num_columns]
+            row[:len(row_columns)] = row_columns
+    mask = (matrix[:-1] != ord('-')).any(axis=0)
+    if not mask.any():  # All columns were empty. Output empty lines for chunk.
+        return [''] * len(lines)
+
+    if is_ragged:
+        column_mask = mask.tolist()
+        return [f'{prefix} {"".join(itertools.compress(alignment, column_mask))}'
+                for prefix, alignment in zip(prefixes, alignments)]
+    width = int(mask.sum())
+    masked_block = matrix[:, mask].tobytes().decode()
+    return [f'{prefix} {masked_block[i * width:(i + 1) * width]}'
+            for i, prefix in enumerate(prefixes)]
+
+
 def remove_empty_columns_from_stockholm_msa(stockholm_msa: str) -> str:
     """Removes empty columns (dashes-only) from a Stockholm MSA."""
     processed_lines = {}
     unprocessed_lines = {}
     for i, line in enumerate(stockholm_msa.splitlines()):
         if line.startswith('#=GC RF'):
-            reference_annotation_i = i
-            reference_annotation_line = line
             # Reached the end of this chunk of the alignment. Process chunk.
-            _, _, first_alignment = line.rpartition(' ')
-            mask = []
-            for j in range(len(first_alignment)):
-                for _, unprocessed_line in unprocessed_lines.items():
-                    prefix, _, alignment = unprocessed_line.rpartition(' ')
-                    if alignment[j] != '-':
-                        mask.append(True)
-                        break
-                else:  # Every row contained a hyphen - empty column.
-                    mask.append(False)
-            # Add reference annotation for processing with mask.
-            unprocessed_lines[reference_annotation_i] = reference_annotation_line
-
-            if not any(mask):  # All columns were empty. Output empty lines for chunk.
-                for line_index in unprocessed_lines:
-                    processed_lines[line_index] = ''
-            else:
-                for line_index, unprocessed_line in unprocessed_lines.items():
-                    prefix, _, alignment = unprocessed_line.rpartition(' ')
-                    masked_alignment = ''.join(itertools.compress(alignment, mask))
-                    processed_lines[line_index] = f'{prefix} {masked_alignment}'
+            unprocessed_lines[i] = line
+            masked_lines = _mask_stockholm_block(list(unprocessed_lines.values()))
+            processed_lines.update(zip(unprocessed_lines, masked_lines))
 
             # Clear raw_alignments.
             unprocessed_lines = {}
@@ -338,41 +361,139 @@ def remove_empty_columns_from_stockholm_msa(stockholm_msa: str) -> str:
     return '\n'.join((processed_lines[i] for i in range(len(processed_lines))))
 
 
-def deduplicate_stockholm_msa(stockholm_msa: str) -> str:
-    """Remove duplicate sequences (ignoring insertions wrt query)."""
-    sequence_dict = collections.defaultdict(str)
+def _deduplicated_seqnames(lines: Iterable[str]) -> Set[str]:
+    """Returns the names of the Stockholm sequences kept by deduplication.
+
+    Sequences are compared on their alignment without the insertions wrt the
+    query (the first sequence). Only a fixed-size digest of each masked
+    alignment is kept, so memory grows with the number of sequences rather
+    than with the size of the alignment.
+    """
+    query_name = None
+    query_mask = []  # Non-gap columns of the query alignment read so far.
+    hashers = {}  # Insertion ordered, like the sequences.
+    num_hashed = {}  # Leading columns of each alignment already hashed.
+    pending = {}  # Columns past the query alignment read so far.
+
+    def hash_columns(seqname, columns):
+        start = num_hashed[seqname]
+        covered = columns[:len(query_mask) - start]
+        if covered:
+            end = start + len(covered)
+            masked = itertools.compress(covered, query_mask[start:end])
+            hashers[seqname].update(''.join(masked).encode())
+            num_hashed[seqname] = end
+        pending[seqname] = columns[len(covered):]
 
-    # First we must extract all sequences from the MSA.
-    for line in stockholm_msa.splitlines():
+    for line in lines:
         # Only consider the alignments - ignore reference annotation, empty lines,
         # descriptions or markup.
         if line.strip() and not line.startswith(('#', '//')):
-            line = line.strip()
-            seqname, alignment = line.split()
-            sequence_dict[seqname] += alignment
-
-    seen_sequences = set()
+            seqname, alignment = line.strip().split()
+            if query_name is None:  # First alignment is the query.
+                query_name = seqname
+            if seqname == query_name:
+                query_mask.extend(c != '-' for c in alignment)
+            if seqname not in hashers:
+                hashers[seqname] = hashlib.blake2b(digest_size=16)
+                num_hashed[seqname] = 0
+                pending[seqname] = ''
+            hash_columns(seqname, pending[seqname] + alignment)
+    # Blocks where a sequence came before the query.
+    for seqname, columns in list(pending.items()):
+        if columns:
+            hash_columns(seqname, columns)
+
+    seen_digests = set()
     seqnames = set()
-    # First alignment is the query.
-    query_align = next(iter(sequence_dict.values()))
-    mask = [c != '-' for c in query_align]  # Mask is False for insertions.
-    for seqname, alignment in sequence_dict.items():
-        # Apply mask to remove all insertions from the string.
-        masked_alignment = ''.join(itertools.compress(alignment, mask))
-        if masked_alignment in seen_sequences:
-            continue
-        else:
-            seen_sequences.add(masked_alignment)
+    for seqname, hasher in hashers.items():
+        digest = hasher.digest()
+        if digest not in seen_digests:
+            seen_digests.add(digest)
             seqnames.add(seqname)
+    return seqnames
 
-    filtered_lines = []
-    for line in stockholm_msa.splitlines():
-        if _keep_line(line, seqnames):
-            filtered_lines.append(line)
+
+def deduplicate_stockholm_msa(stockholm_msa: str) -> str:
+    """Remove duplicate sequences (ignoring insertions wrt query)."""
+    lines = stockholm_msa.splitlines()
+    seqnames = _deduplicated_seqnames(lines)
+    filtered_lines = [line for line in lines if _keep_line(line, seqnames)]
 
     return '\n'.join(filtered_lines) + '\n'
 
 
+def deduplicate_stockholm_msa_file(stockholm_msa_path: str,
+                                   output_path: str) -> None:
+    """Streaming deduplicate_stockholm_msa between two Stockholm files.
+
+    The input is read twice, once to find the sequences to keep and once to
+    write them, and is never held in memory as a whole.
+    """
+    with open(stockholm_msa_path) as f:
+        seqnames = _deduplicated_seqnames(f)
+    with open(stockholm_msa_path) as f, open(output_path, 'w') as out:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if _keep_line(line, seqnames):
+                out.write(line + '\n')
+
+
+def _truncated_lines(lines: Iterable[str],
+                     max_sequences: int) -> Iterator[str]:
+    """Drops the alignment lines of all but the first max_sequences sequences."""
+    seqnames = set()
+    for line in lines:
+        if line.strip() and not line.startswith(('#', '//')):
+            seqname = line.partition(' ')[0]
+            if seqname not in seqnames:
+                if len(seqnames) >= max_sequences:
+                    continue
+                seqnames.add(seqname)
+        yield line
+
+
+def iter_template_stockholm_msa(stockholm_msa_path: str,
+                                max_sequences: int) -> Iterator[str]:
+    """Streams the template search MSA of a Stockholm file, line by line.
+
+    Fuses truncate_stockholm_msa, deduplicate_stockholm_msa and
+    remove_empty_columns_from_stockholm_msa: the yielded lines, joined with
+    newlines, are their output. Whether a sequence is a duplicate is only known
+    once all of its blocks are read, so the file is read twice: once to hash
+    the sequences, once to emit the kept lines a block at a time.
+    """
+    with open(stockholm_msa_path) as f:
+        seqnames = _deduplicated_seqnames(_truncated_lines(f, max_sequences))
+
+    with open(stockholm_msa_path) as f:
+        block = []  # Lines since the first alignment line of the block.
+        alignment_indices = []
+        for line in f:
+            line = line.rstrip('\r\n')
+            if not _keep_line(line, seqnames):
+                continue
+            if line.startswith('#=GC RF'):
+                # Reached the end of this chunk of the alignment. Process chunk.
+                alignment_indices.append(len(block))
+                block.append(line)
+                masked_lines = _mask_stockholm_block(
+                    [block[i] for i in alignment_indices])
+                for i, masked_line in zip(alignment_indices, masked_lines):
+                    block[i] = masked_line
+                yield from block
+                block = []
+                alignment_indices = []
+            elif line.strip() and not line.startswith(('#', '//')):
+                alignment_indices.append(len(block))
+                block.append(line)
+            elif block:
+                block.append(line)
+            else:
+                yield line
+        yield from block
+
+
 def _get_hhr_line_regex_groups(
         regex_pattern: str, line: str) -> Sequence[Optional[str]]:
     match = re.match(regex_pattern, line)
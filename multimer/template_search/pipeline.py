@@ -27,73 +27,67 @@ from absl import logging
 import numpy as np
 import pickle
 import pandas as pd
+from template_search import hmmpgmd
 from template_search import hmmsearch
 from template_search import templates
 from template_search import parsers
-import subprocess
+from template_search import search_cache
 from template_search.parse_stockholm_template import parse_sto_with_indices
 from utils.utils import makedir_if_not_exists
-from common.config import env_dir,database_dir,max_template_date,template_max_hits
-
-
-template_searcher = hmmsearch.Hmmsearch(
-    binary_path=os.path.join(env_dir, 'hmmsearch'),
-    hmmbuild_binary_path=os.path.join(env_dir, 'hmmbuild'),
-    database_path=os.path.join(database_dir, 'pdb_seqres/pdb_seqres.txt'))
+from common.config import env_dir,database_dir,max_template_date,template_max_hits,hmmsearch_num_cpu
+from common.config import template_search_backend,hmmpgmd_host,hmmpgmd_port
+from common.config import template_search_cache_dir,template_search_cache_max_bytes
+from common.config import template_mmcif_cache_dir,template_mmcif_cache_max_bytes,template_mmcif_cache_max_disk_bytes
+from common.config import template_mmcif_parser
+from common.config import template_realign_backend,template_realign_cache_dir,template_realign_cache_max_bytes
+from common.config import template_featurize_num_workers,template_release_dates_path
+
+
+if template_search_backend == 'hmmpgmd':
+    template_searcher = hmmpgmd.Hmmpgmd(
+        hmmbuild_binary_path=os.path.join(env_dir, 'hmmbuild'),
+        database_path=os.path.join(database_dir, 'pdb_seqres/pdb_seqres.txt'),
+        host=hmmpgmd_host,
+        port=hmmpgmd_port)
+else:
+    template_searcher = hmmsearch.Hmmsearch(
+        binary_path=os.path.join(env_dir, 'hmmsearch'),
+        hmmbuild_binary_path=os.path.join(env_dir, 'hmmbuild'),
+        database_path=os.path.join(database_dir, 'pdb_seqres/pdb_seqres.txt'),
+        num_cpu=hmmsearch_num_cpu)
+
+release_dates_path = template_release_dates_path
+if release_dates_path and not os.path.exists(release_dates_path):
+    logging.warning('Release date index %s not found, reading release dates from the mmCIF '
+                    'files; build it with python -m template_search.release_dates',
+                    release_dates_path)
+    release_dates_path = None
 
 template_featurizer = templates.HmmsearchHitFeaturizer(
     mmcif_dir=os.path.join(database_dir, 'pdb_mmcif/mmcif_files'),
     max_template_date=max_template_date,
     max_hits=template_max_hits,
     kalign_binary_path=os.path.join(env_dir, 'kalign'),
-    release_dates_path=None,
-    obsolete_pdbs_path=os.path.join(database_dir, 'pdb_mmcif/obsolete.dat'))
-
-def hmm_runner(ip_sto,op_hmm,op_sto):
-    # op_hmm_path = ip_sto.replace(".sto",".hmm")
-    hmmbuild_cmd = [
-    f"{env_dir}/hmmbuild",
-    "--hand",
-    "--amino",
-    op_hmm,
-    ip_sto,
-    ]
-    # print(f"Launching: {hmmbuild_cmd}")
-
-    result = subprocess.run(
-        hmmbuild_cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        check=True
-    )
-
-    # print("STDOUT:\n", result.stdout)
-
-    hmmsearch_cmd = [
-    f"{env_dir}/hmmsearch",
-    "--noali",
-    "--cpu", "8",
-    "--F1", "0.1",
-    "--F2", "0.1",
-    "--F3", "0.1",
-    "--incE", "100",
-    "-E", "100",
-    "--domE", "100",
-    "--incdomE", "100",
-    "-A", op_sto,
-    op_hmm,
-    f"{database_dir}/pdb_seqres/pdb_seqres.txt",
-    ]
-    result = subprocess.run(
-    hmmsearch_cmd,
-    stdout=subprocess.PIPE,
-    stderr=subprocess.PIPE,
-    text=True,
-    check=True
-    )
-    # print(f"Launching: {hmmsearch_cmd}")
-    # print("STDOUT:\n", result.stdout)
+    release_dates_path=release_dates_path,
+    obsolete_pdbs_path=os.path.join(database_dir, 'pdb_mmcif/obsolete.dat'),
+    # _process_single_chain only needs the accepted hits' names and sequences.
+    identity_only=True,
+    mmcif_cache_dir=template_mmcif_cache_dir,
+    mmcif_cache_max_bytes=template_mmcif_cache_max_bytes,
+    mmcif_cache_max_disk_bytes=template_mmcif_cache_max_disk_bytes,
+    mmcif_parser_backend=template_mmcif_parser,
+    realign_backend=template_realign_backend,
+    realign_cache_dir=template_realign_cache_dir,
+    realign_cache_max_bytes=template_realign_cache_max_bytes,
+    num_workers=template_featurize_num_workers)
+
+# Sequences of the chain's uniref90 MSA kept for the template search profile.
+_TEMPLATE_MSA_MAX_SEQUENCES = 50000
+
+template_search_cache = search_cache.create_cache(
+    cache_dir=template_search_cache_dir,
+    database_path=template_searcher.database_path,
+    max_size_bytes=template_search_cache_max_bytes)
 
 from difflib import SequenceMatcher
 
@@ -128,8 +122,8 @@ def extract_top_templates(template_dict, templates_from_sto, min_similarity=0.9)
             if t["pdb_id"] in top_pdbs:
                 top_templates.append({
                     "template_name": t["pdb_id"],
-                    "query_indices": t["queryIndices"],
-                    "template_indices": t["templateIndices"],
+                    "query_indices": t["queryIndices"].tolist(),
+                    "template_indices": t["templateIndices"].tolist(),
                     # "template_sequence": t["template_sequence"],
                 })
     else:
@@ -141,8 +135,8 @@ def extract_top_templates(template_dict, templates_from_sto, min_similarity=0.9)
                 if sim >= min_similarity:
                     top_templates.append({
                         "template_name": t["pdb_id"],
-                        "query_indices": t["queryIndices"],
-                        "template_indices": t["templateIndices"],
+                        "query_indices": t["queryIndices"].tolist(),
+                        "template_indices": t["templateIndices"].tolist(),
                         # "template_sequence": t["template_sequence"],
                         # "similarity": sim,
                     })
@@ -154,20 +148,28 @@ def _process_single_chain(sequence,chain_template_sto,output_path,chain,destinat
     output_path_temp = os.path.join(output_path,"temp")
     makedir_if_not_exists(output_path_temp)
     op_sto = os.path.join(output_path_temp,f"{chain}_pdb_hits.sto")
-    op_hmm = os.path.join(output_path_temp,f"{chain}_query.hmm")
-
-    print(f"Running pdb_seqres template search for chain: {chain}")
-    hmm_runner(chain_template_sto,op_hmm,op_sto)
 
+    cache_key = None
+    if template_search_cache is not None:
+        cache_key = template_search_cache.key(sequence, chain_template_sto,
+                                              _TEMPLATE_MSA_MAX_SEQUENCES,
+                                              max_template_date, template_max_hits,
+                                              template_searcher.cache_fingerprint(),
+                                              template_featurizer.cache_fingerprint())
+        if template_search_cache.get(cache_key, destination_template_csv):
+            print(f"Reusing cached pdb_seqres template search for chain: {chain}")
+            return
 
+    print(f"Running pdb_seqres template search for chain: {chain}")
 
-    msa_for_templates = parsers.truncate_stockholm_msa(chain_template_sto,
-                                                    max_sequences=50000)
-    msa_for_templates = parsers.deduplicate_stockholm_msa(msa_for_templates)
-    msa_for_templates = parsers.remove_empty_columns_from_stockholm_msa(msa_for_templates)
+    msa_for_templates = '\n'.join(parsers.iter_template_stockholm_msa(
+        chain_template_sto, max_sequences=_TEMPLATE_MSA_MAX_SEQUENCES))
 
+    # One hmmsearch pass; its Stockholm output feeds both the featurizer and
+    # parse_sto_with_indices.
     pdb_templates_result = template_searcher.query(msa_for_templates)
-
+    with open(op_sto, "w") as f:
+        f.write(pdb_templates_result)
 
     pdb_template_hits = template_searcher.get_template_hits(
         output_string=pdb_templates_result, input_sequence=sequence)
@@ -190,3 +192,6 @@ def _process_single_chain(sequence,chain_template_sto,output_path,chain,destinat
     results = extract_top_templates(template_dict,templates_from_sto)
     df = pd.DataFrame(results)
     df.to_csv(destination_template_csv, index=False)
+
+    if cache_key is not None:
+        template_search_cache.put(cache_key, destination_template_csv)
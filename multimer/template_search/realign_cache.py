@@ -0,0 +1,88 @@
+"""On-disk memo of template realignments.
+
+_realign_pdb_template_to_query aligns the sequence of a hit to the SEQRES of
+its mmCIF chain. Popular templates produce the same (hit sequence, SEQRES)
+pairs across chains, targets and runs. Entries are keyed by a hash of the two
+sequences and the aligner, and hold the old->new template index mapping as an
+int32 array (-1 where unaligned) preceded by the number of identical aligned
+residues. Storage and eviction are those of utils.disk_cache.
+"""
+import hashlib
+from typing import Mapping, Optional, Tuple
+
+from absl import logging
+import numpy as np
+from utils import disk_cache
+
+_ENTRY_SUFFIX = '.i32'
+# Bump whenever the entry layout or the realignment semantics change.
+_VERSION = 1
+
+
+class RealignCache:
+    """Size-bounded LRU cache of old->new template index mappings."""
+
+    def __init__(self, cache_dir: str, max_size_bytes: int):
+        """Initializes the cache.
+
+        Args:
+            cache_dir: Directory holding the cache entries. Created if missing.
+            max_size_bytes: Upper bound for the total size of the cached entries.
+
+        Raises:
+            PermissionError: If cache_dir may be written by other users.
+        """
+        self._entries = disk_cache.DiskCache(cache_dir, _ENTRY_SUFFIX, max_size_bytes)
+
+    @staticmethod
+    def key(old_template_sequence: str,
+            new_template_sequence: str,
+            aligner: str) -> str:
+        """Returns the cache key for realigning one sequence pair with aligner."""
+        hasher = hashlib.sha256()
+        for field in (str(_VERSION), aligner, old_template_sequence,
+                      new_template_sequence):
+            hasher.update(field.encode())
+            hasher.update(b'\0')
+        return hasher.hexdigest()
+
+    def get(self, key: str,
+            old_length: int) -> Optional[Tuple[Mapping[int, int], int]]:
+        """Returns (old_to_new_template_mapping, num_same), or None on a miss."""
+        blob = self._entries.read(key)
+        if blob is None:
+            return None
+        if len(blob) != 4 * (old_length + 1):
+            logging.warning('Ignoring malformed realignment cache entry %s',
+                            self._entries.path(key))
+            return None
+        data = np.frombuffer(blob, dtype=np.int32)
+        new_indices = data[1:]
+        old_indices = np.flatnonzero(new_indices >= 0)
+        return (dict(zip(old_indices.tolist(), new_indices[old_indices].tolist())),
+                int(data[0]))
+
+    def put(self, key: str, old_length: int,
+            old_to_new_template_mapping: Mapping[int, int],
+            num_same: int) -> None:
+        """Stores a realignment and evicts old entries if needed."""
+        data = np.full(old_length + 1, -1, dtype=np.int32)
+        data[0] = num_same
+        if old_to_new_template_mapping:
+            old_indices = np.fromiter(old_to_new_template_mapping.keys(),
+                                      dtype=np.int64)
+            data[old_indices + 1] = np.fromiter(
+                old_to_new_template_mapping.values(), dtype=np.int32)
+        self._entries.write(key, data.tobytes())
+
+
+def create_cache(cache_dir: Optional[str],
+                 max_size_bytes: int) -> Optional[RealignCache]:
+    """Returns a RealignCache, or None when caching is disabled or unsafe."""
+    if not cache_dir:
+        return None
+    try:
+        return RealignCache(cache_dir=cache_dir, max_size_bytes=max_size_bytes)
+    except PermissionError as e:
+        logging.warning('Disabling realignment cache: %s', e)
+        return None
@@ -0,0 +1,227 @@
+"""Precomputed PDB release-date and obsolete-entry index.
+
+The index is built from a local mmCIF mirror (pdb_mmcif/mmcif_files) and the
+obsolete.dat file next to it, and stored as a single .npz file. The release
+date of an entry is its oldest _pdbx_audit_revision_history.revision_date, the
+same value mmcif_parsing puts in header['release_date'], but it is read
+without parsing the structure. Rebuilding is incremental: only mmCIF files
+whose size or mtime changed since the previous build are read again.
+
+Build or refresh the index with:
+
+  python -m template_search.release_dates \\
+      --mmcif_dir <database_dir>/pdb_mmcif/mmcif_files \\
+      --obsolete_pdbs_path <database_dir>/pdb_mmcif/obsolete.dat
+
+TemplateHitFeaturizer loads the index from its default location (see
+default_index_path) when no release_dates_path is given.
+"""
+import argparse
+import datetime
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Mapping, Optional, Tuple
+
+from absl import logging
+import numpy as np
+
+INDEX_FILENAME = 'release_dates_index.npz'
+_INDEX_VERSION = 1
+
+_REVISION_CATEGORY = b'\n_pdbx_audit_revision_history.'
+_DATE_RE = re.compile(rb'(?<![\w-])(\d{4})-(\d{2})-(\d{2})(?![\w-])')
+
+
+def default_index_path(mmcif_dir: str) -> str:
+  """Returns <pdb_mmcif>/release_dates_index.npz for <pdb_mmcif>/mmcif_files."""
+  return os.path.join(os.path.dirname(os.path.normpath(mmcif_dir)),
+                      INDEX_FILENAME)
+
+
+def parse_obsolete(obsolete_file_path: str) -> Mapping[str, Optional[str]]:
+  """Parses the data file from PDB that lists which pdb_ids are obsolete."""
+  with open(obsolete_file_path) as f:
+    result = {}
+    for line in f:
+      line = line.strip()
+      # Format:    Date      From     To
+      # 'OBSLTE    06-NOV-19 6G9Y'                - Removed, rare
+      # 'OBSLTE    31-JUL-94 116L     216L'       - Replaced, common
+      # 'OBSLTE    26-SEP-06 2H33     2JM5 2OWI'  - Replaced by multiple, rare
+      if line.startswith('OBSLTE'):
+        if len(line) > 30:
+          # Replaced by at least one structure.
+          from_id = line[20:24].lower()
+          to_id = line[29:33].lower()
+          result[from_id] = to_id
+        elif len(line) == 24:
+          # Removed.
+          from_id = line[20:24].lower()
+          result[from_id] = None
+    return result
+
+
+def read_release_day(cif_path: str) -> int:
+  """Returns the release date of an mmCIF as a proleptic ordinal, 0 if unknown.
+
+  Only the _pdbx_audit_revision_history category is looked at; it is located
+  with a plain substring search instead of tokenizing the file.
+  """
+  with open(cif_path, 'rb') as f:
+    data = f.read()
+  start = data.find(_REVISION_CATEGORY)
+  if start == -1:
+    return 0
+  end = data.find(b'\n#', start + 1)
+  if end == -1:
+    end = len(data)
+  days = [datetime.date(int(y), int(m), int(d)).toordinal()
+          for y, m, d in _DATE_RE.findall(data, start, end)]
+  return min(days) if days else 0
+
+
+def _file_stat(path: str) -> Tuple[int, int]:
+  stat = os.stat(path)
+  return stat.st_mtime_ns, stat.st_size
+
+
+def _load_arrays(index_path: str) -> Mapping[str, np.ndarray]:
+  with np.load(index_path, allow_pickle=False) as index:
+    arrays = {name: index[name] for name in index.files}
+  if int(arrays['version']) != _INDEX_VERSION:
+    raise ValueError(f'Unsupported release date index version in {index_path}.')
+  return arrays
+
+
+def build_index(mmcif_dir: str,
+                obsolete_pdbs_path: Optional[str],
+                index_path: Optional[str] = None,
+                num_workers: int = 1) -> str:
+  """Builds or incrementally updates the release-date index.
+
+  Args:
+    mmcif_dir: Directory of <pdb_id>.cif files.
+    obsolete_pdbs_path: Path to obsolete.dat, or None to store no obsolete
+      entries.
+    index_path: Output path. Defaults to default_index_path(mmcif_dir).
+    num_workers: Number of processes reading mmCIF files.
+
+  Returns:
+    The path of the written index.
+  """
+  index_path = index_path or default_index_path(mmcif_dir)
+
+  previous = {}
+  if os.path.exists(index_path):
+    try:
+      arrays = _load_arrays(index_path)
+      for pdb_id, day, mtime_ns, size in zip(
+          arrays['pdb_ids'].tolist(), arrays['release_days'].tolist(),
+          arrays['mtime_ns'].tolist(), arrays['sizes'].tolist()):
+        previous[pdb_id] = (mtime_ns, size, day)
+    except (OSError, ValueError, KeyError) as e:
+      logging.warning('Rebuilding unreadable release date index %s: %s',
+                      index_path, e)
+
+  entries = {}
+  to_read = []
+  paths = []
+  with os.scandir(mmcif_dir) as it:
+    for entry in it:
+      if not entry.name.endswith('.cif'):
+        continue
+      pdb_id = entry.name[:-len('.cif')].lower()
+      stat = entry.stat()
+      cached = previous.get(pdb_id)
+      if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        entries[pdb_id] = cached
+      else:
+        entries[pdb_id] = (stat.st_mtime_ns, stat.st_size, 0)
+        to_read.append(pdb_id)
+        paths.append(entry.path)
+
+  logging.info('Release date index: %d entries, reading %d new or changed.',
+               len(entries), len(to_read))
+  if num_workers > 1 and len(paths) > 1:
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+      days = list(pool.map(read_release_day, paths, chunksize=256))
+  else:
+    days = [read_release_day(path) for path in paths]
+  for pdb_id, day in zip(to_read, days):
+    mtime_ns, size, _ = entries[pdb_id]
+    entries[pdb_id] = (mtime_ns, size, day)
+
+  obsolete = parse_obsolete(obsolete_pdbs_path) if obsolete_pdbs_path else {}
+
+  pdb_ids = sorted(entries)
+  values = [entries[pdb_id] for pdb_id in pdb_ids]
+  arrays = {
+      'version': np.array(_INDEX_VERSION),
+      'pdb_ids': np.array(pdb_ids, dtype=str),
+      'mtime_ns': np.array([v[0] for v in values], dtype=np.int64),
+      'sizes': np.array([v[1] for v in values], dtype=np.int64),
+      'release_days': np.array([v[2] for v in values], dtype=np.int32),
+      'obsolete_from': np.array(sorted(obsolete), dtype=str),
+      'obsolete_to': np.array([obsolete[k] or '' for k in sorted(obsolete)],
+                              dtype=str),
+  }
+
+  index_dir = os.path.dirname(index_path) or '.'
+  fd, tmp_path = tempfile.mkstemp(dir=index_dir, prefix='.tmp_', suffix='.npz')
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      np.savez(f, **arrays)
+    os.replace(tmp_path, index_path)
+  except BaseException:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+    raise
+  return index_path
+
+
+def load_index(
+    index_path: str
+) -> Tuple[Mapping[str, datetime.datetime], Mapping[str, Optional[str]]]:
+  """Loads an index written by build_index.
+
+  Returns:
+    A tuple of (release dates by PDB id, obsolete PDB id -> replacement or
+    None), in the formats used by TemplateHitFeaturizer. Entries without a
+    known release date are left out.
+  """
+  arrays = _load_arrays(index_path)
+  release_days = arrays['release_days']
+  known = release_days > 0
+  release_dates = {
+      pdb_id: datetime.datetime.fromordinal(day)
+      for pdb_id, day in zip(arrays['pdb_ids'][known].tolist(),
+                             release_days[known].tolist())}
+  obsolete_pdbs = {
+      from_id: to_id or None
+      for from_id, to_id in zip(arrays['obsolete_from'].tolist(),
+                                arrays['obsolete_to'].tolist())}
+  return release_dates, obsolete_pdbs
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Build or update the PDB release date index.')
+  parser.add_argument('--mmcif_dir', required=True,
+                      help='Directory with <pdb_id>.cif files.')
+  parser.add_argument('--obsolete_pdbs_path', default=None,
+                      help='Path to obsolete.dat.')
+  parser.add_argument('--output', default=None,
+                      help='Index path (default: next to mmcif_dir).')
+  parser.add_argument('--num_workers', type=int, default=8)
+  args = parser.parse_args()
+  logging.set_verbosity(logging.INFO)
+  index_path = build_index(args.mmcif_dir, args.obsolete_pdbs_path,
+                           index_path=args.output,
+                           num_workers=args.num_workers)
+  print(f'[INFO] Wrote release date index {index_path}')
+
+
+if __name__ == '__main__':
+  main()
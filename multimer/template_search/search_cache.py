@@ -0,0 +1,128 @@
+"""On-disk cache of per-chain pdb_seqres template search results.
+
+Entries are the `{chain}_templates.csv` files written by
+pipeline._process_single_chain, stored under a content hash of everything that
+determines them: query sequence, input MSA and how it is preprocessed
+(parsers.TEMPLATE_MSA_VERSION), database version, search backend and flags
+(Hmmsearch.cache_fingerprint), and the featurizer fingerprint (settings plus
+versions of the mmCIF mirror, release date index and obsolete list, see
+TemplateHitFeaturizer.cache_fingerprint).
+All entries are dropped when pdb_seqres changes. Storage and eviction are
+those of utils.disk_cache.
+"""
+import hashlib
+import os
+from typing import Optional
+
+from absl import logging
+from template_search import parsers
+from utils import disk_cache
+
+_ENTRY_SUFFIX = '.csv'
+_VERSION_FILE = 'DATABASE_VERSION'
+
+
+def database_version(database_path: str) -> str:
+    """Returns a fingerprint of a database file that changes when it is replaced.
+
+    For a directory, such as the mmCIF mirror, the fingerprint changes when
+    entries are added, removed or replaced by rename (as rsync does).
+    """
+    stat = os.stat(database_path)
+    return f'{os.path.realpath(database_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def _hash_file(path: str, hasher) -> None:
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(chunk)
+
+
+class TemplateSearchCache:
+    """Size-bounded LRU cache of template search CSVs, keyed by content hash."""
+
+    def __init__(self, cache_dir: str, database_path: str, max_size_bytes: int):
+        """Initializes the cache.
+
+        Args:
+            cache_dir: Directory holding the cache entries. Created if missing.
+            database_path: Path to the searched sequence database
+                (pdb_seqres.txt). All entries are dropped when this file changes.
+            max_size_bytes: Upper bound for the total size of the cached entries.
+
+        Raises:
+            PermissionError: If cache_dir may be written by other users.
+        """
+        self._entries = disk_cache.DiskCache(cache_dir, _ENTRY_SUFFIX, max_size_bytes)
+        self._cache_dir = cache_dir
+        self._database_version = database_version(database_path)
+        self._invalidate_if_database_changed()
+
+    def _invalidate_if_database_changed(self) -> None:
+        version_path = os.path.join(self._cache_dir, _VERSION_FILE)
+        if os.path.exists(version_path):
+            with open(version_path) as f:
+                if f.read().strip() == self._database_version:
+                    return
+            logging.info('Template search database changed, clearing cache %s',
+                         self._cache_dir)
+        self._entries.evict(0)
+        disk_cache.atomic_write(
+            version_path, lambda f: f.write(f'{self._database_version}\n'.encode()))
+
+    def key(self,
+            sequence: str,
+            msa_path: str,
+            max_msa_sequences: int,
+            max_template_date: str,
+            max_hits: int,
+            searcher_fingerprint: str,
+            featurizer_fingerprint: str) -> str:
+        """Returns the cache key for one chain's template search.
+
+        Args:
+            sequence: The chain's query sequence.
+            msa_path: The chain's input Stockholm MSA, hashed by content.
+            max_msa_sequences: Sequences of the MSA kept by
+                parsers.iter_template_stockholm_msa.
+            max_template_date: Template release date cutoff.
+            max_hits: Maximum number of templates kept.
+            searcher_fingerprint: Hmmsearch.cache_fingerprint() of the searcher.
+            featurizer_fingerprint: TemplateHitFeaturizer.cache_fingerprint() of
+                the featurizer that selects the templates.
+        """
+        hasher = hashlib.sha256()
+        for field in (sequence, str(parsers.TEMPLATE_MSA_VERSION),
+                      str(max_msa_sequences), self._database_version,
+                      max_template_date, str(max_hits), searcher_fingerprint,
+                      featurizer_fingerprint):
+            hasher.update(field.encode())
+            hasher.update(b'\0')
+        _hash_file(msa_path, hasher)
+        return hasher.hexdigest()
+
+    def get(self, key: str, destination_csv: str) -> bool:
+        """Copies the cached CSV to destination_csv. Returns False on a miss."""
+        if not self._entries.copy_to(key, destination_csv):
+            return False
+        logging.info('Template search cache hit %s', key)
+        return True
+
+    def put(self, key: str, source_csv: str) -> None:
+        """Stores source_csv under key and evicts old entries if needed."""
+        self._entries.copy_from(key, source_csv)
+
+
+def create_cache(cache_dir: Optional[str],
+                 database_path: str,
+                 max_size_bytes: int) -> Optional[TemplateSearchCache]:
+    """Returns a TemplateSearchCache, or None when caching is disabled or unsafe."""
+    if not cache_dir:
+        return None
+    try:
+        return TemplateSearchCache(cache_dir=cache_dir,
+                                   database_path=database_path,
+                                   max_size_bytes=max_size_bytes)
+    except PermissionError as e:
+        logging.warning('Disabling template search cache: %s', e)
+        return None
@@ -14,19 +14,26 @@
 
 """Functions for getting templates and calculating template features."""
 import abc
+import collections
+from concurrent import futures
 import dataclasses
 import datetime
 import functools
 import glob
 import os
 import re
-from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+from typing import Any, Callable, Dict, Mapping, Optional, Sequence, Tuple
 
 from absl import logging
 from template_search import residue_constants
 from template_search import mmcif_parsing
 from template_search import parsers
 from template_search import kalign
+from template_search import pairwise_aligner
+from template_search import realign_cache as realign_cache_lib
+from template_search import release_dates as release_dates_index
+from template_search import mmcif_cache as mmcif_cache_lib
+from template_search import search_cache
 import numpy as np
 import copy
 
@@ -95,6 +102,13 @@ TEMPLATE_FEATURES = {
     'template_sum_probs': np.float32,
 }
 
+# Features produced in identity-only mode (no atom coordinates are extracted).
+TEMPLATE_IDENTITY_FEATURES = {
+    'template_domain_names': object,
+    'template_sequence': object,
+    'template_sum_probs': np.float32,
+}
+
 
 def _get_pdb_id_and_chain(hit: parsers.TemplateHit) -> Tuple[str, str]:
     """Returns PDB id and chain id for an HHSearch Hit."""
@@ -132,25 +146,7 @@ def _is_after_cutoff(
 
 def _parse_obsolete(obsolete_file_path: str) -> Mapping[str, Optional[str]]:
     """Parses the data file from PDB that lists which pdb_ids are obsolete."""
-    with open(obsolete_file_path) as f:
-        result = {}
-        for line in f:
-            line = line.strip()
-            # Format:    Date      From     To
-            # 'OBSLTE    06-NOV-19 6G9Y'                - Removed, rare
-            # 'OBSLTE    31-JUL-94 116L     216L'       - Replaced, common
-            # 'OBSLTE    26-SEP-06 2H33     2JM5 2OWI'  - Replaced by multiple, rare
-            if line.startswith('OBSLTE'):
-                if len(line) > 30:
-                    # Replaced by at least one structure.
-                    from_id = line[20:24].lower()
-                    to_id = line[29:33].lower()
-                    result[from_id] = to_id
-                elif len(line) == 24:
-                    # Removed.
-                    from_id = line[20:24].lower()
-                    result[from_id] = None
-        return result
+    return release_dates_index.parse_obsolete(obsolete_file_path)
 
 
 def _parse_release_dates(path: str) -> Mapping[str, datetime.datetime]:
@@ -167,6 +163,9 @@ def _parse_release_dates(path: str) -> Mapping[str, datetime.datetime]:
                 release_dates[pdb_id.strip()] = datetime.datetime(
                     year=int(date[:4]), month=int(date[5:7]), day=int(date[8:10]))
         return release_dates
+    elif path.endswith('.npz'):
+        release_dates, _ = release_dates_index.load_index(path)
+        return release_dates
     else:
         raise ValueError('Invalid format of the release date file %s.' % path)
 
@@ -295,12 +294,39 @@ def _find_template_in_pdb(
                                  mmcif_object.chain_to_seqres))
 
 
+REALIGN_BACKENDS = ('pairwise', 'kalign')
+
+
+@functools.lru_cache(maxsize=None)
+def _get_pairwise_aligner() -> pairwise_aligner.PairwiseAligner:
+    return pairwise_aligner.PairwiseAligner()
+
+
+def _align_template_sequences(sequences: Sequence[str],
+                              kalign_binary_path: str,
+                              realign_backend: str) -> str:
+    """Aligns the hit and mmCIF template sequences, returning an A3M string.
+
+  The 'pairwise' backend aligns in-process and falls back to Kalign for
+  sequences it cannot score (letters missing from BLOSUM62).
+  """
+    if realign_backend == 'pairwise':
+        try:
+            return _get_pairwise_aligner().align(sequences)
+        except ValueError as e:
+            logging.info('In-process realignment failed (%s), using Kalign.', e)
+    return kalign.Kalign(binary_path=kalign_binary_path).align(sequences)
+
+
 def _realign_pdb_template_to_query(
         old_template_sequence: str,
         template_chain_id: str,
         mmcif_object: mmcif_parsing.MmcifObject,
         old_mapping: Mapping[int, int],
-        kalign_binary_path: str) -> Tuple[str, Mapping[int, int]]:
+        kalign_binary_path: str,
+        realign_backend: str = 'kalign',
+        realign_cache: Optional[realign_cache_lib.RealignCache] = None
+) -> Tuple[str, Mapping[int, int]]:
     """Aligns template from the mmcif_object to the query.
 
   In case PDB70 contains a different version of the template sequence, we need
@@ -325,6 +351,10 @@ def _realign_pdb_template_to_query(
       sequence to the actual mmcif_object template sequence by aligning the
       old_template_sequence and the actual template sequence.
     kalign_binary_path: The path to a kalign executable.
+    realign_backend: 'pairwise' to align in-process (see pairwise_aligner),
+      with Kalign as fallback, or 'kalign'.
+    realign_cache: Optional memo of old->new template mappings by sequence
+      pair and realign_backend.
 
   Returns:
     A tuple (new_template_sequence, new_query_to_template_mapping) where:
@@ -340,7 +370,6 @@ def _realign_pdb_template_to_query(
       old_template_sequence.
   """
     logging.warning("entered")
-    aligner = kalign.Kalign(binary_path=kalign_binary_path)
     new_template_sequence = mmcif_object.chain_to_seqres.get(
         template_chain_id, '')
 
@@ -359,33 +388,48 @@ def _realign_pdb_template_to_query(
                 'If there are no mmCIF parsing errors, it is possible it was not a '
                 'protein chain.')
 
-    try:
-        parsed_a3m = parsers.parse_a3m(
-            aligner.align([old_template_sequence, new_template_sequence]))
-        old_aligned_template, new_aligned_template = parsed_a3m.sequences
-    except Exception as e:
-        raise QueryToTemplateAlignError(
-            'Could not align old template %s to template %s (%s_%s). Error: %s' %
-            (old_template_sequence, new_template_sequence, mmcif_object.file_id,
-             template_chain_id, str(e)))
-
-    logging.info('Old aligned template: %s\nNew aligned template: %s',
-                 old_aligned_template, new_aligned_template)
-
-    old_to_new_template_mapping = {}
-    old_template_index = -1
-    new_template_index = -1
-    num_same = 0
-    for old_template_aa, new_template_aa in zip(
-            old_aligned_template, new_aligned_template):
-        if old_template_aa != '-':
-            old_template_index += 1
-        if new_template_aa != '-':
-            new_template_index += 1
-        if old_template_aa != '-' and new_template_aa != '-':
-            old_to_new_template_mapping[old_template_index] = new_template_index
-            if old_template_aa == new_template_aa:
-                num_same += 1
+    cache_key = None
+    cached = None
+    if realign_cache is not None:
+        cache_key = realign_cache.key(old_template_sequence,
+                                      new_template_sequence, realign_backend)
+        cached = realign_cache.get(cache_key, len(old_template_sequence))
+
+    if cached is not None:
+        old_to_new_template_mapping, num_same = cached
+    else:
+        try:
+            parsed_a3m = parsers.parse_a3m(_align_template_sequences(
+                [old_template_sequence, new_template_sequence], kalign_binary_path,
+                realign_backend))
+            old_aligned_template, new_aligned_template = parsed_a3m.sequences
+        except Exception as e:
+            raise QueryToTemplateAlignError(
+                'Could not align old template %s to template %s (%s_%s). Error: %s' %
+                (old_template_sequence, new_template_sequence, mmcif_object.file_id,
+                 template_chain_id, str(e)))
+
+        logging.info('Old aligned template: %s\nNew aligned template: %s',
+                     old_aligned_template, new_aligned_template)
+
+        old_to_new_template_mapping = {}
+        old_template_index = -1
+        new_template_index = -1
+        num_same = 0
+        for old_template_aa, new_template_aa in zip(
+                old_aligned_template, new_aligned_template):
+            if old_template_aa != '-':
+                old_template_index += 1
+            if new_template_aa != '-':
+                new_template_index += 1
+            if old_template_aa != '-' and new_template_aa != '-':
+                old_to_new_template_mapping[old_template_index] = new_template_index
+                if old_template_aa == new_template_aa:
+                    num_same += 1
+
+        if realign_cache is not None:
+            realign_cache.put(cache_key, len(old_template_sequence),
+                              old_to_new_template_mapping, num_same)
 
     # Require at least 90 % sequence identity wrt to the shorter of the sequences.
     if float(num_same) / min(
@@ -413,75 +457,281 @@ def _check_residue_distances(all_positions: np.ndarray,
                              max_ca_ca_distance: float):
     """Checks if the distance between unmasked neighbor residues is ok."""
     ca_position = residue_constants.atom_order['CA']
-    prev_is_unmasked = False
-    prev_calpha = None
-    for i, (coords, mask) in enumerate(zip(all_positions, all_positions_mask)):
-        this_is_unmasked = bool(mask[ca_position])
-        if this_is_unmasked:
-            this_calpha = coords[ca_position]
-            if prev_is_unmasked:
-                distance = np.linalg.norm(this_calpha - prev_calpha)
-                if distance > max_ca_ca_distance:
-                    raise CaDistanceError(
-                        'The distance between residues %d and %d is %f > limit %f.' % (
-                            i, i + 1, distance, max_ca_ca_distance))
-            prev_calpha = this_calpha
-        prev_is_unmasked = this_is_unmasked
+    _check_ca_distances(all_positions[:, ca_position],
+                        all_positions_mask[:, ca_position].astype(bool),
+                        max_ca_ca_distance)
+
+
+def _check_ca_distances(calpha: np.ndarray,
+                        unmasked: np.ndarray,
+                        max_ca_ca_distance: float):
+    """Checks the distances between neighbor CA atoms (unmasked: CA present)."""
+    # Pairs of neighbors (i - 1, i) that both have a CA atom.
+    pairs = np.flatnonzero(unmasked[1:] & unmasked[:-1]) + 1
+    distances = np.linalg.norm(calpha[pairs] - calpha[pairs - 1], axis=-1)
+    # Candidates are confirmed with the same per-pair norm as a residue loop, so
+    # rounding differences of the batched norm cannot change the outcome.
+    for i in pairs[distances > max_ca_ca_distance * (1 - 1e-9)]:
+        distance = np.linalg.norm(calpha[i] - calpha[i - 1])
+        if distance > max_ca_ca_distance:
+            raise CaDistanceError(
+                'The distance between residues %d and %d is %f > limit %f.' % (
+                    i, i + 1, distance, max_ca_ca_distance))
 
 
 def _get_atom_positions(
         mmcif_object: mmcif_parsing.MmcifObject,
         auth_chain_id: str,
         max_ca_ca_distance: float) -> Tuple[np.ndarray, np.ndarray]:
-    """Gets atom positions and mask from a list of Biopython Residues."""
-    num_res = len(mmcif_object.chain_to_seqres[auth_chain_id])
+    """Gets atom positions and mask, precomputed or from Biopython Residues."""
+    if mmcif_object.atom_positions is not None:
+        positions, mask = _get_chain_value(
+            mmcif_object, mmcif_object.atom_positions, auth_chain_id,
+            _compute_compact_atom_positions)
+        all_positions = positions.astype(np.float64)
+        all_positions_mask = mask.astype(np.int64)
+    else:
+        all_positions, all_positions_mask = _compute_atom_positions(
+            mmcif_object, auth_chain_id)
+    _check_residue_distances(
+        all_positions, all_positions_mask, max_ca_ca_distance)
+    return all_positions, all_positions_mask
 
-    relevant_chains = [c for c in mmcif_object.structure.get_chains()
-                       if c.id == auth_chain_id]
-    if len(relevant_chains) != 1:
-        raise MultipleChainsError(
-            f'Expected exactly one chain in structure with id {auth_chain_id}.')
-    chain = relevant_chains[0]
 
-    all_positions = np.zeros([num_res, residue_constants.atom_type_num, 3])
-    all_positions_mask = np.zeros([num_res, residue_constants.atom_type_num],
-                                  dtype=np.int64)
+def _get_chain_value(
+        mmcif_object: mmcif_parsing.MmcifObject,
+        values: Dict[str, Any],
+        auth_chain_id: str,
+        compute: Callable[[mmcif_parsing.MmcifObject, str], Any]) -> Any:
+    """Returns values[auth_chain_id] of a compact object, computed on first use.
+
+  Compact objects (see _compact_parsing_result) precompute the requested
+  chain and keep the atom_data of the other chains to compute them lazily.
+  Errors are stored like values and raised again.
+  """
+    cached = values.get(auth_chain_id)
+    if cached is None:
+        if mmcif_object.structure is None and mmcif_object.atom_data is None:
+            raise KeyError(auth_chain_id)
+        try:
+            cached = compute(mmcif_object, auth_chain_id)
+        except (Error, KeyError) as e:
+            cached = e
+        values[auth_chain_id] = cached
+    if isinstance(cached, Exception):
+        raise type(cached)(*cached.args)
+    return cached
+
+
+def _get_atom_counts(
+        mmcif_object: mmcif_parsing.MmcifObject,
+        auth_chain_id: str,
+        max_ca_ca_distance: float) -> np.ndarray:
+    """Gets the number of atoms of every residue, checked like _get_atom_positions.
+
+  Only needs the CA positions and atom counts of the chain, precomputed on the
+  compact identity-only objects (atom_summaries), and raises the same errors as
+  _get_atom_positions.
+  """
+    if mmcif_object.atom_positions is not None:
+        _, all_positions_mask = _get_atom_positions(
+            mmcif_object, auth_chain_id, max_ca_ca_distance)
+        return all_positions_mask.sum(axis=1)
+    if mmcif_object.atom_summaries is None:
+        ca_positions, ca_mask, num_atoms = _compute_atom_summary(
+            mmcif_object, auth_chain_id)
+    else:
+        ca_positions, ca_mask, num_atoms = _get_chain_value(
+            mmcif_object, mmcif_object.atom_summaries, auth_chain_id,
+            _compute_atom_summary)
+    _check_ca_distances(ca_positions.astype(np.float64), ca_mask.astype(bool),
+                        max_ca_ca_distance)
+    return num_atoms.astype(np.int64)
+
+
+def _atom_name_types(atom_names: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the atom37 index of each atom name (-1 if none) and which are SE."""
+    atom_order = residue_constants.atom_order
+    types = np.fromiter((atom_order.get(name, -1) for name in atom_names),
+                        dtype=np.int64, count=len(atom_names))
+    is_se = np.fromiter((name.upper() == 'SE' for name in atom_names),
+                        dtype=bool, count=len(atom_names))
+    return types, is_se
+
+
+def _select_atom37_atoms(
+        num_res: int,
+        atom_res_index: np.ndarray,
+        atom_types: np.ndarray,
+        atom_is_se: np.ndarray,
+        res_names: Mapping[int, str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the SEQRES index, atom37 index and row of the atoms kept in atom37.
+
+  The selenium atom of MSE takes the sulphur (SD) column, atoms without an
+  atom37 index are dropped, and where a residue has several atoms of one type,
+  the last one is kept.
+  """
+    is_mse = np.zeros(num_res, dtype=bool)
+    for res_index, res_name in res_names.items():
+        is_mse[res_index] = res_name == 'MSE'
+    atom_types = np.where(
+        (atom_types < 0) & atom_is_se & is_mse[atom_res_index],
+        residue_constants.atom_order['SD'], atom_types)
+    keep = np.flatnonzero(atom_types >= 0)
+    flat_index = (atom_res_index[keep] * residue_constants.atom_type_num +
+                  atom_types[keep])
+    _, last_reversed = np.unique(flat_index[::-1], return_index=True)
+    rows = keep[len(keep) - 1 - last_reversed]
+    return atom_res_index[rows], atom_types[rows], rows
+
+
+def _scatter_atom37(num_res: int,
+                    atom_res_index: np.ndarray,
+                    atom_types: np.ndarray,
+                    atom_is_se: np.ndarray,
+                    atom_coords: np.ndarray,
+                    res_names: Mapping[int, str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Builds atom37 positions and mask from flat per-atom arrays.
+
+  Args:
+    num_res: Number of residues in the SEQRES.
+    atom_res_index: SEQRES index of every atom.
+    atom_types: atom37 index of every atom, -1 for atoms without one.
+    atom_is_se: Whether each atom is a selenium (stored as SD in MSE).
+    atom_coords: float32 array [num_atoms, 3].
+    res_names: Structure residue name by SEQRES index.
+
+  Returns:
+    float64 positions [num_res, 37, 3] and int64 mask [num_res, 37].
+  """
+    res_index, atom_types, rows = _select_atom37_atoms(
+        num_res, atom_res_index, atom_types, atom_is_se, res_names)
+    positions = np.zeros([num_res, residue_constants.atom_type_num, 3],
+                         dtype=np.float32)
+    mask = np.zeros([num_res, residue_constants.atom_type_num], dtype=np.float32)
+    positions[res_index, atom_types] = atom_coords[rows]
+    mask[res_index, atom_types] = 1.0
+
+    # Fix naming errors in arginine residues where NH2 is incorrectly
+    # assigned to be closer to CD than NH1.
+    is_arg = np.zeros(num_res, dtype=bool)
+    for res_index, res_name in res_names.items():
+        is_arg[res_index] = res_name == 'ARG'
+    cd = residue_constants.atom_order['CD']
+    nh1 = residue_constants.atom_order['NH1']
+    nh2 = residue_constants.atom_order['NH2']
+    has_guanidine = is_arg & (mask[:, [cd, nh1, nh2]] > 0).all(axis=1)
+    for i in np.flatnonzero(has_guanidine):
+        pos = positions[i]
+        if np.linalg.norm(pos[nh1] - pos[cd]) > np.linalg.norm(pos[nh2] - pos[cd]):
+            pos[[nh1, nh2]] = pos[[nh2, nh1]]
+    return positions.astype(np.float64), mask.astype(np.int64)
+
+
+def _summarize_atom37(num_res: int,
+                      atom_res_index: np.ndarray,
+                      atom_types: np.ndarray,
+                      atom_is_se: np.ndarray,
+                      atom_coords: np.ndarray,
+                      res_names: Mapping[int, str]
+                      ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns what _scatter_atom37 gives for CA and the atom count of each residue.
+
+  Takes the arguments of _scatter_atom37 and returns float32 CA positions
+  [num_res, 3], uint8 CA mask [num_res] and uint8 number of atoms [num_res],
+  without building the atom37 arrays.
+  """
+    res_index, atom_types, rows = _select_atom37_atoms(
+        num_res, atom_res_index, atom_types, atom_is_se, res_names)
+    is_ca = atom_types == residue_constants.atom_order['CA']
+    ca_positions = np.zeros([num_res, 3], dtype=np.float32)
+    ca_mask = np.zeros(num_res, dtype=np.uint8)
+    ca_positions[res_index[is_ca]] = atom_coords[rows[is_ca]]
+    ca_mask[res_index[is_ca]] = 1
+    num_atoms = np.bincount(res_index, minlength=num_res).astype(np.uint8)
+    return ca_positions, ca_mask, num_atoms
+
+
+def _chain_atom_arrays(
+        mmcif_object: mmcif_parsing.MmcifObject,
+        auth_chain_id: str) -> Tuple[Any, ...]:
+    """Gets the _scatter_atom37 arguments from Biopython Residues or ChainAtoms."""
+    num_res = len(mmcif_object.chain_to_seqres[auth_chain_id])
+    seqres_to_structure = mmcif_object.seqres_to_structure[auth_chain_id]
+    present = []
     for res_index in range(num_res):
-        pos = np.zeros([residue_constants.atom_type_num, 3], dtype=np.float32)
-        mask = np.zeros([residue_constants.atom_type_num], dtype=np.float32)
-        res_at_position = mmcif_object.seqres_to_structure[auth_chain_id][res_index]
+        res_at_position = seqres_to_structure[res_index]
         if not res_at_position.is_missing:
-            res = chain[(res_at_position.hetflag,
-                         res_at_position.position.residue_number,
-                         res_at_position.position.insertion_code)]
+            present.append((res_index, (res_at_position.hetflag,
+                                        res_at_position.position.residue_number,
+                                        res_at_position.position.insertion_code)))
+
+    if mmcif_object.atom_data is not None:
+        chain_atoms = mmcif_object.atom_data.get(auth_chain_id)
+        if chain_atoms is None:
+            raise MultipleChainsError(
+                f'Expected exactly one chain in structure with id {auth_chain_id}.')
+        residues = np.array([chain_atoms.residue_index[residue_id]
+                             for _, residue_id in present], dtype=np.int64)
+        res_names = {res_index: chain_atoms.residue_names[residue]
+                     for (res_index, _), residue in zip(present, residues.tolist())}
+        starts = chain_atoms.atom_starts[residues]
+        counts = chain_atoms.atom_starts[residues + 1] - starts
+        atom_res_index = np.repeat(
+            np.array([res_index for res_index, _ in present], dtype=np.int64),
+            counts)
+        # Row of every atom: its residue's first atom plus its offset within.
+        rows = (np.arange(counts.sum(), dtype=np.int64) +
+                np.repeat(starts - (np.cumsum(counts) - counts), counts))
+        chain_types, chain_is_se = _atom_name_types(chain_atoms.atom_names)
+        atom_types = chain_types[rows]
+        atom_is_se = chain_is_se[rows]
+        atom_coords = chain_atoms.coords[rows]
+    else:
+        relevant_chains = [c for c in mmcif_object.structure.get_chains()
+                           if c.id == auth_chain_id]
+        if len(relevant_chains) != 1:
+            raise MultipleChainsError(
+                f'Expected exactly one chain in structure with id {auth_chain_id}.')
+        chain = relevant_chains[0]
+        res_names = {}
+        atom_res_index = []
+        atom_names = []
+        atom_coords = []
+        for res_index, residue_id in present:
+            res = chain[residue_id]
+            res_names[res_index] = res.get_resname()
             for atom in res.get_atoms():
-                atom_name = atom.get_name()
-                x, y, z = atom.get_coord()
-                if atom_name in residue_constants.atom_order.keys():
-                    pos[residue_constants.atom_order[atom_name]] = [x, y, z]
-                    mask[residue_constants.atom_order[atom_name]] = 1.0
-                elif atom_name.upper() == 'SE' and res.get_resname() == 'MSE':
-                    # Put the coordinates of the selenium atom in the sulphur column.
-                    pos[residue_constants.atom_order['SD']] = [x, y, z]
-                    mask[residue_constants.atom_order['SD']] = 1.0
-
-            # Fix naming errors in arginine residues where NH2 is incorrectly
-            # assigned to be closer to CD than NH1.
-            cd = residue_constants.atom_order['CD']
-            nh1 = residue_constants.atom_order['NH1']
-            nh2 = residue_constants.atom_order['NH2']
-            if (res.get_resname() == 'ARG' and
-                    all(mask[atom_index] for atom_index in (cd, nh1, nh2)) and
-                    (np.linalg.norm(pos[nh1] - pos[cd]) >
-                     np.linalg.norm(pos[nh2] - pos[cd]))):
-                pos[nh1], pos[nh2] = pos[nh2].copy(), pos[nh1].copy()
-                mask[nh1], mask[nh2] = mask[nh2].copy(), mask[nh1].copy()
-
-        all_positions[res_index] = pos
-        all_positions_mask[res_index] = mask
-    _check_residue_distances(
-        all_positions, all_positions_mask, max_ca_ca_distance)
-    return all_positions, all_positions_mask
+                atom_res_index.append(res_index)
+                atom_names.append(atom.get_name())
+                atom_coords.append(atom.get_coord())
+        atom_res_index = np.array(atom_res_index, dtype=np.int64)
+        atom_types, atom_is_se = _atom_name_types(atom_names)
+        atom_coords = np.array(atom_coords, dtype=np.float32).reshape(-1, 3)
+
+    return num_res, atom_res_index, atom_types, atom_is_se, atom_coords, res_names
+
+
+def _compute_atom_positions(
+        mmcif_object: mmcif_parsing.MmcifObject,
+        auth_chain_id: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Gets atom positions and mask from Biopython Residues or ChainAtoms."""
+    return _scatter_atom37(*_chain_atom_arrays(mmcif_object, auth_chain_id))
+
+
+def _compute_compact_atom_positions(
+        mmcif_object: mmcif_parsing.MmcifObject,
+        auth_chain_id: str) -> Tuple[np.ndarray, np.ndarray]:
+    """_compute_atom_positions as float32 positions and uint8 mask."""
+    positions, mask = _compute_atom_positions(mmcif_object, auth_chain_id)
+    return positions.astype(np.float32), mask.astype(np.uint8)
+
+
+def _compute_atom_summary(
+        mmcif_object: mmcif_parsing.MmcifObject,
+        auth_chain_id: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Gets the CA positions, CA mask and number of atoms of every residue."""
+    return _summarize_atom37(*_chain_atom_arrays(mmcif_object, auth_chain_id))
 
 
 def _extract_template_features(
@@ -491,7 +741,11 @@ def _extract_template_features(
         template_sequence: str,
         query_sequence: str,
         template_chain_id: str,
-        kalign_binary_path: str) -> Tuple[Dict[str, Any], Optional[str]]:
+        kalign_binary_path: str,
+        identity_only: bool = False,
+        realign_backend: str = 'kalign',
+        realign_cache: Optional[realign_cache_lib.RealignCache] = None
+) -> Tuple[Dict[str, Any], Optional[str]]:
     """Parses atom positions in the target structure and aligns with the query.
 
   Atoms for each residue in the template structure are indexed to coincide
@@ -511,6 +765,13 @@ def _extract_template_features(
       should be used.
     kalign_binary_path: The path to a kalign executable used for template
         realignment.
+    identity_only: If True, only return template_sequence and
+      template_domain_names. Atom positions are not extracted, but the atom
+      data checks below still run on the CA positions and per residue atom
+      counts, so the same hits are accepted as without identity_only.
+    realign_backend: Aligner used for template realignment, see
+      _realign_pdb_template_to_query.
+    realign_cache: Optional memo of template realignments.
 
   Returns:
     A tuple with:
@@ -552,7 +813,9 @@ def _extract_template_features(
                 template_chain_id=template_chain_id,
                 mmcif_object=mmcif_object,
                 old_mapping=mapping,
-                kalign_binary_path=kalign_binary_path)
+                kalign_binary_path=kalign_binary_path,
+                realign_backend=realign_backend,
+                realign_cache=realign_cache)
             # logging.warning("end_realign")
             # logging.warning(f"{seqres},{mapping}")
         except Exception as e:
@@ -586,6 +849,33 @@ def _extract_template_features(
         # # No mapping offset, the query is aligned to the actual sequence.
         # mapping_offset = 0
 
+    if identity_only:
+        try:
+            num_atoms = _get_atom_counts(
+                mmcif_object, chain_id, max_ca_ca_distance=150.0)
+        except (CaDistanceError, KeyError) as ex:
+            raise NoAtomDataInTemplateError(
+                'Could not get atom data (%s_%s): %s' % (pdb_id, chain_id, str(ex))
+            ) from ex
+
+        output_templates_sequence = ['-'] * len(query_sequence)
+        template_indices = []
+        for k, v in mapping.items():
+            template_indices.append(v + mapping_offset)
+            output_templates_sequence[k] = template_sequence[v]
+        # Same all-zeros mask check as below, on the atom counts.
+        if num_atoms[np.array(template_indices, dtype=np.int64)].sum() < 5:
+            raise TemplateAtomMaskAllZerosError(
+                'Template all atom mask was all zeros: %s_%s. Residue range: %d-%d' %
+                (pdb_id, chain_id, min(mapping.values()) + mapping_offset,
+                 max(mapping.values()) + mapping_offset))
+        return (
+            {
+                'template_sequence': ''.join(output_templates_sequence).encode(),
+                'template_domain_names': f'{pdb_id.lower()}_{chain_id}'.encode(),
+            },
+            warning)
+
     try:
         # Essentially set to infinity - we don't want to reject templates unless
         # they're really really bad.
@@ -676,24 +966,23 @@ def _build_query_to_hit_index_mapping(
     hhsearch_query_offset = original_query_sequence.find(hhsearch_query_sequence)
 
     # Index of -1 used for gap characters. Subtract the min index ignoring gaps.
-    min_idx = min(x for x in indices_hit if x > -1)
-    fixed_indices_hit = [
-        x - min_idx if x > -1 else -1 for x in indices_hit
-    ]
-
-    min_idx = min(x for x in indices_query if x > -1)
-    fixed_indices_query = [x - min_idx if x > -1 else -1 for x in indices_query]
+    indices_hit = np.asarray(indices_hit, dtype=np.int32)
+    indices_query = np.asarray(indices_query, dtype=np.int32)
+    num_columns = min(len(indices_hit), len(indices_query))
+    hit_present = indices_hit > -1
+    query_present = indices_query > -1
+    fixed_indices_hit = indices_hit - indices_hit[hit_present].min()
+    fixed_indices_query = indices_query - indices_query[query_present].min()
 
     # Zip the corrected indices, ignore case where both seqs have gap characters.
-    mapping = {}
-    for q_i, q_t in zip(fixed_indices_query, fixed_indices_hit):
-        if q_t != -1 and q_i != -1:
-            if (q_t >= len(hit_sequence) or
-                    q_i + hhsearch_query_offset >= len(original_query_sequence)):
-                continue
-            mapping[q_i + hhsearch_query_offset] = q_t
-
-    return mapping
+    aligned = hit_present[:num_columns] & query_present[:num_columns]
+    mapped_hit = fixed_indices_hit[:num_columns][aligned]
+    mapped_query = (fixed_indices_query[:num_columns][aligned] +
+                    hhsearch_query_offset)
+    in_range = ((mapped_hit < len(hit_sequence)) &
+                (mapped_query < len(original_query_sequence)))
+    return dict(zip(mapped_query[in_range].tolist(),
+                    mapped_hit[in_range].tolist()))
 
 
 @dataclasses.dataclass(frozen=True)
@@ -710,6 +999,137 @@ def _read_file(path):
     return file_data
 
 
+def _compact_parsing_result(
+        parsing_result: mmcif_parsing.ParsingResult,
+        with_atom_positions: bool,
+        chain_id: Optional[str] = None) -> mmcif_parsing.ParsingResult:
+    """Drops the Biopython structure and raw mmCIF dict from a parsing result.
+
+  Args:
+    parsing_result: Result of mmcif_parsing.parse.
+    with_atom_positions: Whether to keep the atom37 arrays of the chains, which
+      replace the structure in _get_atom_positions. Otherwise only the CA
+      positions and atom counts checked by _get_atom_counts are kept.
+    chain_id: The chain to precompute. The other chains are computed on first
+      use from the atom_data kept for them (see _get_chain_value). Without
+      atom_data ('biopython' backend) all chains are precomputed.
+
+  Returns:
+    A picklable ParsingResult with errors converted to strings.
+  """
+    errors = {k: str(v) for k, v in parsing_result.errors.items()}
+    mmcif_object = parsing_result.mmcif_object
+    if mmcif_object is None:
+        return mmcif_parsing.ParsingResult(mmcif_object=None, errors=errors)
+
+    compute = (_compute_compact_atom_positions if with_atom_positions
+               else _compute_atom_summary)
+    if mmcif_object.atom_data is None:
+        chain_ids = list(mmcif_object.chain_to_seqres)
+        atom_data = None
+    else:
+        chain_ids = [chain_id] if chain_id in mmcif_object.chain_to_seqres else []
+        atom_data = {c: chain_atoms for c, chain_atoms in mmcif_object.atom_data.items()
+                     if c not in chain_ids}
+    atoms = {}
+    for c in chain_ids:
+        try:
+            atoms[c] = compute(mmcif_object, c)
+        except (Error, KeyError) as e:
+            atoms[c] = e
+
+    return mmcif_parsing.ParsingResult(
+        mmcif_object=mmcif_parsing.MmcifObject(
+            file_id=mmcif_object.file_id,
+            header=mmcif_object.header,
+            structure=None,
+            chain_to_seqres=mmcif_object.chain_to_seqres,
+            seqres_to_structure=mmcif_object.seqres_to_structure,
+            raw_string=None,
+            atom_positions=atoms if with_atom_positions else None,
+            atom_data=atom_data,
+            atom_summaries=None if with_atom_positions else atoms),
+        errors=errors)
+
+
+def _parse_mmcif(
+        cif_path: str,
+        file_id: str,
+        mmcif_cache: Optional[mmcif_cache_lib.MmcifCache] = None,
+        identity_only: bool = False,
+        parser_backend: str = 'biopython',
+        chain_id: Optional[str] = None) -> mmcif_parsing.ParsingResult:
+    """Parses the mmCIF at cif_path, through mmcif_cache when one is given.
+
+  chain_id is the chain precomputed in the cached entry, see
+  _compact_parsing_result.
+  """
+    if mmcif_cache is None:
+        return mmcif_parsing.parse(file_id=file_id, mmcif_string=_read_file(cif_path),
+                                   backend=parser_backend)
+
+    def build(path):
+        parsing_result = mmcif_parsing.parse(
+            file_id=file_id, mmcif_string=_read_file(path), backend=parser_backend)
+        return _compact_parsing_result(
+            parsing_result, with_atom_positions=not identity_only,
+            chain_id=chain_id)
+
+    variant = 'identity' if identity_only else 'full'
+    return mmcif_cache.get(cif_path, build, variant=f'{variant}:{parser_backend}')
+
+
+def check_mmcif_parser_backends(cif_path: str) -> Sequence[str]:
+    """Parses cif_path with every mmcif_parsing backend and compares the results.
+
+  Compares parse success, header, chain_to_seqres, seqres_to_structure and the
+  atom37 positions, masks or errors of every chain against the 'biopython'
+  backend.
+
+  Returns:
+    Descriptions of the differences, e.g. 'tokenizer: atom positions of A'
+    (empty if all backends agree).
+  """
+    mmcif_string = _read_file(cif_path)
+    file_id = os.path.splitext(os.path.basename(cif_path))[0]
+
+    def summarize(backend):
+        mmcif_object = mmcif_parsing.parse(
+            file_id=file_id, mmcif_string=mmcif_string,
+            backend=backend).mmcif_object
+        if mmcif_object is None:
+            return None
+        atoms = {}
+        for chain_id in mmcif_object.chain_to_seqres:
+            try:
+                atoms[chain_id] = _compute_atom_positions(mmcif_object, chain_id)
+            except (Error, KeyError) as e:
+                atoms[chain_id] = type(e).__name__
+        return mmcif_object, atoms
+
+    expected = summarize('biopython')
+    differences = []
+    for backend in mmcif_parsing.BACKENDS[1:]:
+        actual = summarize(backend)
+        if expected is None or actual is None:
+            if (expected is None) != (actual is None):
+                differences.append(f'{backend}: parse result')
+            continue
+        for field in ('header', 'chain_to_seqres', 'seqres_to_structure'):
+            if getattr(expected[0], field) != getattr(actual[0], field):
+                differences.append(f'{backend}: {field}')
+        for chain_id, expected_atoms in expected[1].items():
+            actual_atoms = actual[1].get(chain_id)
+            if isinstance(expected_atoms, str) or isinstance(actual_atoms, str):
+                same = expected_atoms == actual_atoms
+            else:
+                same = all(np.array_equal(e, a)
+                           for e, a in zip(expected_atoms, actual_atoms))
+            if not same:
+                differences.append(f'{backend}: atom positions of {chain_id}')
+    return differences
+
+
 def _process_single_hit(
         query_sequence: str,
         hit: parsers.TemplateHit,
@@ -718,7 +1138,13 @@ def _process_single_hit(
         release_dates: Mapping[str, datetime.datetime],
         obsolete_pdbs: Mapping[str, Optional[str]],
         kalign_binary_path: str,
-        strict_error_check: bool = False) -> SingleHitResult:
+        strict_error_check: bool = False,
+        identity_only: bool = False,
+        mmcif_cache: Optional[mmcif_cache_lib.MmcifCache] = None,
+        mmcif_parser_backend: str = 'biopython',
+        realign_backend: str = 'kalign',
+        realign_cache: Optional[realign_cache_lib.RealignCache] = None
+) -> SingleHitResult:
     """Tries to extract template features from a single HHSearch hit."""
     # Fail hard if we can't get the PDB ID and chain name from the hit.
     hit_pdb_code, hit_chain_id = _get_pdb_id_and_chain(hit)
@@ -761,10 +1187,10 @@ def _process_single_hit(
     logging.debug('Reading PDB entry from %s. Query: %s, template: %s', cif_path,
                   query_sequence, template_sequence)
     # Fail if we can't find the mmCIF file.
-    cif_string = _read_file(cif_path)
-
-    parsing_result = mmcif_parsing.parse(
-        file_id=hit_pdb_code, mmcif_string=cif_string)
+    parsing_result = _parse_mmcif(cif_path, hit_pdb_code, mmcif_cache=mmcif_cache,
+                                  identity_only=identity_only,
+                                  parser_backend=mmcif_parser_backend,
+                                  chain_id=hit_chain_id)
 
     if parsing_result.mmcif_object is not None:
         hit_release_date = datetime.datetime.strptime(
@@ -786,7 +1212,10 @@ def _process_single_hit(
             template_sequence=template_sequence,
             query_sequence=query_sequence,
             template_chain_id=hit_chain_id,
-            kalign_binary_path=kalign_binary_path)
+            kalign_binary_path=kalign_binary_path,
+            identity_only=identity_only,
+            realign_backend=realign_backend,
+            realign_cache=realign_cache)
         if hit.sum_probs is None:
             features['template_sum_probs'] = [0]
         else:
@@ -837,7 +1266,17 @@ class TemplateHitFeaturizer(abc.ABC):
             kalign_binary_path: str,
             release_dates_path: Optional[str],
             obsolete_pdbs_path: Optional[str],
-            strict_error_check: bool = False):
+            strict_error_check: bool = False,
+            identity_only: bool = False,
+            mmcif_cache_dir: Optional[str] = None,
+            mmcif_cache_max_bytes: int = 0,
+            mmcif_cache_max_disk_bytes: Optional[int] = None,
+            mmcif_parser_backend: str = 'biopython',
+            realign_backend: str = 'kalign',
+            realign_cache_dir: Optional[str] = None,
+            realign_cache_max_bytes: int = 0,
+            num_workers: int = 1,
+            max_lookahead: Optional[int] = None):
         """Initializes the Template Search.
 
     Args:
@@ -852,14 +1291,41 @@ class TemplateHitFeaturizer(abc.ABC):
         realignment.
       release_dates_path: An optional path to a file with a mapping from PDB IDs
         to their release dates. Thanks to this we don't have to redundantly
-        parse mmCIF files to get that information.
+        parse mmCIF files to get that information. Either a "pdb_id: date" .txt
+        file or an index built by release_dates.build_index. If None, the
+        index at release_dates.default_index_path(mmcif_dir) is used when it
+        exists.
       obsolete_pdbs_path: An optional path to a file containing a mapping from
-        obsolete PDB IDs to the PDB IDs of their replacements.
+        obsolete PDB IDs to the PDB IDs of their replacements. If None, the
+        obsolete entries of the default release date index are used.
       strict_error_check: If True, then the following will be treated as errors:
         * If any template date is after the max_template_date.
         * If any template has identical PDB ID to the query.
         * If any template is a duplicate of the query.
         * Any feature computation errors.
+      identity_only: If True, only the identities and aligned sequences of the
+        accepted hits are computed (TEMPLATE_IDENTITY_FEATURES); atom positions
+        and masks are not extracted, but the same hits are accepted. Supported by HmmsearchHitFeaturizer.
+      mmcif_cache_dir: Optional directory of parsed mmCIF entries persisted
+        across runs (see mmcif_cache).
+      mmcif_cache_max_bytes: Size bound of the in-memory cache of parsed
+        mmCIF entries. With neither this nor mmcif_cache_dir set, entries are
+        parsed directly as before.
+      mmcif_cache_max_disk_bytes: Size bound of mmcif_cache_dir, or None for no
+        bound.
+      mmcif_parser_backend: mmcif_parsing.parse backend, 'biopython' or the
+        faster 'tokenizer'.
+      realign_backend: Aligner for hits whose sequence differs from the mmCIF
+        SEQRES, 'kalign' or the in-process 'pairwise' (with Kalign fallback).
+      realign_cache_dir: Optional directory of template realignments persisted
+        across runs (see realign_cache).
+      realign_cache_max_bytes: Size bound of realign_cache_dir.
+      num_workers: Number of threads featurizing hits ahead of the one being
+        committed. Results are still committed in rank order, so the accepted
+        templates are the same as with 1 (serial).
+      max_lookahead: Maximum number of hits submitted ahead of the one being
+        committed, further limited to the number of templates still needed.
+        Defaults to 2 * num_workers.
     """
         self._mmcif_dir = mmcif_dir
         if not glob.glob(os.path.join(self._mmcif_dir, '*.cif')):
@@ -875,18 +1341,70 @@ class TemplateHitFeaturizer(abc.ABC):
         self._max_hits = max_hits
         self._kalign_binary_path = kalign_binary_path
         self._strict_error_check = strict_error_check
-
+        self._identity_only = identity_only
+        if mmcif_parser_backend not in mmcif_parsing.BACKENDS:
+            raise ValueError(f'Unknown mmCIF parser backend {mmcif_parser_backend}.')
+        self._mmcif_parser_backend = mmcif_parser_backend
+        if realign_backend not in REALIGN_BACKENDS:
+            raise ValueError(f'Unknown realignment backend {realign_backend}.')
+        self._realign_backend = realign_backend
+        self._realign_cache = realign_cache_lib.create_cache(
+            cache_dir=realign_cache_dir, max_size_bytes=realign_cache_max_bytes)
+        self._num_workers = max(1, num_workers)
+        self._max_lookahead = max(1, max_lookahead or 2 * self._num_workers)
+        self._mmcif_cache = mmcif_cache_lib.create_cache(
+            cache_dir=mmcif_cache_dir, max_memory_bytes=mmcif_cache_max_bytes,
+            max_disk_bytes=mmcif_cache_max_disk_bytes)
+
+        index_obsolete_pdbs = {}
+        default_index_path = release_dates_index.default_index_path(mmcif_dir)
+        self._release_dates_source = None
         if release_dates_path:
             logging.info('Using precomputed release dates %s.', release_dates_path)
             self._release_dates = _parse_release_dates(release_dates_path)
+            self._release_dates_source = release_dates_path
+        elif os.path.exists(default_index_path):
+            logging.info('Using release date index %s.', default_index_path)
+            self._release_dates, index_obsolete_pdbs = release_dates_index.load_index(
+                default_index_path)
+            self._release_dates_source = default_index_path
         else:
             self._release_dates = {}
 
         if obsolete_pdbs_path:
             logging.info('Using precomputed obsolete pdbs %s.', obsolete_pdbs_path)
             self._obsolete_pdbs = _parse_obsolete(obsolete_pdbs_path)
+            self._obsolete_pdbs_source = obsolete_pdbs_path
         else:
-            self._obsolete_pdbs = {}
+            self._obsolete_pdbs = index_obsolete_pdbs
+            # Obsolete entries of the default index, if any.
+            self._obsolete_pdbs_source = (self._release_dates_source
+                                          if index_obsolete_pdbs else None)
+
+    def cache_fingerprint(self) -> str:
+        """Returns a string that changes whenever the accepted templates may change.
+
+    Covers the featurizer settings and the versions of the mmCIF mirror, the
+    release date source, the obsolete PDB list and the Kalign binary. Used to
+    key cached template search results (search_cache).
+    """
+        def version(path):
+            if not path or not os.path.exists(path):
+                return 'none'
+            return search_cache.database_version(path)
+
+        return '|'.join((
+            self._max_template_date.strftime('%Y-%m-%d'),
+            str(self._max_hits),
+            str(self._strict_error_check),
+            str(self._identity_only),
+            self._mmcif_parser_backend,
+            self._realign_backend,
+            version(self._mmcif_dir),
+            version(self._release_dates_source),
+            version(self._obsolete_pdbs_source),
+            version(self._kalign_binary_path),
+        ))
 
     @abc.abstractmethod
     def get_templates(
@@ -895,6 +1413,62 @@ class TemplateHitFeaturizer(abc.ABC):
             hits: Sequence[parsers.TemplateHit]) -> TemplateSearchResult:
         """Computes the templates for given query sequence."""
 
+    def _featurize_hit(self, query_sequence: str,
+                       hit: parsers.TemplateHit) -> SingleHitResult:
+        return _process_single_hit(
+            query_sequence=query_sequence,
+            hit=hit,
+            mmcif_dir=self._mmcif_dir,
+            max_template_date=self._max_template_date,
+            release_dates=self._release_dates,
+            obsolete_pdbs=self._obsolete_pdbs,
+            strict_error_check=self._strict_error_check,
+            kalign_binary_path=self._kalign_binary_path,
+            identity_only=self._identity_only,
+            mmcif_cache=self._mmcif_cache,
+            mmcif_parser_backend=self._mmcif_parser_backend,
+            realign_backend=self._realign_backend,
+            realign_cache=self._realign_cache)
+
+    def _featurize_hits_in_order(self, query_sequence: str,
+                                 hits: Sequence[parsers.TemplateHit],
+                                 num_wanted: Callable[[], int]):
+        """Yields (hit, SingleHitResult) in the order of hits.
+
+    With num_workers > 1, hits are featurized ahead in a thread pool, at most
+    max_lookahead of them and no more than num_wanted(), the number of
+    templates the caller still needs, so little work is spent on hits past the
+    quota. Closing the generator (e.g. breaking out of the loop once enough
+    templates are accepted) cancels the hits not started yet and waits for the
+    running ones.
+    """
+        if self._num_workers <= 1:
+            for hit in hits:
+                yield hit, self._featurize_hit(query_sequence, hit)
+            return
+
+        pool = futures.ThreadPoolExecutor(max_workers=self._num_workers)
+        pending = collections.deque()
+        remaining_hits = iter(hits)
+
+        def submit_ahead():
+            while len(pending) < min(self._max_lookahead, num_wanted()):
+                hit = next(remaining_hits, None)
+                if hit is None:
+                    return
+                pending.append(
+                    (hit, pool.submit(self._featurize_hit, query_sequence, hit)))
+
+        try:
+            submit_ahead()
+            while pending:
+                hit, future = pending.popleft()
+                result = future.result()
+                yield hit, result
+                submit_ahead()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
 
 class HhsearchHitFeaturizer(TemplateHitFeaturizer):
     """A class for turning a3m hits from hhsearch to template features."""
@@ -933,7 +1507,11 @@ class HhsearchHitFeaturizer(TemplateHitFeaturizer):
                 release_dates=self._release_dates,
                 obsolete_pdbs=self._obsolete_pdbs,
                 strict_error_check=self._strict_error_check,
-                kalign_binary_path=self._kalign_binary_path)
+                kalign_binary_path=self._kalign_binary_path,
+                mmcif_cache=self._mmcif_cache,
+                mmcif_parser_backend=self._mmcif_parser_backend,
+                realign_backend=self._realign_backend,
+                realign_cache=self._realign_cache)
 
             if result.error:
                 errors.append(result.error)
@@ -992,8 +1570,10 @@ class HmmsearchHitFeaturizer(TemplateHitFeaturizer):
         """Computes the templates for given query sequence (more details above)."""
         logging.info('Searching for template for: %s', query_sequence)
 
+        feature_types = (TEMPLATE_IDENTITY_FEATURES if self._identity_only
+                         else TEMPLATE_FEATURES)
         template_features = {}
-        for template_feature_name in TEMPLATE_FEATURES:
+        for template_feature_name in feature_types:
             template_features[template_feature_name] = []
 
         already_seen = set()
@@ -1006,21 +1586,12 @@ class HmmsearchHitFeaturizer(TemplateHitFeaturizer):
         else:
             sorted_hits = sorted(hits, key=lambda x: x.sum_probs, reverse=True)
 
-        for hit in sorted_hits:
-            # We got all the templates we wanted, stop processing hits.
-            if len(already_seen) >= self._max_hits:
-                break
-
-            result = _process_single_hit(
-                query_sequence=query_sequence,
-                hit=hit,
-                mmcif_dir=self._mmcif_dir,
-                max_template_date=self._max_template_date,
-                release_dates=self._release_dates,
-                obsolete_pdbs=self._obsolete_pdbs,
-                strict_error_check=self._strict_error_check,
-                kalign_binary_path=self._kalign_binary_path)
-
+        if self._max_hits <= 0:
+            sorted_hits = []
+        hit_results = self._featurize_hits_in_order(
+            query_sequence, sorted_hits,
+            num_wanted=lambda: self._max_hits - len(already_seen))
+        for hit, result in hit_results:
             if result.error:
                 errors.append(result.error)
 
@@ -1042,10 +1613,21 @@ class HmmsearchHitFeaturizer(TemplateHitFeaturizer):
                     template_features[k].append(result.features[k])
                 hits_features += [result.features]
 
+            # We got all the templates we wanted, stop processing hits.
+            if len(already_seen) >= self._max_hits:
+                break
+        hit_results.close()
+
         if already_seen:
             for name in template_features:
                 template_features[name] = np.stack(
-                    template_features[name], axis=0).astype(TEMPLATE_FEATURES[name])
+                    template_features[name], axis=0).astype(feature_types[name])
+        elif self._identity_only:
+            template_features = {
+                'template_domain_names': np.array([''.encode()], dtype=object),
+                'template_sequence': np.array([''.encode()], dtype=object),
+                'template_sum_probs': np.array([0], dtype=np.float32)
+            }
         else:
             num_res = len(query_sequence)
             # Construct a default template with all zeros.
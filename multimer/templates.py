@@ -7,8 +7,9 @@ import csv
 import ast
 from utils.utils import makedir_if_not_exists
 import pandas as pd
-from common.config import pdb_mmcif_database_dir
+from common.config import pdb_mmcif_database_dir,template_quota
 from utils.extract_cif_chains import filter_cif_by_chain
+from utils.cif_residues import get_residue_indices, filter_to_present_residues
 
 def _copy(source_dir_file,destination_dir):
     shutil.copy(source_dir_file,destination_dir)
@@ -92,14 +93,61 @@ def prepare_template_csv_for_af3(input_file,output_csv):
         return 0
 
 
-def return_template_info(af3_template_csv, template_base_dir, template_cif_path):
+def _get_cif_name(row):
+    # Index CSVs name the template's file in the target template store.
+    return row.get('store_cif', f"{row['template_name']}.cif")
+
+
+def _template_info_from_row(row, template_base_dir, template_cif_path):
+    """Returns the cleaned template info dict of one CSV row, or None if the template is unusable."""
+    template_name = row['template_name']
+    try:
+        query_indices = ast.literal_eval(row['query_indices'])
+        template_indices = ast.literal_eval(row['template_indices'])
+    except Exception as e:
+        print(f"Warning: Skipping {template_name} due to parse error: {e}")
+        return None
+
+    cif_name = _get_cif_name(row)
+    if not cif_name:
+        return None
+    cif_file = os.path.join(template_cif_path, cif_name)
+    if not os.path.exists(cif_file):
+        # print(f"Warning: Skipping {template_name}, CIF not found at {cif_file}")
+        return None
+
+    try:
+        residue_indices = get_residue_indices(cif_file)
+        if residue_indices.size == 0:
+            return None
+
+        # Filter out missing template_indices (adjusted +1)
+        cleaned_query_indices, cleaned_template_indices = filter_to_present_residues(
+            query_indices, template_indices, residue_indices)
+
+        if not cleaned_template_indices:
+            return None
+
+        return {
+            "mmcifPath": f"{template_base_dir}/{cif_name}",
+            "queryIndices": cleaned_query_indices,
+            "templateIndices": cleaned_template_indices
+        }
+
+    except Exception as e:
+        print(f"Error: Skipping {template_name}, failed reading CIF: {e}")
+        return None
+
+
+def return_template_info(af3_template_csv, template_base_dir, template_cif_path, max_templates=template_quota):
     """
     Returns cleaned template info for AlphaFold3. Removes missing template-residue mappings.
 
     Args:
         af3_template_csv (str): Path to CSV with template_name, query_indices, template_indices
-        template_cif_path (str): Directory with .cif files
+        template_cif_path (str): Directory with .cif files (the template store for index CSVs)
         template_base_dir (str): Path prefix to be added to mmcifPath
+        max_templates (int): Number of templates to return
 
     Returns:
         List[Dict]: List of cleaned template info dicts
@@ -109,58 +157,80 @@ def return_template_info(af3_template_csv, template_base_dir, template_cif_path)
     with open(af3_template_csv, 'r') as csvfile:
         reader = csv.DictReader(csvfile)
         for row in reader:
-            template_name = row['template_name']
-            try:
-                query_indices = ast.literal_eval(row['query_indices'])
-                template_indices = ast.literal_eval(row['template_indices'])
-            except Exception as e:
-                print(f"Warning: Skipping {template_name} due to parse error: {e}")
-                continue
+            if len(template_info_list) >= max_templates:
+                break
+            template_info = _template_info_from_row(row, template_base_dir, template_cif_path)
+            if template_info is not None:
+                template_info_list.append(template_info)
 
-            cif_file = os.path.join(template_cif_path, f"{template_name}.cif")
-            if not os.path.exists(cif_file):
-                # print(f"Warning: Skipping {template_name}, CIF not found at {cif_file}")
+    return template_info_list
+
+
+def missing_templates(af3_template_csv, template_cif_path, max_templates=template_quota):
+    """
+    Returns the missing CIFs that materialize_templates would create first, in rank order.
+
+    Every missing CIF is assumed to become usable, so these can be created in one batch
+    before materialize_templates tops up the quota for those that do not.
+
+    Args:
+        af3_template_csv (str): Path to CSV with template_name, query_indices, template_indices
+        template_cif_path (str): Directory the CIFs are created in
+        max_templates (int): Number of usable templates to stop at
+
+    Returns:
+        List[str]: Paths of the missing CIFs
+    """
+    missing = []
+    num_usable = 0
+
+    with open(af3_template_csv, 'r') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            if num_usable >= max_templates:
+                break
+            cif_name = _get_cif_name(row)
+            if not cif_name:
                 continue
+            cif_file = os.path.join(template_cif_path, cif_name)
+            if not os.path.exists(cif_file):
+                missing.append(cif_file)
+                num_usable += 1
+            elif _template_info_from_row(row, "", template_cif_path) is not None:
+                num_usable += 1
 
-            try:
-                residue_indices = set()
-                atom_lines_found = False
-
-                with open(cif_file, 'r') as cif:
-                    for line in cif:
-                        if line.startswith("ATOM"):
-                            atom_lines_found = True
-                            tokens = line.strip().split()
-                            try:
-                                residue_index = int(tokens[8])  # column with residue number
-                                residue_indices.add(residue_index)
-                            except (IndexError, ValueError):
-                                continue
-
-                if not atom_lines_found:
-                    continue
-
-                # Filter out missing template_indices (adjusted +1)
-                adjusted_template_indices = [idx + 1 for idx in template_indices]
-                cleaned_query_indices = []
-                cleaned_template_indices = []
-
-                for qi, ti, ti_adj in zip(query_indices, template_indices, adjusted_template_indices):
-                    if ti_adj in residue_indices:
-                        cleaned_query_indices.append(qi)
-                        cleaned_template_indices.append(ti)
-
-                if not cleaned_template_indices:
-                    continue
-
-                template_info = {
-                    "mmcifPath": f"{template_base_dir}/{template_name}.cif",
-                    "queryIndices": cleaned_query_indices,
-                    "templateIndices": cleaned_template_indices
-                }
-                template_info_list.append(template_info)
+    return missing
+
+
+def materialize_templates(af3_template_csv, template_cif_path, materialize, max_templates=template_quota):
+    """
+    Creates the CIFs of af3_template_csv in rank order until max_templates of them are usable.
+
+    Lower ranked templates are never created, as return_template_info would not use them.
 
-            except Exception as e:
-                print(f"Error: Skipping {template_name}, failed reading CIF: {e}")
+    Args:
+        af3_template_csv (str): Path to CSV with template_name, query_indices, template_indices
+        template_cif_path (str): Directory the CIFs are created in
+        materialize (callable): materialize(cif_name, cif_file) creates one missing CIF
+        max_templates (int): Number of usable templates to stop at
+
+    Returns:
+        int: Number of usable templates
+    """
+    num_usable = 0
+
+    with open(af3_template_csv, 'r') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            if num_usable >= max_templates:
+                break
+            cif_name = _get_cif_name(row)
+            if not cif_name:
+                continue
+            cif_file = os.path.join(template_cif_path, cif_name)
+            if not os.path.exists(cif_file):
+                materialize(cif_name, cif_file)
+            if _template_info_from_row(row, "", template_cif_path) is not None:
+                num_usable += 1
 
-    return template_info_list[:4]
\ No newline at end of file
+    return num_usable
@@ -0,0 +1,161 @@
+import gzip
+import os
+import random
+
+import numpy as np
+import pytest
+
+from template_search import parsers
+from template_search import templates
+from template_search.parse_stockholm_template import parse_sto_with_indices
+from utils import alignment_indices
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def _reference_paired_indices(query_seq, template_seq, query_start, template_start):
+    """The loop of the HHR and template CSV parsers before the shared kernel."""
+    query_indices = []
+    template_indices = []
+    query_pos = query_start
+    template_pos = template_start
+    for q_char, t_char in zip(query_seq, template_seq):
+        if q_char != '-' and t_char != '-':
+            query_indices.append(query_pos)
+            template_indices.append(template_pos)
+            template_pos += 1
+            query_pos += 1
+    return query_indices, template_indices
+
+
+def _reference_sto_indices(sto_path, one_based_query):
+    """parse_sto_with_indices before the shared kernel."""
+    results = {}
+    with open(sto_path) as f:
+        for line in f:
+            line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split()
+            if len(parts) < 2 or '/' not in parts[0]:
+                continue
+            pdb_id, range_str = parts[0].split('/')
+            t_start, t_end = (int(x) - 1 for x in range_str.split('-'))
+            entry = results.setdefault(f'{pdb_id}/{t_start}-{t_end}', {
+                'pdb_id': pdb_id, 'template_range': (t_start, t_end),
+                'queryIndices': [], 'templateIndices': [], 'template_sequence': [],
+                'template_pos': t_start, 'query_pos': 0})
+            for c in parts[1]:
+                if c == '.' or c.islower():
+                    continue
+                if c != '-':
+                    entry['queryIndices'].append(entry['query_pos'] + int(one_based_query))
+                    entry['templateIndices'].append(entry['template_pos'])
+                    entry['template_sequence'].append(c)
+                    entry['template_pos'] += 1
+                entry['query_pos'] += 1
+    return [(entry['pdb_id'], entry['template_range'], entry['queryIndices'],
+             entry['templateIndices'], ''.join(entry['template_sequence']))
+            for entry in results.values()]
+
+
+def _reference_mapping(hit_query_sequence, hit_sequence, indices_hit, indices_query,
+                       original_query_sequence):
+    """_build_query_to_hit_index_mapping before the shared kernel."""
+    if not hit_query_sequence:
+        return {}
+    hhsearch_query_sequence = hit_query_sequence.replace('-', '')
+    hit_sequence = hit_sequence.replace('-', '')
+    hhsearch_query_offset = original_query_sequence.find(hhsearch_query_sequence)
+    min_idx = min(x for x in indices_hit if x > -1)
+    fixed_indices_hit = [x - min_idx if x > -1 else -1 for x in indices_hit]
+    min_idx = min(x for x in indices_query if x > -1)
+    fixed_indices_query = [x - min_idx if x > -1 else -1 for x in indices_query]
+    mapping = {}
+    for q_i, q_t in zip(fixed_indices_query, fixed_indices_hit):
+        if q_t != -1 and q_i != -1:
+            if (q_t >= len(hit_sequence) or
+                    q_i + hhsearch_query_offset >= len(original_query_sequence)):
+                continue
+            mapping[q_i + hhsearch_query_offset] = q_t
+    return mapping
+
+
+def _random_aligned(rng, length, alphabet='ACDEFGHIKLMNPQRSTVWY-'):
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_paired_aligned_indices_matches_reference(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        query_seq = _random_aligned(rng, rng.randrange(0, 80))
+        template_seq = _random_aligned(rng, rng.randrange(0, 80))
+        query_start, template_start = rng.randrange(0, 500), rng.randrange(0, 500)
+        query_indices, template_indices = alignment_indices.paired_aligned_indices(
+            query_seq, template_seq, query_start, template_start)
+        assert query_indices.dtype == template_indices.dtype == np.int32
+        assert (query_indices.tolist(), template_indices.tolist()) == _reference_paired_indices(
+            query_seq, template_seq, query_start, template_start)
+
+
+def _as_lists(results):
+    return [(r['pdb_id'], r['template_range'], r['queryIndices'].tolist(),
+             r['templateIndices'].tolist(), r['template_sequence']) for r in results]
+
+
+@pytest.fixture
+def hmmsearch_sto(tmp_path):
+    with gzip.open(os.path.join(DATA_DIR, 'hmmpgmd', 'hmmsearch.sto.gz'), 'rt') as f:
+        sto = f.read()
+    path = tmp_path / 'hits.sto'
+    path.write_text(sto)
+    return path
+
+
+@pytest.mark.parametrize('one_based_query', [False, True])
+def test_parse_sto_with_indices_matches_reference(hmmsearch_sto, one_based_query):
+    results = parse_sto_with_indices(str(hmmsearch_sto), one_based_query)
+    assert results
+    assert _as_lists(results) == _reference_sto_indices(str(hmmsearch_sto), one_based_query)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_parse_sto_with_indices_matches_reference_on_random_blocks(tmp_path, seed):
+    rng = random.Random(seed)
+    lines = ['# STOCKHOLM 1.0', '']
+    names = [f'{rng.randrange(1000, 9999)}_{rng.choice("ABC")}/{start}-{start + 99}'
+             for start in rng.sample(range(1, 300), 10)]
+    for _ in range(3):
+        for name in names:
+            lines.append(f'{name} {_random_aligned(rng, 60, "ACDEFacde-.")}')
+        lines.append(f'#=GC RF {"x" * 60}')
+        lines.append('')
+    lines.append('//')
+    path = tmp_path / 'random.sto'
+    path.write_text('\n'.join(lines) + '\n')
+    assert _as_lists(parse_sto_with_indices(str(path))) == _reference_sto_indices(str(path), False)
+
+
+def test_query_to_hit_mapping_matches_reference_on_hits(hmmsearch_sto):
+    a3m = parsers.convert_stockholm_to_a3m(hmmsearch_sto.read_text(), remove_first_row_gaps=False)
+    hits = parsers.parse_hmmsearch_a3m(query_sequence='X', a3m_string=a3m, skip_first=False)
+    query_sequence = max((hit.query.replace('-', '') for hit in hits), key=len)
+    assert hits
+    for hit in hits:
+        args = (hit.query, hit.hit_sequence, hit.indices_hit, hit.indices_query, query_sequence)
+        assert templates._build_query_to_hit_index_mapping(*args) == _reference_mapping(*args)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_query_to_hit_mapping_matches_reference_on_random_indices(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        length = rng.randrange(1, 60)
+        query = _random_aligned(rng, length)
+        hit = _random_aligned(rng, length)
+        indices_query = [rng.randrange(-1, 80) for _ in range(length)] + [rng.randrange(0, 80)]
+        indices_hit = [rng.randrange(-1, 80) for _ in range(length)] + [rng.randrange(0, 80)]
+        original_query = _random_aligned(rng, rng.randrange(1, 70), 'ACDE') + query.replace('-', '')
+        args = (query, hit, indices_hit, indices_query, original_query)
+        assert templates._build_query_to_hit_index_mapping(*args) == _reference_mapping(*args)
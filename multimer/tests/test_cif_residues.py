@@ -0,0 +1,56 @@
+import glob
+import os
+import shutil
+
+import numpy as np
+
+from utils import cif_residues
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def _store_cif(tmp_path):
+    store_dir = tmp_path / 'store'
+    store_dir.mkdir()
+    cif_file = str(store_dir / '1a7g.cif')
+    shutil.copy(os.path.join(DATA_DIR, '1a7g.cif'), cif_file)
+    return store_dir, cif_file
+
+
+def test_sidecars_are_written_to_the_cache_dir(tmp_path):
+    store_dir, cif_file = _store_cif(tmp_path)
+    cache_dir = str(tmp_path / 'cache')
+
+    residues = cif_residues.get_residue_indices(cif_file, cache_dir=cache_dir)
+
+    assert residues.dtype == np.int32 and residues.size
+    np.testing.assert_array_equal(residues, cif_residues._scan_residue_indices(cif_file))
+    assert os.listdir(store_dir) == ['1a7g.cif']
+    (sidecar,) = glob.glob(os.path.join(cache_dir, '*', '*' + cif_residues.SIDECAR_SUFFIX))
+    cif_residues._memo.clear()
+    stat = os.stat(cif_file)
+    with open(sidecar, 'rb') as f:
+        data = f.read()
+    np.testing.assert_array_equal(
+        cif_residues._decode_sidecar(data, stat.st_mtime_ns, stat.st_size), residues)
+
+
+def test_sidecars_follow_changes_of_the_cif(tmp_path):
+    _, cif_file = _store_cif(tmp_path)
+    cache_dir = str(tmp_path / 'cache')
+    cif_residues.get_residue_indices(cif_file, cache_dir=cache_dir)
+    cif_residues._memo.clear()
+
+    with open(cif_file) as f:
+        lines = [line for line in f if not line.startswith('ATOM')]
+    with open(cif_file, 'w') as f:
+        f.writelines(lines)
+
+    assert cif_residues.get_residue_indices(cif_file, cache_dir=cache_dir).size == 0
+
+
+def test_without_a_cache_dir(tmp_path):
+    store_dir, cif_file = _store_cif(tmp_path)
+    cif_residues._memo.clear()
+    assert cif_residues.get_residue_indices(cif_file, cache_dir=None).size
+    assert os.listdir(store_dir) == ['1a7g.cif']
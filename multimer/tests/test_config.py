@@ -0,0 +1,36 @@
+import importlib
+import os
+
+import pytest
+
+from common import config
+
+
+@pytest.fixture
+def reload_config(monkeypatch):
+    def reload(**environ):
+        for name in ('CAF3_CACHE_DIR', 'XDG_CACHE_HOME'):
+            monkeypatch.delenv(name, raising=False)
+        for name, value in environ.items():
+            monkeypatch.setenv(name, value)
+        return importlib.reload(config)
+
+    yield reload
+    monkeypatch.undo()
+    importlib.reload(config)
+
+
+def test_cache_root_is_per_user(reload_config, tmp_path):
+    reloaded = reload_config(HOME=str(tmp_path))
+    assert reloaded.template_cache_root == os.path.join(str(tmp_path), '.cache', 'caf3')
+    reloaded = reload_config(XDG_CACHE_HOME=str(tmp_path / 'xdg'))
+    assert reloaded.template_cache_root == os.path.join(str(tmp_path / 'xdg'), 'caf3')
+    reloaded = reload_config(CAF3_CACHE_DIR=str(tmp_path / 'scratch'))
+    assert reloaded.template_cache_root == str(tmp_path / 'scratch')
+
+
+def test_caches_and_store_share_the_root():
+    for directory in (config.template_cif_store_dir, config.template_search_cache_dir,
+                      config.template_mmcif_cache_dir, config.template_realign_cache_dir,
+                      config.template_residue_cache_dir):
+        assert os.path.dirname(directory) == config.template_cache_root
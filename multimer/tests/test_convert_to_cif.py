@@ -0,0 +1,79 @@
+import os
+
+import pytest
+from Bio.PDB import MMCIFParser, PDBIO
+
+from utils import convert_to_cif
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def _atom(record, serial, name, resname, chain, resseq, xyz, altloc=' ', icode=' ',
+          occupancy=1.0, bfactor=20.0, element=None):
+    """One fixed-column PDB ATOM/HETATM line. element=None guesses it from name."""
+    if element is None:
+        element = name.strip()[0]
+    fullname = name if len(name) == 4 else f' {name:<3}'
+    x, y, z = xyz
+    return (f'{record:<6}{serial:>5} {fullname}{altloc}{resname:>3} {chain}{resseq:>4}{icode}   '
+            f'{x:8.3f}{y:8.3f}{z:8.3f}{occupancy:6.2f}{bfactor:6.2f}          {element:>2}\n')
+
+
+def _edge_case_pdb():
+    lines = ['REMARK 0\n']
+    serial = 1
+    residues = [('ATOM', 'ALA', 'A', 1, ' '), ('ATOM', 'GLY', 'A', 2, ' '),
+                ('ATOM', 'SER', 'A', 2, 'A'),  # Insertion code.
+                ('ATOM', 'LYS', 'A', 4, ' '),
+                ('HETATM', 'MSE', 'A', 5, ' '), ('HETATM', 'ATP', 'A', 101, ' '),
+                ('HETATM', 'HOH', 'A', 201, ' '), ('HETATM', 'HOH', 'A', 202, ' '),
+                ('ATOM', 'VAL', 'B', -1, ' '), ('ATOM', 'TRP', 'B', 0, ' '),
+                ('HETATM', ' ZN', 'B', 301, ' ')]
+    for k, (record, resname, chain, resseq, icode) in enumerate(residues):
+        names = [' N  ', ' CA ', ' C  ', ' O  '] if record == 'ATOM' else [' C1 ', ' O2 ']
+        if resname == 'HOH':
+            names = [' O  ']
+        elif resname.strip() == 'ZN':
+            names = ['ZN  ']
+        for i, name in enumerate(names):
+            element = 'ZN' if name == 'ZN  ' else ('' if k == 3 else None)
+            lines.append(_atom(record, serial, name, resname, chain, resseq,
+                               (k + 0.1234 * i, -k * 1.5, 1000.0 / (i + 1)), icode=icode,
+                               bfactor=(k * 7.5) % 90, element=element))
+            serial += 1
+    lines.append('TER\nEND\n')
+    return ''.join(lines)
+
+
+def _structure_pdb(tmp_path):
+    structure = MMCIFParser(QUIET=True).get_structure('1a7g', os.path.join(DATA_DIR, '1a7g.cif'))
+    path = tmp_path / 'structure.atom'
+    io = PDBIO()
+    io.set_structure(structure)
+    io.save(str(path))
+    return path
+
+
+def test_streaming_matches_mmcifio_on_a_structure(tmp_path):
+    assert convert_to_cif.check_atom2cif_backends(str(_structure_pdb(tmp_path))) == []
+
+
+def test_streaming_matches_mmcifio_on_edge_cases(tmp_path):
+    path = tmp_path / 'edge.atom'
+    path.write_text(_edge_case_pdb())
+    assert convert_to_cif.check_atom2cif_backends(str(path)) == []
+
+
+@pytest.mark.parametrize('backend', ['streaming', 'biopython'])
+def test_atom2cif_writes_the_release_date(tmp_path, backend):
+    cif_path = tmp_path / 'structure.cif'
+    convert_to_cif.atom2cif(str(_structure_pdb(tmp_path)), str(cif_path), backend=backend)
+    content = cif_path.read_text()
+    assert convert_to_cif.RELEASE_DATE in content
+    assert len(list(MMCIFParser(QUIET=True).get_structure('x', str(cif_path)).get_atoms())) > 0
+
+
+def test_unknown_backend(tmp_path):
+    with pytest.raises(ValueError):
+        convert_to_cif.atom2cif(str(_structure_pdb(tmp_path)), str(tmp_path / 'x.cif'),
+                                backend='unknown')
@@ -0,0 +1,83 @@
+import os
+import time
+
+import pytest
+
+from utils import disk_cache
+
+
+def _key(i):
+    return f'{i:040x}'
+
+
+def test_write_and_read(tmp_path):
+    cache = disk_cache.DiskCache(str(tmp_path / 'cache'), '.bin', None)
+    assert cache.read(_key(1)) is None
+    cache.write(_key(1), b'payload')
+    assert cache.read(_key(1)) == b'payload'
+    assert os.path.dirname(cache.path(_key(1))) == str(tmp_path / 'cache' / _key(1)[:2])
+
+
+def test_copies(tmp_path):
+    cache = disk_cache.DiskCache(str(tmp_path / 'cache'), '.csv', None)
+    source = tmp_path / 'source.csv'
+    source.write_text('a,b\n')
+    destination = str(tmp_path / 'destination.csv')
+    assert not cache.copy_to(_key(1), destination)
+    assert not os.path.exists(destination)
+    cache.copy_from(_key(1), str(source))
+    assert cache.copy_to(_key(1), destination)
+    with open(destination) as f:
+        assert f.read() == 'a,b\n'
+
+
+def test_least_recently_read_entries_are_evicted_first(tmp_path):
+    cache = disk_cache.DiskCache(str(tmp_path / 'cache'), '.bin', 4 << 10)
+    for i in range(4):
+        cache.write(_key(i), bytes(1 << 10))
+        os.utime(cache.path(_key(i)), (time.time() - 1000 + i, time.time() - 1000 + i))
+    cache.read(_key(0))
+
+    cache.write(_key(4), bytes(1 << 10))
+
+    assert cache.read(_key(1)) is None
+    for i in (0, 2, 3, 4):
+        assert cache.read(_key(i)) is not None
+
+
+def test_evict_to_zero_keeps_other_files(tmp_path):
+    cache = disk_cache.DiskCache(str(tmp_path / 'cache'), '.bin', None)
+    cache.write(_key(1), b'x')
+    (tmp_path / 'cache' / 'VERSION').write_text('1\n')
+    cache.evict(0)
+    assert cache.read(_key(1)) is None
+    assert (tmp_path / 'cache' / 'VERSION').exists()
+
+
+def test_new_directories_are_private(tmp_path):
+    disk_cache.DiskCache(str(tmp_path / 'root' / 'cache'), '.bin', None)
+    assert os.stat(tmp_path / 'root').st_mode & 0o777 == 0o700
+    assert os.stat(tmp_path / 'root' / 'cache').st_mode & 0o777 == 0o700
+
+
+@pytest.mark.parametrize('writable', ['cache', 'parent'])
+def test_directories_writable_by_others_are_refused(tmp_path, writable):
+    parent = tmp_path / 'parent'
+    cache_dir = parent / 'cache'
+    cache_dir.mkdir(parents=True)
+    os.chmod(parent if writable == 'parent' else cache_dir, 0o777)
+    with pytest.raises(PermissionError):
+        disk_cache.DiskCache(str(cache_dir), '.bin', None)
+    assert disk_cache.create(str(cache_dir), '.bin', None) is None
+
+
+def test_sticky_parent_is_accepted(tmp_path):
+    os.chmod(tmp_path, 0o1777)
+    try:
+        disk_cache.DiskCache(str(tmp_path / 'cache'), '.bin', None)
+    finally:
+        os.chmod(tmp_path, 0o700)
+
+
+def test_create_without_a_directory():
+    assert disk_cache.create(None, '.bin', None) is None
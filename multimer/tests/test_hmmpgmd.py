@@ -0,0 +1,86 @@
+"""Replays a recorded hmmpgmd reply and compares it with hmmsearch -A output.
+
+The files in data/hmmpgmd were recorded with HMMER 3.4 for one query profile
+against a pdb_seqres subset: the hmmpgmd reply (status header and message) and
+the hmmsearch -A output of the same search.
+"""
+import gzip
+import os
+import socket
+import threading
+
+import pytest
+
+from template_search import hmmpgmd
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data', 'hmmpgmd')
+
+
+def _read(name, mode='rt'):
+    with gzip.open(os.path.join(DATA_DIR, name), mode) as f:
+        return f.read()
+
+
+@pytest.fixture
+def recorded_daemon():
+    """Serves the recorded reply to one client. Yields (port, requests)."""
+    reply = _read('reply.bin.gz', 'rb')
+    server = socket.create_server(('127.0.0.1', 0))
+    requests = []
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            request = b''
+            while not request.endswith(b'//\n'):
+                chunk = conn.recv(1 << 16)
+                if not chunk:
+                    break
+                request += chunk
+            requests.append(request.decode())
+            conn.sendall(reply)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield server.getsockname()[1], requests
+    thread.join(timeout=10)
+    server.close()
+
+
+@pytest.fixture
+def client_factory(tmp_path):
+    database_path = tmp_path / 'pdb_seqres.txt'
+    database_path.write_text('>101m_A mol:protein length:154  MYOGLOBIN\nMVLSEGEWQLV\n')
+
+    def make(port):
+        return hmmpgmd.Hmmpgmd(hmmbuild_binary_path='hmmbuild',
+                               database_path=str(database_path),
+                               port=port, timeout=30)
+    return make
+
+
+def test_reply_matches_hmmsearch_output(recorded_daemon, client_factory):
+    port, requests = recorded_daemon
+    client = client_factory(port)
+    hmm = _read('query.hmm.gz')
+
+    output = client.query_with_hmm(hmm)
+
+    expected = _read('hmmsearch.sto.gz').replace(
+        '#=GF AU hmmsearch (HMMER 3.4)', '#=GF AU hmmpgmd')
+    assert output == expected
+    assert requests == [f'@--seqdb 1 {" ".join(client.flags)}\n{hmm}']
+    assert len(client.get_template_hits(output, 'X')) == expected.count('\n#=GS ')
+
+
+def test_client_has_the_hmmsearch_attributes(client_factory):
+    client = client_factory(hmmpgmd.DEFAULT_PORT)
+    assert client.num_cpu == 1
+    assert client.flags[:2] == ['--F1', '0.1']
+    assert client.output_format == client.input_format == 'sto'
+
+
+def test_missing_database_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        hmmpgmd.Hmmpgmd(hmmbuild_binary_path='hmmbuild',
+                        database_path=str(tmp_path / 'missing.txt'))
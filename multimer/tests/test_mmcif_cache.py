@@ -0,0 +1,80 @@
+import glob
+import os
+import time
+
+from template_search import mmcif_cache
+from utils import disk_cache
+
+
+def _cif_files(tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f'{i}.cif'
+        path.write_text(f'data_{i}\n')
+        paths.append(str(path))
+    return paths
+
+
+def _entries(cache_dir):
+    return glob.glob(os.path.join(cache_dir, '*', '*.pkl'))
+
+
+def _disk_bytes(cache_dir):
+    return sum(os.path.getsize(path) for path in _entries(cache_dir))
+
+
+def test_disk_entries_are_reused(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    (cif_path,) = _cif_files(tmp_path, 1)
+    builds = []
+
+    def build(path):
+        builds.append(path)
+        return {'path': path}
+
+    first = mmcif_cache.MmcifCache(cache_dir, max_memory_bytes=0)
+    assert first.get(cif_path, build) == {'path': cif_path}
+    second = mmcif_cache.MmcifCache(cache_dir, max_memory_bytes=0)
+    assert second.get(cif_path, build) == {'path': cif_path}
+    assert builds == [cif_path]
+
+
+def test_disk_size_is_bounded(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    max_disk_bytes = 40 << 10
+    cache = mmcif_cache.MmcifCache(cache_dir, max_memory_bytes=0,
+                                   max_disk_bytes=max_disk_bytes)
+    for path in _cif_files(tmp_path, 40):
+        cache.get(path, lambda path: os.urandom(4 << 10))
+    assert _entries(cache_dir)
+    # Eviction runs once EVICT_FRACTION of the bound was written since the last scan.
+    assert _disk_bytes(cache_dir) <= max_disk_bytes * (1 + disk_cache.EVICT_FRACTION) + (5 << 10)
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    paths = _cif_files(tmp_path, 12)
+    cache = mmcif_cache.MmcifCache(cache_dir, max_memory_bytes=0,
+                                   max_disk_bytes=10 << 20)
+    build = lambda path: os.urandom(1 << 20)
+    for path in paths[:8]:
+        cache.get(path, build)
+    for entry in _entries(cache_dir):
+        os.utime(entry, (time.time() - 1000, time.time() - 1000))
+    oldest = cache._entries.path(cache.key(paths[0]))
+    os.utime(oldest, (time.time() - 2000, time.time() - 2000))
+    kept = cache.get(paths[0], build)  # A disk hit marks the entry as recently used.
+
+    for path in paths[8:]:
+        cache.get(path, build)
+
+    assert _disk_bytes(cache_dir) <= 10 << 20
+    assert cache.get(paths[0], lambda path: None) == kept
+
+
+def test_memory_only(tmp_path):
+    (cif_path,) = _cif_files(tmp_path, 1)
+    cache = mmcif_cache.create_cache(None, max_memory_bytes=1 << 20)
+    value = cache.get(cif_path, lambda path: [1, 2, 3])
+    assert cache.get(cif_path, lambda path: None) is value
+    assert mmcif_cache.create_cache(None, max_memory_bytes=0) is None
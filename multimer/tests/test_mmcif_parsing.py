@@ -0,0 +1,131 @@
+import os
+import random
+
+import pytest
+
+from template_search import mmcif_parsing
+from template_search import templates
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+CIF_NAMES = ['1a7g.cif', '1mom_min.cif', '4q9r_min.cif', '1ssu_mod.cif']
+
+
+def _atom_site(lines):
+    """Returns the _atom_site column indices and the row range of the atoms."""
+    header = [i for i, line in enumerate(lines) if line.startswith('_atom_site.')]
+    columns = {lines[i].strip(): k for k, i in enumerate(header)}
+    start = end = header[-1] + 1
+    while end < len(lines) and lines[end].startswith(('ATOM', 'HETATM')):
+        end += 1
+    return columns, start, end
+
+
+def _altlocs(rows, col, rng):
+    """Splits 10% of the atoms into A/B alternative locations."""
+    edited = []
+    for row in rows:
+        if row[0] == 'ATOM' and rng.random() < 0.1:
+            a, b = list(row), list(row)
+            a[col['_atom_site.label_alt_id']] = 'A'
+            b[col['_atom_site.label_alt_id']] = 'B'
+            a[col['_atom_site.occupancy']] = rng.choice(['0.50', '0.40', '0.60'])
+            b[col['_atom_site.occupancy']] = rng.choice(['0.50', '0.40', '0.60'])
+            x = col['_atom_site.Cartn_x']
+            b[x] = str(float(row[x]) + 1)
+            edited += [a, b]
+        else:
+            edited.append(row)
+    return edited
+
+
+def _blank_then_altloc(rows, col, rng):
+    """Adds a B alternative location after some atoms without one."""
+    edited = []
+    for row in rows:
+        edited.append(row)
+        if row[0] == 'ATOM' and row[col['_atom_site.label_atom_id']] == 'CB' and rng.random() < 0.3:
+            b = list(row)
+            b[col['_atom_site.label_alt_id']] = 'B'
+            b[col['_atom_site.occupancy']] = rng.choice(['0.50', '1.00', '2.00'])
+            b[col['_atom_site.Cartn_y']] = '9.999'
+            edited.append(b)
+    return edited
+
+
+def _residue_atoms(rows, col, index):
+    key = lambda row: (row[col['_atom_site.auth_asym_id']], row[col['_atom_site.auth_seq_id']])
+    atoms = [row for row in rows if row[0] == 'ATOM']
+    target = key(atoms[index])
+    return key, target, [row for row in atoms if key(row) == target]
+
+
+def _point_mutation(rows, col, rng):
+    """Redefines a residue as two alternative residues, the second an ALA."""
+    key, target, residue = _residue_atoms(rows, col, 50)
+    edited = []
+    for row in rows:
+        if row[0] == 'ATOM' and key(row) == target:
+            if row is residue[0]:
+                for alt, comp in (('A', None), ('B', 'ALA')):
+                    for atom in residue:
+                        atom = list(atom)
+                        atom[col['_atom_site.label_alt_id']] = alt
+                        atom[col['_atom_site.occupancy']] = '0.5'
+                        if comp:
+                            atom[col['_atom_site.label_comp_id']] = comp
+                            atom[col['_atom_site.Cartn_z']] = '1.0'
+                        edited.append(atom)
+            continue
+        edited.append(row)
+    return edited
+
+
+def _blank_mutation(rows, col, rng):
+    """Adds an ALA atom to a residue without alternative locations."""
+    _, _, residue = _residue_atoms(rows, col, 50)
+    edited = []
+    for row in rows:
+        edited.append(row)
+        if row is residue[-1]:
+            atom = list(residue[0])
+            atom[col['_atom_site.label_comp_id']] = 'ALA'
+            edited.append(atom)
+    return edited
+
+
+def _duplicate_atom(rows, col, rng):
+    return rows[:10] + [rows[9]] + rows[10:]
+
+
+def _second_model(rows, col, rng):
+    model = col['_atom_site.pdbx_PDB_model_num']
+    return rows + [[*row[:model], '2', *row[model + 1:]] for row in rows[:100]]
+
+
+EDITS = [_altlocs, _blank_then_altloc, _point_mutation, _blank_mutation,
+         _duplicate_atom, _second_model]
+
+
+@pytest.mark.parametrize('name', CIF_NAMES)
+def test_backends_agree(name):
+    assert templates.check_mmcif_parser_backends(os.path.join(DATA_DIR, name)) == []
+
+
+@pytest.mark.parametrize('edit', EDITS, ids=lambda edit: edit.__name__.strip('_'))
+def test_backends_agree_on_edge_cases(tmp_path, edit):
+    with open(os.path.join(DATA_DIR, '1a7g.cif')) as f:
+        lines = f.read().splitlines()
+    col, start, end = _atom_site(lines)
+    rows = [lines[i].split() for i in range(start, end)]
+    rows = edit(rows, col, random.Random(0))
+    path = tmp_path / 'edited.cif'
+    path.write_text('\n'.join(lines[:start] + [' '.join(row) for row in rows] + lines[end:]) + '\n')
+
+    assert templates.check_mmcif_parser_backends(str(path)) == []
+
+
+def test_backends_report_the_same_errors():
+    result = {backend: mmcif_parsing.parse(file_id='bad', mmcif_string='data_bad\n#\n',
+                                           backend=backend)
+              for backend in mmcif_parsing.BACKENDS}
+    assert all(r.mmcif_object is None and r.errors for r in result.values())
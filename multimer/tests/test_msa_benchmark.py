@@ -0,0 +1,13 @@
+import sys
+
+from template_search import msa_benchmark
+
+
+def test_main_on_a_small_synthetic_msa(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['msa_benchmark', '--num_sequences', '200',
+                                      '--query_length', '120'])
+    msa_benchmark.main()
+    output = capsys.readouterr().out
+    assert 'remove_empty_columns_from_stockholm_msa' in output
+    assert 'iter_template_stockholm_msa' in output
+    assert 'Identical output: False' not in output
@@ -0,0 +1,221 @@
+import collections
+import itertools
+import random
+
+import pytest
+
+from template_search import parsers
+
+_AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def _synthetic_stockholm(num_sequences, query_length, seed):
+    """Builds a jackhmmer-like Stockholm MSA in blocks of 200 columns.
+
+    Hits are local and cover a random part of the query, with substitutions,
+    deletions and insertions. A fifth of them duplicate the previous hit, and a
+    few match columns are deleted in every hit.
+    """
+    rng = random.Random(seed)
+    query = ''.join(rng.choice(_AMINO_ACIDS) for _ in range(query_length))
+    # Insert columns after some match positions, with their widest insertion.
+    insert_widths = [rng.choice((0,) * 12 + (1, 2, 5)) for _ in range(query_length)]
+    always_deleted = set(rng.sample(range(1, query_length), query_length // 50))
+
+    names = ['query']
+    rows = [''.join(residue + '.' * width for residue, width in zip(query, insert_widths))]
+    for n in range(1, num_sequences):
+        start = rng.randrange(0, query_length // 3)
+        end = rng.randrange(2 * query_length // 3, query_length + 1)
+        names.append(f'UniRef90_S{n:06d}/{start + 1}-{end}')
+        if n > 1 and rng.random() < 0.2:
+            rows.append(rows[-1])
+            continue
+        row = []
+        for i in range(query_length):
+            if i < start or i >= end or i in always_deleted or rng.random() < 0.05:
+                row.append('-')
+            else:
+                row.append(query[i] if rng.random() < 0.6 else rng.choice(_AMINO_ACIDS))
+            width = insert_widths[i]
+            if width:
+                inserted = rng.randrange(0, width + 1) if start <= i < end else 0
+                row.append(''.join(rng.choice(_AMINO_ACIDS).lower() for _ in range(inserted))
+                           + '.' * (width - inserted))
+        rows.append(''.join(row))
+    rf = ''.join('x' + '.' * width for width in insert_widths)
+
+    margin = max(len(name) for name in names) + 9
+    lines = ['# STOCKHOLM 1.0', '#=GF ID query-i1', '#=GF AU jackhmmer', '']
+    lines.extend(f'#=GS {name} DE [subseq from] synthetic hit' for name in names[1:])
+    lines.append('')
+    for block_start in range(0, len(rf), 200):
+        block_end = block_start + 200
+        for name, row in zip(names, rows):
+            lines.append(f'{name:<{margin - 1}} {row[block_start:block_end]}')
+            lines.append(f'#=GR {name} PP {"*" * len(row[block_start:block_end])}')
+        lines.append(f'#=GC {"PP_cons":<{margin - 6}} {"*" * len(rf[block_start:block_end])}')
+        lines.append(f'#=GC {"RF":<{margin - 6}} {rf[block_start:block_end]}')
+        lines.append('')
+    lines.append('//')
+    return '\n'.join(lines) + '\n'
+
+
+def _reference_remove_empty_columns(stockholm_msa):
+    """The loop-based remove_empty_columns_from_stockholm_msa it replaced."""
+    processed_lines = {}
+    unprocessed_lines = {}
+    for i, line in enumerate(stockholm_msa.splitlines()):
+        if line.startswith('#=GC RF'):
+            reference_annotation_i = i
+            reference_annotation_line = line
+            _, _, first_alignment = line.rpartition(' ')
+            mask = []
+            for j in range(len(first_alignment)):
+                for _, unprocessed_line in unprocessed_lines.items():
+                    prefix, _, alignment = unprocessed_line.rpartition(' ')
+                    if alignment[j] != '-':
+                        mask.append(True)
+                        break
+                else:
+                    mask.append(False)
+            unprocessed_lines[reference_annotation_i] = reference_annotation_line
+
+            if not any(mask):
+                for line_index in unprocessed_lines:
+                    processed_lines[line_index] = ''
+            else:
+                for line_index, unprocessed_line in unprocessed_lines.items():
+                    prefix, _, alignment = unprocessed_line.rpartition(' ')
+                    masked_alignment = ''.join(itertools.compress(alignment, mask))
+                    processed_lines[line_index] = f'{prefix} {masked_alignment}'
+
+            unprocessed_lines = {}
+        elif line.strip() and not line.startswith(('#', '//')):
+            unprocessed_lines[i] = line
+        else:
+            processed_lines[i] = line
+    return '\n'.join((processed_lines[i] for i in range(len(processed_lines))))
+
+
+def _gapped_stockholm(rng):
+    """Random blocks in which about a third of the columns are '-' in every row."""
+    num_rows = rng.randrange(1, 30)
+    lines = ['# STOCKHOLM 1.0', '']
+    for _ in range(rng.randrange(1, 4)):
+        num_columns = rng.randrange(1, 60)
+        empty = [rng.random() < 0.3 for _ in range(num_columns)]
+        for row in range(num_rows):
+            alignment = ''.join('-' if is_empty else rng.choice('ACDEFa.-')
+                                for is_empty in empty)
+            lines.append(f'seq{row}/1-{num_columns} {alignment}')
+            if rng.random() < 0.3:
+                lines.append(f'#=GR seq{row}/1-{num_columns} PP {"*" * num_columns}')
+        lines.append(f'#=GC RF {"x" * num_columns}')
+        lines.append('')
+    lines.append('//')
+    return '\n'.join(lines) + '\n'
+
+
+def _reference_deduplicate(stockholm_msa):
+    """The deduplicate_stockholm_msa that kept every masked alignment."""
+    sequence_dict = collections.defaultdict(str)
+    for line in stockholm_msa.splitlines():
+        if line.strip() and not line.startswith(('#', '//')):
+            seqname, alignment = line.strip().split()
+            sequence_dict[seqname] += alignment
+
+    seen_sequences = set()
+    seqnames = set()
+    query_align = next(iter(sequence_dict.values()))
+    mask = [c != '-' for c in query_align]
+    for seqname, alignment in sequence_dict.items():
+        masked_alignment = ''.join(itertools.compress(alignment, mask))
+        if masked_alignment not in seen_sequences:
+            seen_sequences.add(masked_alignment)
+            seqnames.add(seqname)
+
+    filtered_lines = [line for line in stockholm_msa.splitlines()
+                      if parsers._keep_line(line, seqnames)]
+    return '\n'.join(filtered_lines) + '\n'
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_remove_empty_columns_matches_reference(seed):
+    rng = random.Random(seed)
+    msa = _synthetic_stockholm(rng.randrange(2, 300), rng.randrange(20, 500), seed)
+    assert (parsers.remove_empty_columns_from_stockholm_msa(msa)
+            == _reference_remove_empty_columns(msa))
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_remove_empty_columns_matches_reference_on_gapped_blocks(seed):
+    msa = _gapped_stockholm(random.Random(seed))
+    assert (parsers.remove_empty_columns_from_stockholm_msa(msa)
+            == _reference_remove_empty_columns(msa))
+
+
+def test_remove_empty_columns_of_an_empty_block():
+    msa = ('# STOCKHOLM 1.0\n\n'
+           'query ACD-E\n'
+           'hit1  A-D--\n'
+           '#=GC RF xxx.x\n\n'
+           'query -----\n'
+           'hit1  -----\n'
+           '#=GC RF xxxxx\n'
+           '//\n')
+    result = parsers.remove_empty_columns_from_stockholm_msa(msa)
+    assert result == _reference_remove_empty_columns(msa)
+    assert 'query ACDE' in result.splitlines()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_deduplicate_matches_reference(tmp_path, seed):
+    rng = random.Random(seed)
+    msa = _synthetic_stockholm(rng.randrange(2, 300), rng.randrange(20, 500), seed)
+    expected = _reference_deduplicate(msa)
+    assert parsers.deduplicate_stockholm_msa(msa) == expected
+
+    msa_path = tmp_path / 'msa.sto'
+    msa_path.write_text(msa)
+    output_path = tmp_path / 'deduplicated.sto'
+    parsers.deduplicate_stockholm_msa_file(str(msa_path), str(output_path))
+    assert output_path.read_text() == expected
+
+
+def test_deduplicate_with_a_hit_before_the_query():
+    msa = ('# STOCKHOLM 1.0\n\n'
+           'query AC-D\n'
+           'hit1  ACeD\n'
+           'hit2  AC-D\n'
+           '#=GC RF xx.x\n\n'
+           'hit2  EF\n'
+           'query EF\n'
+           'hit1  EG\n'
+           '#=GC RF xx\n'
+           '//\n')
+    result = parsers.deduplicate_stockholm_msa(msa)
+    assert result == _reference_deduplicate(msa)
+    assert 'hit2' not in result and 'hit1' in result
+
+
+def _chained_template_msa(msa_path, max_sequences):
+    msa = parsers.truncate_stockholm_msa(msa_path, max_sequences)
+    msa = parsers.deduplicate_stockholm_msa(msa)
+    return parsers.remove_empty_columns_from_stockholm_msa(msa)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_iter_template_stockholm_msa_matches_the_chained_steps(tmp_path, seed):
+    rng = random.Random(seed)
+    num_sequences = rng.randrange(2, 300)
+    if seed % 2:
+        msa = _synthetic_stockholm(num_sequences, rng.randrange(20, 500), seed)
+    else:
+        msa = _gapped_stockholm(rng)
+    msa_path = tmp_path / 'msa.sto'
+    msa_path.write_text(msa)
+    max_sequences = rng.choice([1, 2, num_sequences // 2 + 1, 50000])
+
+    fused = '\n'.join(parsers.iter_template_stockholm_msa(str(msa_path), max_sequences))
+    assert fused == _chained_template_msa(str(msa_path), max_sequences)
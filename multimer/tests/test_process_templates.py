@@ -0,0 +1,155 @@
+import csv
+import functools
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+from utils import cif_residues
+
+
+@pytest.fixture
+def process_templates(monkeypatch):
+    # template_search.pipeline builds its searcher from the configured databases at
+    # import; the functions tested here do not use it.
+    pipeline = types.ModuleType('template_search.pipeline')
+    pipeline.template_searcher = None
+    pipeline._process_single_chain = None
+    monkeypatch.setitem(sys.modules, 'template_search.pipeline', pipeline)
+    monkeypatch.delitem(sys.modules, 'process_templates', raising=False)
+    module = importlib.import_module('process_templates')
+    templates = importlib.import_module('templates')
+    monkeypatch.setattr(cif_residues, '_memo', {})
+    monkeypatch.setattr(templates, 'get_residue_indices',
+                        functools.partial(cif_residues.get_residue_indices, cache_dir=None))
+    monkeypatch.setattr(module, 'template_lazy_conversion', True)
+    return module
+
+
+@pytest.mark.parametrize('num_workers', [1, 2, 4, 16])
+@pytest.mark.parametrize('cpu_budget', [10, 16, 32, 64])
+@pytest.mark.parametrize('cpus_per_search', [1, 4, 8])
+@pytest.mark.parametrize('featurize_workers', [1, 4, 12])
+def test_pool_sizes_stay_within_the_cpu_budget(process_templates, num_workers, cpu_budget,
+                                               cpus_per_search, featurize_workers):
+    search_workers, other_workers = process_templates._get_pool_sizes(
+        num_workers, cpu_budget, cpus_per_search, featurize_workers)
+    assert 1 <= search_workers <= num_workers
+    assert 1 <= other_workers <= num_workers
+    cpus_per_job = max(cpus_per_search, featurize_workers)
+    if cpus_per_job < cpu_budget:
+        assert search_workers * cpus_per_job + other_workers <= cpu_budget
+    else:
+        assert (search_workers, other_workers) == (1, 1)
+
+
+def test_default_pool_sizes(process_templates):
+    # 4 hmmsearch jobs of 8 cores used to leave no core for conversion (33 of 32).
+    assert process_templates._get_pool_sizes(4, 32, 8, 4) == (3, 4)
+    assert process_templates._get_pool_sizes(4, 32, 1, 4) == (4, 4)
+    # A budget below one search job plus one core cannot be met.
+    assert process_templates._get_pool_sizes(4, 8, 8, 4) == (1, 1)
+
+
+def _write_cif(path, residue_numbers=(1, 2, 3)):
+    with open(path, 'w') as f:
+        f.write('data_test\nloop_\n')
+        for i, number in enumerate(residue_numbers, 1):
+            f.write(f'ATOM {i} C CA . GLY A 1 {number} ? 0.0 0.0 0.0 1.0 0.0 ? '
+                    f'{number} GLY A CA 1\n')
+
+
+def _write_csv(path, template_names):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['template_name', 'query_indices', 'template_indices'])
+        for template_name in template_names:
+            writer.writerow([template_name, '[0, 1, 2]', '[0, 1, 2]'])
+
+
+def _store_names(template_csv):
+    with open(template_csv) as f:
+        return [row['store_cif'] for row in csv.DictReader(f)]
+
+
+def test_deferred_atom_templates_are_hashed_only_when_needed(process_templates, tmp_path,
+                                                             monkeypatch):
+    quota = process_templates.template_quota
+    names = [f'm{i}' for i in range(quota + 4)]
+    atom_inputs = []
+    for name in names:
+        atom_inputs.append(str(tmp_path / f'{name}.atom'))
+        with open(atom_inputs[-1], 'w') as f:
+            f.write(f'{name}\n')
+    template_csv = str(tmp_path / 'A_templates.csv')
+    _write_csv(template_csv, names)
+    store_dir = str(tmp_path / 'store')
+    os.makedirs(store_dir)
+
+    hashed = []
+    atom_cif_name = process_templates.atom_cif_name
+    monkeypatch.setattr(process_templates, 'atom_cif_name',
+                        lambda atom_input, repair: hashed.append(atom_input) or
+                        atom_cif_name(atom_input, repair))
+    # The two top ranked templates fail to convert.
+    failing = set(atom_inputs[:2])
+
+    def convert_templates(jobs, executor=None):
+        results = {}
+        for atom_input, cif_output, _ in jobs:
+            if atom_input in failing:
+                results[cif_output] = 'failed'
+            else:
+                _write_cif(cif_output)
+                results[cif_output] = None
+        return results
+
+    monkeypatch.setattr(process_templates, 'convert_templates', convert_templates)
+
+    conversion_jobs, lazy_indexes = process_templates._collect_atom_jobs(
+        template_csv, atom_inputs, store_dir, False)
+    assert hashed == atom_inputs[:quota]
+    assert [job[0] for job in conversion_jobs] == atom_inputs[:quota]
+    assert _store_names(template_csv)[quota:] == [''] * 4
+
+    process_templates.convert_collected_templates(conversion_jobs, lazy_indexes)
+    assert hashed == atom_inputs[:quota + 2]
+    cif_names = _store_names(template_csv)
+    assert all(cif_names[:quota + 2]) and cif_names[quota + 2:] == ['', '']
+    assert len(process_templates.return_template_info(template_csv, 'store', store_dir)) == quota
+
+
+def test_pdb_templates_are_linked_per_entry(process_templates, tmp_path, monkeypatch):
+    pdb_chains = [('1abc', 'A'), ('2xyz', 'B'), ('1abc', 'C'), ('3def', 'A'), ('1abc', 'D'),
+                  ('4ghi', 'A')]
+    template_csv = str(tmp_path / 'A_templates.csv')
+    _write_csv(template_csv, [f'{pdb_id}{chain_id}' for pdb_id, chain_id in pdb_chains])
+    store_dir = str(tmp_path / 'store')
+
+    batches = []
+    single = []
+
+    def link_template_cifs(template_chains):
+        batches.append([(pdb_id, chain_id) for pdb_id, chain_id, _ in template_chains])
+        for pdb_id, chain_id, destination_cif in template_chains:
+            if pdb_id != '2xyz':  # Not in the database.
+                _write_cif(destination_cif)
+
+    def link_chain_cif(pdb_id, chain_id, destination_cif):
+        single.append((pdb_id, chain_id))
+        if pdb_id != '2xyz':
+            _write_cif(destination_cif)
+        return pdb_id != '2xyz'
+
+    monkeypatch.setattr(process_templates, 'link_template_cifs', link_template_cifs)
+    monkeypatch.setattr(process_templates, 'link_chain_cif', link_chain_cif)
+
+    process_templates._stage_pdb_templates(template_csv, pdb_chains, store_dir)
+
+    quota = process_templates.template_quota
+    assert batches == [pdb_chains[:quota]]
+    # The failed entry is retried on its own, then the next ranked chain tops up the quota.
+    assert single == [('2xyz', 'B'), pdb_chains[quota]]
+    assert len(process_templates.return_template_info(template_csv, 'store', store_dir)) == quota
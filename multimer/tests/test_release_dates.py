@@ -0,0 +1,128 @@
+import datetime
+import os
+import shutil
+
+import numpy as np
+
+from template_search import release_dates
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+OBSOLETE_DAT = '''\
+     LIST OF OBSOLETE COORDINATE ENTRIES AND SUCCESSORS
+OBSLTE    31-JUL-94 116L     216L
+OBSLTE    26-SEP-06 2H33     2JM5 2OWI
+OBSLTE    06-NOV-19 6G9Y
+'''
+
+
+def _write_cif(path, *revision_dates):
+    rows = '\n'.join(f'{i} 1 {i} {date} ? ? ?' for i, date in enumerate(revision_dates, 1))
+    with open(path, 'w') as f:
+        f.write('data_TEST\n#\n_entry.id TEST\n#\nloop_\n'
+                '_pdbx_audit_revision_history.ordinal\n'
+                '_pdbx_audit_revision_history.data_content_type\n'
+                '_pdbx_audit_revision_history.major_revision\n'
+                '_pdbx_audit_revision_history.revision_date\n'
+                '_pdbx_audit_revision_history.a\n'
+                '_pdbx_audit_revision_history.b\n'
+                '_pdbx_audit_revision_history.c\n'
+                f'{rows}\n#\n_struct.title "Released 1990-01-01"\n#\n')
+
+
+def _day(date):
+    return datetime.date.fromisoformat(date).toordinal()
+
+
+def test_read_release_day(tmp_path):
+    # The oldest revision, ignoring dates outside the revision history category.
+    path = str(tmp_path / '1abc.cif')
+    _write_cif(path, '2005-03-01', '2003-11-25', '2011-07-13')
+    assert release_dates.read_release_day(path) == _day('2003-11-25')
+
+    with open(path, 'w') as f:
+        f.write('data_TEST\n#\n_entry.id TEST\n#\n')
+    assert release_dates.read_release_day(path) == 0
+
+    assert release_dates.read_release_day(os.path.join(DATA_DIR, '1a7g.cif')) == _day('1999-04-27')
+
+
+def test_parse_obsolete(tmp_path):
+    path = tmp_path / 'obsolete.dat'
+    path.write_text(OBSOLETE_DAT)
+    assert release_dates.parse_obsolete(str(path)) == {
+        '116l': '216l', '2h33': '2jm5', '6g9y': None}
+
+
+def _mmcif_dir(tmp_path):
+    mmcif_dir = tmp_path / 'pdb_mmcif' / 'mmcif_files'
+    mmcif_dir.mkdir(parents=True)
+    _write_cif(str(mmcif_dir / '1abc.cif'), '2003-11-25')
+    _write_cif(str(mmcif_dir / '2XYZ.cif'), '2010-02-03', '2009-12-31')
+    with open(mmcif_dir / '3def.cif', 'w') as f:
+        f.write('data_3DEF\n#\n')
+    (mmcif_dir / 'README').write_text('not an entry\n')
+    obsolete_path = tmp_path / 'pdb_mmcif' / 'obsolete.dat'
+    obsolete_path.write_text(OBSOLETE_DAT)
+    return str(mmcif_dir), str(obsolete_path)
+
+
+def test_build_and_load_index(tmp_path):
+    mmcif_dir, obsolete_path = _mmcif_dir(tmp_path)
+
+    index_path = release_dates.build_index(mmcif_dir, obsolete_path)
+
+    assert index_path == str(tmp_path / 'pdb_mmcif' / release_dates.INDEX_FILENAME)
+    assert index_path == release_dates.default_index_path(mmcif_dir + '/')
+    dates, obsolete = release_dates.load_index(index_path)
+    # Entries without a release date are left out.
+    assert dates == {'1abc': datetime.datetime(2003, 11, 25),
+                     '2xyz': datetime.datetime(2009, 12, 31)}
+    assert obsolete == release_dates.parse_obsolete(obsolete_path)
+    assert [name for name in os.listdir(tmp_path / 'pdb_mmcif')
+            if name.startswith('.tmp_')] == []
+
+
+def test_build_index_without_obsolete_entries(tmp_path):
+    mmcif_dir, _ = _mmcif_dir(tmp_path)
+    index_path = release_dates.build_index(mmcif_dir, None,
+                                           index_path=str(tmp_path / 'index.npz'))
+    assert release_dates.load_index(index_path)[1] == {}
+
+
+def test_incremental_rebuild_reads_only_changed_files(tmp_path, monkeypatch):
+    mmcif_dir, obsolete_path = _mmcif_dir(tmp_path)
+    index_path = release_dates.build_index(mmcif_dir, obsolete_path)
+
+    read = []
+    read_release_day = release_dates.read_release_day
+    monkeypatch.setattr(release_dates, 'read_release_day',
+                        lambda path: read.append(os.path.basename(path)) or read_release_day(path))
+    release_dates.build_index(mmcif_dir, obsolete_path)
+    assert read == []
+
+    _write_cif(os.path.join(mmcif_dir, '1abc.cif'), '2003-11-24', '2020-01-01')
+    _write_cif(os.path.join(mmcif_dir, '4ghi.cif'), '2021-05-05')
+    os.remove(os.path.join(mmcif_dir, '2XYZ.cif'))
+    release_dates.build_index(mmcif_dir, obsolete_path)
+
+    assert sorted(read) == ['1abc.cif', '4ghi.cif']
+    assert release_dates.load_index(index_path)[0] == {
+        '1abc': datetime.datetime(2003, 11, 24),
+        '4ghi': datetime.datetime(2021, 5, 5)}
+
+
+def test_unreadable_index_is_rebuilt(tmp_path):
+    mmcif_dir, obsolete_path = _mmcif_dir(tmp_path)
+    index_path = release_dates.default_index_path(mmcif_dir)
+    np.savez(index_path, version=np.array(0))
+    release_dates.build_index(mmcif_dir, obsolete_path)
+    assert '1abc' in release_dates.load_index(index_path)[0]
+
+
+def test_index_matches_the_parsed_release_date(tmp_path):
+    mmcif_dir = tmp_path / 'mmcif_files'
+    mmcif_dir.mkdir()
+    shutil.copy(os.path.join(DATA_DIR, '1a7g.cif'), mmcif_dir)
+    index_path = release_dates.build_index(str(mmcif_dir), None)
+    assert release_dates.load_index(index_path)[0] == {'1a7g': datetime.datetime(1999, 4, 27)}
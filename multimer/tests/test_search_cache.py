@@ -0,0 +1,149 @@
+import os
+import time
+
+import pytest
+
+from template_search import hmmpgmd
+from template_search import hmmsearch
+from template_search import parsers
+from template_search import search_cache
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / 'pdb_seqres.txt'
+    path.write_text('>1abc_A mol:protein length:3\nMKV\n')
+    return path
+
+
+@pytest.fixture
+def msa(tmp_path):
+    path = tmp_path / 'uniref90_hits.sto'
+    path.write_text('# STOCKHOLM 1.0\nquery MKV\n//\n')
+    return path
+
+
+def _cache(tmp_path, database, max_size_bytes=1 << 20):
+    return search_cache.TemplateSearchCache(cache_dir=str(tmp_path / 'cache'),
+                                            database_path=str(database),
+                                            max_size_bytes=max_size_bytes)
+
+
+def _key(cache, msa, **overrides):
+    fields = dict(sequence='MKV', msa_path=str(msa), max_msa_sequences=50000,
+                  max_template_date='2022-01-01', max_hits=20,
+                  searcher_fingerprint='Hmmsearch:--F1 0.1',
+                  featurizer_fingerprint='featurizer')
+    fields.update(overrides)
+    return cache.key(**fields)
+
+
+def _csv(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content)
+    return str(path)
+
+
+def test_get_and_put(tmp_path, database, msa):
+    cache = _cache(tmp_path, database)
+    key = _key(cache, msa)
+    destination = str(tmp_path / 'A_templates.csv')
+    assert not cache.get(key, destination)
+    assert not os.path.exists(destination)
+
+    cache.put(key, _csv(tmp_path, 'source.csv', 'target,template\n'))
+
+    assert cache.get(key, destination)
+    with open(destination) as f:
+        assert f.read() == 'target,template\n'
+
+
+def test_entries_survive_reopening(tmp_path, database, msa):
+    cache = _cache(tmp_path, database)
+    key = _key(cache, msa)
+    cache.put(key, _csv(tmp_path, 'source.csv', 'target,template\n'))
+
+    reopened = _cache(tmp_path, database)
+
+    assert _key(reopened, msa) == key
+    assert reopened.get(key, str(tmp_path / 'A_templates.csv'))
+
+
+def test_database_change_drops_entries(tmp_path, database, msa):
+    cache = _cache(tmp_path, database)
+    key = _key(cache, msa)
+    cache.put(key, _csv(tmp_path, 'source.csv', 'target,template\n'))
+    database.write_text('>1abc_A mol:protein length:4\nMKVL\n')
+
+    reopened = _cache(tmp_path, database)
+
+    assert not reopened.get(key, str(tmp_path / 'A_templates.csv'))
+    assert _key(reopened, msa) != key
+    assert not reopened.get(_key(reopened, msa), str(tmp_path / 'A_templates.csv'))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, database, msa):
+    cache = _cache(tmp_path, database, max_size_bytes=4 << 10)
+    source = _csv(tmp_path, 'source.csv', 'x' * (1 << 10))
+    keys = [_key(cache, msa, max_hits=i) for i in range(5)]
+    for i, key in enumerate(keys[:4]):
+        cache.put(key, source)
+        entry = cache._entries.path(key)
+        os.utime(entry, (time.time() - 1000 + i, time.time() - 1000 + i))
+    assert cache.get(keys[0], str(tmp_path / 'A_templates.csv'))
+
+    cache.put(keys[4], source)
+
+    assert not cache.get(keys[1], str(tmp_path / 'A_templates.csv'))
+    for key in (keys[0], keys[2], keys[3], keys[4]):
+        assert cache.get(key, str(tmp_path / 'A_templates.csv'))
+
+
+@pytest.mark.parametrize('override', [
+    dict(sequence='MKVL'),
+    dict(max_msa_sequences=10000),
+    dict(max_template_date='2020-01-01'),
+    dict(max_hits=4),
+    dict(searcher_fingerprint='Hmmpgmd:--F1 0.1'),
+    dict(searcher_fingerprint='Hmmsearch:--F1 0.01'),
+    dict(featurizer_fingerprint='other featurizer'),
+])
+def test_key_covers_search_inputs(tmp_path, database, msa, override):
+    cache = _cache(tmp_path, database)
+    assert _key(cache, msa, **override) != _key(cache, msa)
+
+
+def test_key_covers_msa_content_and_preprocessing(tmp_path, database, msa, monkeypatch):
+    cache = _cache(tmp_path, database)
+    key = _key(cache, msa)
+
+    monkeypatch.setattr(parsers, 'TEMPLATE_MSA_VERSION', parsers.TEMPLATE_MSA_VERSION + 1)
+    assert _key(cache, msa) != key
+    monkeypatch.undo()
+
+    msa.write_text('# STOCKHOLM 1.0\nquery MKV\nhit   MRV\n//\n')
+    assert _key(cache, msa) != key
+
+
+def test_searcher_fingerprint(database):
+    searcher = hmmsearch.Hmmsearch(binary_path='hmmsearch',
+                                   hmmbuild_binary_path='hmmbuild',
+                                   database_path=str(database))
+    more_cpus = hmmsearch.Hmmsearch(binary_path='hmmsearch',
+                                    hmmbuild_binary_path='hmmbuild',
+                                    database_path=str(database),
+                                    num_cpu=2)
+    stricter = hmmsearch.Hmmsearch(binary_path='hmmsearch',
+                                   hmmbuild_binary_path='hmmbuild',
+                                   database_path=str(database),
+                                   flags=['-E', '0.001'])
+    daemon = hmmpgmd.Hmmpgmd(hmmbuild_binary_path='hmmbuild',
+                             database_path=str(database))
+
+    assert more_cpus.cache_fingerprint() == searcher.cache_fingerprint()
+    assert stricter.cache_fingerprint() != searcher.cache_fingerprint()
+    assert daemon.cache_fingerprint() != searcher.cache_fingerprint()
+
+
+def test_create_cache_disabled():
+    assert search_cache.create_cache(None, 'pdb_seqres.txt', 1 << 20) is None
@@ -0,0 +1,76 @@
+import csv
+import functools
+import os
+
+import pytest
+
+import templates
+from utils import cif_residues
+
+
+def _write_cif(path, residue_numbers):
+    with open(path, 'w') as f:
+        f.write('data_test\nloop_\n')
+        for i, number in enumerate(residue_numbers, 1):
+            f.write(f'ATOM {i} C CA . GLY A 1 {number} ? 0.0 0.0 0.0 1.0 0.0 ? '
+                    f'{number} GLY A CA 1\n')
+
+
+def _write_index(path, cif_names):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['template_name', 'query_indices', 'template_indices', 'store_cif'])
+        for i, cif_name in enumerate(cif_names):
+            writer.writerow([f't{i}', '[0, 1, 2]', '[0, 1, 2]', cif_name])
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Residue scans are memoized by path; keep them from leaking between tests, and
+    # out of the user's cache directory.
+    monkeypatch.setattr(cif_residues, '_memo', {})
+    monkeypatch.setattr(templates, 'get_residue_indices',
+                        functools.partial(cif_residues.get_residue_indices, cache_dir=None))
+    store_dir = tmp_path / 'store'
+    store_dir.mkdir()
+    return str(store_dir)
+
+
+def test_missing_templates_stop_at_the_quota(tmp_path, store):
+    _write_cif(os.path.join(store, 'usable.cif'), [1, 2, 3])
+    _write_cif(os.path.join(store, 'unusable.cif'), [7, 8])
+    index = str(tmp_path / 'index.csv')
+    _write_index(index, ['usable.cif', 'unusable.cif', '', 'a.cif', 'b.cif', 'c.cif'])
+
+    # Usable CIFs count towards the quota, unusable and unnamed rows do not, and
+    # missing ones are assumed to become usable.
+    assert templates.missing_templates(index, store, max_templates=3) == [
+        os.path.join(store, 'a.cif'), os.path.join(store, 'b.cif')]
+    assert templates.missing_templates(index, store, max_templates=1) == []
+
+
+def test_materialize_templates_tops_up_failures_in_rank_order(tmp_path, store):
+    _write_cif(os.path.join(store, 'usable.cif'), [1, 2, 3])
+    index = str(tmp_path / 'index.csv')
+    _write_index(index, ['usable.cif', 'fails.cif', 'unusable.cif', 'a.cif', 'b.cif', 'c.cif'])
+    created = []
+
+    def materialize(cif_name, cif_file):
+        created.append(cif_name)
+        if cif_name == 'unusable.cif':
+            _write_cif(cif_file, [9])
+        elif cif_name != 'fails.cif':
+            _write_cif(cif_file, [1, 2, 3])
+
+    assert templates.materialize_templates(index, store, materialize, max_templates=3) == 3
+    assert created == ['fails.cif', 'unusable.cif', 'a.cif', 'b.cif']
+    assert not os.path.exists(os.path.join(store, 'c.cif'))
+    assert len(templates.return_template_info(index, 'store', store, max_templates=3)) == 3
+
+
+def test_materialize_templates_with_too_few_templates(tmp_path, store):
+    index = str(tmp_path / 'index.csv')
+    _write_index(index, ['a.cif', 'b.cif'])
+    assert templates.materialize_templates(
+        index, store, lambda cif_name, cif_file: _write_cif(cif_file, [1, 2]),
+        max_templates=4) == 2
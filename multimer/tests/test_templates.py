@@ -0,0 +1,165 @@
+import dataclasses
+import os
+
+import numpy as np
+import pytest
+
+from template_search import mmcif_cache
+from template_search import mmcif_parsing
+from template_search import parsers
+from template_search import residue_constants
+from template_search import templates
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+CIF_PATH = os.path.join(DATA_DIR, '1a7g.cif')
+
+
+def _parse(backend='biopython'):
+    with open(CIF_PATH) as f:
+        return mmcif_parsing.parse(file_id='1a7g', mmcif_string=f.read(),
+                                   backend=backend).mmcif_object
+
+
+def _extract(mmcif_object, chain_id, mapping, identity_only):
+    sequence = mmcif_object.chain_to_seqres[chain_id]
+    try:
+        features, _ = templates._extract_template_features(
+            mmcif_object, '1a7g', mapping, sequence, sequence, chain_id,
+            kalign_binary_path='kalign', identity_only=identity_only)
+    except templates.Error as e:
+        return type(e)
+    return features['template_sequence']
+
+
+def _mappings(sequence):
+    # The last mapping covers the 4 atoms of a single glycine, which are too few.
+    return [{i: i for i in range(len(sequence))},
+            {i: i for i in range(3)},
+            {i: i for i in range(len(sequence) // 2, len(sequence))},
+            {0: sequence.index('G')}]
+
+
+@pytest.mark.parametrize('backend', ['biopython', 'tokenizer'])
+def test_identity_only_accepts_the_same_hits(tmp_path, backend):
+    cache = mmcif_cache.MmcifCache(str(tmp_path), max_memory_bytes=1 << 26)
+    full = _parse(backend)
+    first_chain_id = next(iter(full.chain_to_seqres))
+    compact = templates._parse_mmcif(CIF_PATH, '1a7g', cache, identity_only=True,
+                                     parser_backend=backend,
+                                     chain_id=first_chain_id).mmcif_object
+    assert compact.atom_positions is None and first_chain_id in compact.atom_summaries
+    rejected = 0
+    for chain_id, sequence in full.chain_to_seqres.items():
+        for mapping in _mappings(sequence):
+            expected = _extract(full, chain_id, mapping, identity_only=False)
+            rejected += not isinstance(expected, bytes)
+            assert _extract(full, chain_id, mapping, identity_only=True) == expected
+            assert _extract(compact, chain_id, mapping, identity_only=True) == expected
+    assert rejected
+
+
+def test_identity_only_checks_ca_distances(tmp_path):
+    cache = mmcif_cache.MmcifCache(str(tmp_path), max_memory_bytes=1 << 26)
+    chain_id = next(iter(_parse().chain_to_seqres))
+    compact = templates._parse_mmcif(CIF_PATH, '1a7g', cache, identity_only=True,
+                                     chain_id=chain_id).mmcif_object
+    ca_positions, ca_mask, num_atoms = compact.atom_summaries[chain_id]
+    ca_positions = ca_positions.copy()
+    ca_positions[5:] += np.float32(500.0)
+    mapping = {i: i for i in range(len(compact.chain_to_seqres[chain_id]))}
+
+    far = dataclasses.replace(
+        compact, atom_summaries={chain_id: (ca_positions, ca_mask, num_atoms)})
+    assert (_extract(far, chain_id, mapping, identity_only=True)
+            is templates.NoAtomDataInTemplateError)
+    missing = dataclasses.replace(compact, atom_summaries={})
+    assert (_extract(missing, chain_id, mapping, identity_only=True)
+            is templates.NoAtomDataInTemplateError)
+
+
+def test_atom_summary_matches_atom37():
+    mmcif_object = _parse('tokenizer')
+    ca = residue_constants.atom_order['CA']
+    for chain_id in mmcif_object.chain_to_seqres:
+        positions, mask = templates._compute_atom_positions(mmcif_object, chain_id)
+        ca_positions, ca_mask, num_atoms = templates._compute_atom_summary(
+            mmcif_object, chain_id)
+        np.testing.assert_array_equal(ca_positions, positions[:, ca].astype(np.float32))
+        np.testing.assert_array_equal(ca_mask, mask[:, ca])
+        np.testing.assert_array_equal(num_atoms, mask.sum(axis=1))
+
+
+@pytest.mark.parametrize('identity_only', [True, False])
+@pytest.mark.parametrize('precompute', [True, False])
+def test_compact_entries_compute_other_chains_on_first_use(identity_only, precompute):
+    with open(CIF_PATH) as f:
+        parsing_result = mmcif_parsing.parse(file_id='1a7g', mmcif_string=f.read(),
+                                             backend='tokenizer')
+    full = parsing_result.mmcif_object
+    chain_id = next(iter(full.chain_to_seqres))
+    compact = templates._compact_parsing_result(
+        parsing_result, with_atom_positions=not identity_only,
+        chain_id=chain_id if precompute else None).mmcif_object
+    computed = compact.atom_summaries if identity_only else compact.atom_positions
+    # Only the requested chain is computed; the others keep their atom_data.
+    assert list(computed) == ([chain_id] if precompute else [])
+    assert (chain_id in compact.atom_data) != precompute
+
+    for mapping in _mappings(full.chain_to_seqres[chain_id]):
+        assert (_extract(compact, chain_id, mapping, identity_only=identity_only) ==
+                _extract(full, chain_id, mapping, identity_only=identity_only))
+    assert list(computed) == [chain_id]
+
+
+def _featurizer(tmp_path, num_workers, identity_only):
+    return templates.HmmsearchHitFeaturizer(
+        mmcif_dir=DATA_DIR, max_template_date='2100-01-01', max_hits=3,
+        kalign_binary_path='kalign', release_dates_path=None, obsolete_pdbs_path=None,
+        identity_only=identity_only, mmcif_parser_backend='tokenizer',
+        realign_backend='pairwise', num_workers=num_workers)
+
+
+def _hits(sequence):
+    # Overlapping windows of 1a7g, with duplicated windows and hits too short to
+    # have enough atoms among them.
+    windows = [(0, len(sequence)), (0, 1), (5, 60), (5, 60), (40, 41), (5, 60),
+               (10, 70), (50, 51), (20, 80), (0, 50), (1, 61), (30, 82)]
+    hits = []
+    for i, (start, end) in enumerate(windows):
+        hits.append(parsers.TemplateHit(
+            index=i, name='1a7g_E mol:protein', aligned_cols=end - start,
+            sum_probs=None, query=sequence[start:end], hit_sequence=sequence[start:end],
+            indices_query=list(range(start, end)), indices_hit=list(range(start, end))))
+    return hits
+
+
+@pytest.mark.parametrize('identity_only', [True, False])
+@pytest.mark.parametrize('num_workers', [2, 4])
+def test_parallel_featurization_matches_serial(tmp_path, monkeypatch, identity_only,
+                                               num_workers):
+    sequence = _parse().chain_to_seqres['E']
+    hits = _hits(sequence)
+    serial = _featurizer(tmp_path, 1, identity_only).get_templates(sequence, hits)
+
+    featurizer = _featurizer(tmp_path, num_workers, identity_only)
+    running = []
+    featurize_hit = featurizer._featurize_hit
+
+    def tracked(query_sequence, hit):
+        running.append(hit.index)
+        try:
+            return featurize_hit(query_sequence, hit)
+        finally:
+            running.remove(hit.index)
+
+    monkeypatch.setattr(featurizer, '_featurize_hit', tracked)
+    parallel = featurizer.get_templates(sequence, hits)
+
+    assert parallel.errors == serial.errors
+    assert parallel.warnings == serial.warnings
+    assert list(parallel.features) == list(serial.features)
+    for name, values in serial.features.items():
+        np.testing.assert_array_equal(parallel.features[name], values)
+    assert len(serial.features['template_sequence']) == 3
+    # Work on hits past the quota is finished or cancelled before returning.
+    assert running == []
@@ -0,0 +1,50 @@
+import numpy as np
+
+_GAP = ord('-')
+
+
+def sequence_codes(aligned_sequence):
+    """Code points of aligned_sequence as a uint32 array, one per alignment column."""
+    return np.frombuffer(aligned_sequence.encode('utf-32-le'), dtype=np.uint32)
+
+
+def gap_mask(aligned_sequence):
+    """Boolean array, True at the columns where aligned_sequence has a '-' gap."""
+    return sequence_codes(aligned_sequence) == _GAP
+
+
+def aligned_indices(query_gaps, template_gaps, query_start=0, template_start=0):
+    """
+    Converts the gap masks of a pairwise alignment to residue index arrays.
+
+    The index of each sequence advances over its own non-gap columns, starting at
+    query_start and template_start. Columns where either sequence has a gap are
+    dropped. Both masks must cover the same columns.
+
+    Returns:
+        (np.ndarray, np.ndarray): int32 query and template indices of the
+            columns aligned in both sequences.
+    """
+    query_residues = ~np.asarray(query_gaps, dtype=bool)
+    template_residues = ~np.asarray(template_gaps, dtype=bool)
+    aligned = query_residues & template_residues
+    query_indices = np.cumsum(query_residues, dtype=np.int32)
+    query_indices += query_start - 1
+    template_indices = np.cumsum(template_residues, dtype=np.int32)
+    template_indices += template_start - 1
+    return query_indices[aligned], template_indices[aligned]
+
+
+def paired_aligned_indices(query_seq, template_seq, query_start=0, template_start=0):
+    """
+    Index arrays of the columns where neither aligned sequence has a '-' gap.
+
+    Both indices advance only over these columns, as in the template CSV and HHR
+    parsers. Like zip(), the longer sequence is cut to the shorter one.
+
+    Returns:
+        (np.ndarray, np.ndarray): int32 query and template indices.
+    """
+    num_columns = min(len(query_seq), len(template_seq))
+    gaps = gap_mask(query_seq[:num_columns]) | gap_mask(template_seq[:num_columns])
+    return aligned_indices(gaps, gaps, query_start, template_start)
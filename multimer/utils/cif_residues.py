@@ -0,0 +1,85 @@
+import hashlib
+import os
+import numpy as np
+from common.config import template_residue_cache_dir
+from utils import disk_cache
+
+# Sidecar layout: int64 [st_mtime_ns, st_size] of the CIF it describes, followed by
+# the sorted int32 residue numbers of its ATOM records. Sidecars live under a cache
+# directory, never next to the CIFs, which AF3 reads from the template store.
+SIDECAR_SUFFIX = ".residues"
+
+_memo = {}
+_sidecar_stores = {}
+
+
+def _scan_residue_indices(cif_file):
+    """Sorted unique residue numbers (column 9) of the ATOM records of cif_file."""
+    residue_indices = set()
+    with open(cif_file, 'rb') as cif:
+        for line in cif:
+            if line.startswith(b"ATOM"):
+                tokens = line.split()
+                try:
+                    residue_indices.add(int(tokens[8]))  # column with residue number
+                except (IndexError, ValueError):
+                    continue
+    return np.array(sorted(residue_indices), dtype=np.int32)
+
+
+def _decode_sidecar(data, mtime_ns, size):
+    if data is None or len(data) < 16 or (len(data) - 16) % 4:
+        return None
+    header = np.frombuffer(data[:16], dtype=np.int64)
+    if header[0] != mtime_ns or header[1] != size:
+        return None
+    return np.frombuffer(data[16:], dtype=np.int32).copy()
+
+
+def _encode_sidecar(mtime_ns, size, residues):
+    return (np.array([mtime_ns, size], dtype=np.int64).tobytes()
+            + residues.astype(np.int32).tobytes())
+
+
+def _sidecar_store(cache_dir):
+    if cache_dir not in _sidecar_stores:
+        _sidecar_stores[cache_dir] = disk_cache.create(cache_dir, SIDECAR_SUFFIX, None)
+    return _sidecar_stores[cache_dir]
+
+
+def get_residue_indices(cif_file, cache_dir=template_residue_cache_dir):
+    """
+    Returns the sorted residue numbers present in cif_file as an int32 array.
+
+    Results are memoized in-process and persisted in a sidecar under cache_dir (None to
+    not persist them), both keyed by the CIF's mtime and size.
+    """
+    stat = os.stat(cif_file)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _memo.get(cif_file)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    store = _sidecar_store(cache_dir)
+    sidecar_key = hashlib.sha1(os.path.realpath(cif_file).encode()).hexdigest()
+    residues = _decode_sidecar(store.read(sidecar_key), *key) if store else None
+    if residues is None:
+        residues = _scan_residue_indices(cif_file)
+        if store:
+            store.write(sidecar_key, _encode_sidecar(*key, residues))
+    _memo[cif_file] = (key, residues)
+    return residues
+
+
+def filter_to_present_residues(query_indices, template_indices, residue_indices):
+    """
+    Drops alignment pairs whose template residue (0-based, so +1) is not in residue_indices.
+
+    Returns:
+        (list, list): The kept query indices and template indices.
+    """
+    num_pairs = min(len(query_indices), len(template_indices))
+    query_indices = np.asarray(query_indices[:num_pairs], dtype=np.int64)
+    template_indices = np.asarray(template_indices[:num_pairs], dtype=np.int64)
+    present = np.isin(template_indices + 1, residue_indices, assume_unique=False)
+    return query_indices[present].tolist(), template_indices[present].tolist()
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+from common.config import pdb_mmcif_database_dir, template_cif_store_dir
+from utils.disk_cache import make_private_dir
+from utils.extract_cif_chains import filter_cif_by_chains
+
+
+def _is_stale(store_cif, source_cif):
+    """A stored chain is stale when the database copy of the entry is newer."""
+    if not os.path.exists(store_cif):
+        return True
+    return os.path.getmtime(source_cif) > os.path.getmtime(store_cif)
+
+
+def get_chain_cifs(pdb_id, chain_ids, store_dir=template_cif_store_dir, mmcif_dir=pdb_mmcif_database_dir):
+    """
+    Returns {chain_id: path} of the single-chain CIFs for pdb_id in the shared store.
+
+    Chains missing from the store (or older than the database entry) are filtered out
+    of the database mmCIF together, in a single pass over the file.
+
+    Returns None if the database has no mmCIF for pdb_id.
+    """
+    source_cif = os.path.join(mmcif_dir, pdb_id.lower() + ".cif")
+    if not os.path.exists(source_cif):
+        return None
+
+    make_private_dir(store_dir)
+    store_cifs = {chain_id: os.path.join(store_dir, f"{pdb_id.lower()}{chain_id}.cif") for chain_id in chain_ids}
+    stale_chains = [chain_id for chain_id, store_cif in store_cifs.items() if _is_stale(store_cif, source_cif)]
+    if stale_chains:
+        # Several targets may populate the same entries at once; write privately
+        # and publish with an atomic rename.
+        tmp_paths = {}
+        for chain_id in stale_chains:
+            fd, tmp_paths[chain_id] = tempfile.mkstemp(dir=store_dir, prefix=".tmp_", suffix=".cif")
+            os.close(fd)
+        try:
+            filter_cif_by_chains(source_cif, tmp_paths)
+            for chain_id, tmp_path in tmp_paths.items():
+                os.replace(tmp_path, store_cifs[chain_id])
+        finally:
+            for tmp_path in tmp_paths.values():
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+    return store_cifs
+
+
+def get_chain_cif(pdb_id, chain_id, store_dir=template_cif_store_dir, mmcif_dir=pdb_mmcif_database_dir):
+    """Returns the stored single-chain CIF path for (pdb_id, chain_id), or None."""
+    store_cifs = get_chain_cifs(pdb_id, [chain_id], store_dir=store_dir, mmcif_dir=mmcif_dir)
+    if store_cifs is None:
+        return None
+    return store_cifs[chain_id]
+
+
+def _link(store_cif, destination_cif):
+    destination_dir = os.path.dirname(destination_cif)
+    tmp_path = os.path.join(destination_dir, f".{os.path.basename(destination_cif)}.{os.getpid()}")
+    try:
+        os.link(store_cif, tmp_path)
+    except OSError:
+        shutil.copyfile(store_cif, tmp_path)
+    os.replace(tmp_path, destination_cif)
+
+
+def link_template_cifs(template_chains):
+    """
+    Places stored single-chain CIFs at their destinations.
+
+    Uses hardlinks, falling back to copies when the store is on another filesystem.
+    Symlinks are avoided because the AF3 container only mounts the target directory.
+
+    Args:
+        template_chains (list): (pdb_id, chain_id, destination_cif) tuples. Chains of
+            the same entry are extracted together.
+    """
+    chains_by_pdb = {}
+    for pdb_id, chain_id, destination_cif in template_chains:
+        chains_by_pdb.setdefault(pdb_id.lower(), []).append((chain_id, destination_cif))
+
+    for pdb_id, chains in chains_by_pdb.items():
+        store_cifs = get_chain_cifs(pdb_id, {chain_id for chain_id, _ in chains})
+        if store_cifs is None:
+            continue
+        for chain_id, destination_cif in chains:
+            _link(store_cifs[chain_id], destination_cif)
+
+
+def link_chain_cif(pdb_id, chain_id, destination_cif):
+    """
+    Places the stored single-chain CIF for (pdb_id, chain_id) at destination_cif.
+
+    Returns True if destination_cif exists afterwards.
+    """
+    link_template_cifs([(pdb_id, chain_id, destination_cif)])
+    return os.path.exists(destination_cif)
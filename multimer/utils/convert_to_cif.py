@@ -4,6 +4,9 @@ from Bio.PDB.PDBParser import PDBParser
 from Bio.SeqUtils import seq1
 import json
 import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from Bio.PDB import PDBParser, MMCIFIO
 import os
@@ -12,6 +15,9 @@ import os
 no_temp_seq_list = list()
 
 from Bio import PDB
+from Bio.Data.IUPACData import atom_weights
+from common.config import atom2cif_backend
+from utils.repair_atom import repair_atom
 
 restype_3to1 = {
     'ALA': 'A',
@@ -41,7 +47,26 @@ restype_3to1 = {
 
 
 
-def atom2cif(template_pdb, template_cif):
+RELEASE_DATE = "1999-01-01"  # change release date. this date is safe and AF3 includes it.
+
+# Need below for AF3 to find the release date. The cutoff is ~ 2021
+METADATA_ENTRIES = f"""
+    #
+    _pdbx_database_status.recvd_initial_deposition_date {RELEASE_DATE}
+    _struct_ref_seq.seq_release_date {RELEASE_DATE}
+    _pdbx_audit_revision_history.revision_date {RELEASE_DATE}
+    #
+    """
+
+ATOM_SITE_COLUMNS = [
+    "group_PDB", "id", "type_symbol", "label_atom_id", "label_alt_id",
+    "label_comp_id", "label_asym_id", "label_entity_id", "label_seq_id",
+    "pdbx_PDB_ins_code", "Cartn_x", "Cartn_y", "Cartn_z", "occupancy",
+    "B_iso_or_equiv", "auth_seq_id", "auth_asym_id", "pdbx_PDB_model_num",
+]
+
+
+def _atom2cif_biopython(template_pdb, template_cif):
 
     # Load the PDB file
     parser = PDBParser(QUIET=True)
@@ -52,20 +77,266 @@ def atom2cif(template_pdb, template_cif):
     io.set_structure(structure)
     io.save(template_cif)
 
-    release_date = "1999-01-01"  # change release date. this date is safe and AF3 includes it.
-    
-    # Need below for AF3 to find the release date. The cutoff is ~ 2021
-    metadata_entries = f"""
-    #
-    _pdbx_database_status.recvd_initial_deposition_date {release_date}
-    _struct_ref_seq.seq_release_date {release_date}
-    _pdbx_audit_revision_history.revision_date {release_date}
-    #
-    """
-
     # Append the release date to the mmCIF file
     with open(template_cif, "a") as cif_file:
-        cif_file.write(metadata_entries)
+        cif_file.write(METADATA_ENTRIES)
+
+
+def _cif_value(val):
+    """Quotes an mmCIF value the way MMCIFIO does."""
+    if (" " in val or "'" in val or '"' in val or val[0] in "_#$[];"
+            or val.startswith(("data_", "save_")) or val in ("loop_", "stop_", "global_")):
+        if "' " in val:
+            return '"' + val + '"'
+        return "'" + val + "'"
+    return val
+
+
+def _label_asym_id(entity_id):
+    # A to Z, then AA to ZA, AB to ZB etc, as in MMCIFIO.
+    out = ""
+    while entity_id > 0:
+        mod = (entity_id - 1) % 26
+        out += chr(65 + mod)
+        entity_id = (entity_id - mod) // 26
+    return out
+
+
+def _element(fullname, element):
+    """Returns the element symbol, guessing it from the atom name like Biopython."""
+    if element and element.capitalize() in atom_weights:
+        return element
+    name = fullname.strip() if len(fullname.split()) == 1 else fullname
+    if fullname[0].isalpha() and not fullname[2:].isdigit():
+        putative_element = name.strip()
+    elif name[0].isdigit():
+        putative_element = name[1]
+    else:
+        putative_element = name[0]
+    if putative_element.capitalize() in atom_weights:
+        return putative_element
+    return "X"
+
+
+def _atom2cif_streaming(template_pdb, template_cif):
+    """
+    Converts ATOM/HETATM records to an mmCIF _atom_site loop in a single pass.
+
+    Reads the fixed PDB columns directly and writes the same values as the
+    Biopython path (for files with contiguous chains and residues), followed by
+    the release-date metadata.
+    """
+    model_n = "1"
+    atom_number = 1
+    entity_id = 0
+    current_chain = None
+    current_residue = None
+    residue_number = 1
+    prev_residue_type = ""
+    prev_resname = ""
+    label_seq_id = "."
+    label_asym_id = ""
+
+    with open(template_pdb, "r") as infile, open(template_cif, "w") as outfile:
+        outfile.write("data_structure\n#\nloop_\n")
+        outfile.write("".join(f"_atom_site.{column}\n" for column in ATOM_SITE_COLUMNS))
+        for line in infile:
+            record_type = line[0:6]
+            if record_type == "MODEL ":
+                model_n = str(int(line[10:14])) if line[10:14].strip() else "1"
+                if model_n == "0":
+                    model_n = "1"
+                atom_number = 1
+                entity_id = 0
+                current_chain = None
+                current_residue = None
+                continue
+            if record_type == "ENDMDL":
+                current_chain = None
+                current_residue = None
+                continue
+            if record_type in ("END   ", "CONECT"):
+                break
+            if record_type != "ATOM  " and record_type != "HETATM":
+                continue
 
+            line = line.rstrip("\n")
+            fullname = line[12:16]
+            altloc = line[16]
+            resname = line[17:20].strip()
+            chain_id = line[21]
+            resseq = str(int(line[22:26].split()[0]))
+            icode = line[26]
+            if record_type == "HETATM":
+                residue_type = "HETATM"
+                hetero_flag = "W" if resname in ("HOH", "WAT") else "H"
+            else:
+                residue_type = "ATOM"
+                hetero_flag = " "
+
+            if chain_id != current_chain:
+                current_chain = chain_id
+                current_residue = None
+                residue_number = 1
+                prev_residue_type = ""
+                prev_resname = ""
+            residue = (hetero_flag, resseq, icode, resname)
+            if residue != current_residue:
+                current_residue = residue
+                if residue_type == "ATOM":
+                    label_seq_id = str(residue_number)
+                    residue_number += 1
+                else:
+                    label_seq_id = "."
+                if residue_type != prev_residue_type or (
+                        residue_type == "HETATM" and resname != prev_resname):
+                    entity_id += 1
+                    label_asym_id = _label_asym_id(entity_id)
+                prev_residue_type = residue_type
+                prev_resname = resname
+
+            try:
+                occupancy = str(float(line[54:60]))
+            except ValueError:
+                occupancy = "?"
+            try:
+                bfactor = str(float(line[60:66]))
+            except ValueError:
+                bfactor = "0.0"
+
+            outfile.write(" ".join((
+                residue_type,
+                str(atom_number),
+                _element(fullname, line[76:78].strip().upper()),
+                _cif_value(fullname.strip()),
+                "." if altloc == " " else altloc,
+                _cif_value(resname),
+                label_asym_id,
+                "?",
+                label_seq_id,
+                "?" if icode == " " else icode,
+                f"{float(line[30:38]):.3f}",
+                f"{float(line[38:46]):.3f}",
+                f"{float(line[46:54]):.3f}",
+                occupancy,
+                bfactor,
+                resseq,
+                "." if chain_id == " " else chain_id,
+                model_n,
+            )) + "\n")
+            atom_number += 1
+
+        outfile.write("#\n")
+        outfile.write(METADATA_ENTRIES)
+
+
+def atom2cif(template_pdb, template_cif, backend=atom2cif_backend):
+    """
+    Converts a PDB-format template to mmCIF with the release-date metadata AF3 needs.
+
+    Args:
+        backend (str): "streaming" (single pass over the PDB columns) or "biopython".
+    """
+    if backend == "streaming":
+        _atom2cif_streaming(template_pdb, template_cif)
+    elif backend == "biopython":
+        _atom2cif_biopython(template_pdb, template_cif)
+    else:
+        raise ValueError(f"Unknown atom2cif backend: {backend}")
+
+
+def check_atom2cif_backends(template_pdb):
+    """
+    Converts template_pdb with both backends and compares the parsed mmCIF items.
+
+    Returns:
+        list: mmCIF item names whose values differ (empty if equivalent).
+    """
+    from Bio.PDB.MMCIF2Dict import MMCIF2Dict
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        biopython_cif = os.path.join(tmp_dir, "biopython.cif")
+        streaming_cif = os.path.join(tmp_dir, "streaming.cif")
+        _atom2cif_biopython(template_pdb, biopython_cif)
+        _atom2cif_streaming(template_pdb, streaming_cif)
+        expected = MMCIF2Dict(biopython_cif)
+        actual = MMCIF2Dict(streaming_cif)
+    return sorted(key for key in set(expected) | set(actual) if expected.get(key) != actual.get(key))
+
+
+def _convert_template(atom_input, cif_output, repair):
+    # Outputs are published with os.replace: other processes may convert the same
+    # template into a shared store at the same time.
+    suffix = f".{os.getpid()}.tmp"
+    tmp_paths = [cif_output + suffix]
+    try:
+        atom_path = atom_input
+        if repair:
+            repaired_path = cif_output[:-4] + ".atom_repaired"
+            atom_path = repaired_path + suffix
+            tmp_paths.append(atom_path)
+            repair_atom(atom_input, atom_path)
+        atom2cif(atom_path, cif_output + suffix)
+        if repair:
+            os.replace(atom_path, repaired_path)
+        os.replace(cif_output + suffix, cif_output)
+        return None
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    finally:
+        for tmp_path in tmp_paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def convert_templates(jobs, num_workers=1, executor=None):
+    """
+    Converts a batch of .atom templates to .cif, each distinct source only once.
+
+    Args:
+        jobs (list): (atom_input, cif_output, repair) tuples. repair runs repair_atom
+            first (tmsearch templates).
+        num_workers (int): Size of the process pool used when no executor is given.
+            1 converts serially.
+        executor (concurrent.futures.Executor): Optional pool to submit conversions to.
+
+    Returns:
+        dict: Maps each cif_output to None on success or to an error message.
+    """
+    destinations = {}
+    claimed = set()
+    for atom_input, cif_output, repair in jobs:
+        # A destination is written by one source only, even if several jobs name it.
+        if cif_output in claimed:
+            continue
+        claimed.add(cif_output)
+        destinations.setdefault((atom_input, repair), []).append(cif_output)
 
+    errors = {}
+    if executor is None and num_workers > 1 and len(destinations) > 1:
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            return convert_templates(jobs, executor=pool)
+    if executor is None:
+        for (atom_input, repair), cif_outputs in destinations.items():
+            errors[(atom_input, repair)] = _convert_template(atom_input, cif_outputs[0], repair)
+    else:
+        futures = {executor.submit(_convert_template, atom_input, cif_outputs[0], repair): (atom_input, repair)
+                   for (atom_input, repair), cif_outputs in destinations.items()}
+        for future in as_completed(futures):
+            try:
+                errors[futures[future]] = future.result()
+            except Exception as e:
+                errors[futures[future]] = f"{type(e).__name__}: {e}"
 
+    results = {}
+    for source, cif_outputs in destinations.items():
+        error = errors[source]
+        results[cif_outputs[0]] = error
+        for cif_output in cif_outputs[1:]:
+            if error is None:
+                try:
+                    shutil.copyfile(cif_outputs[0], cif_output)
+                except OSError as e:
+                    results[cif_output] = f"{type(e).__name__}: {e}"
+                    continue
+            results[cif_output] = error
+    return results
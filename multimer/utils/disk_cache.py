@@ -0,0 +1,197 @@
+"""Size-bounded LRU directory of cache files, shared by the template caches.
+
+Entries are files named <key><suffix> in a subdirectory per first two key
+characters. Writes go through a temporary file and os.replace, so concurrent
+processes can share a cache directory. Reads refresh the entry mtime, and once
+a fraction of the size limit has been written since the last scan, the entries
+with the oldest mtimes are removed until the cache fits.
+
+Cache directories must belong to the current user and not be writable by
+others: entries are trusted (some are unpickled), so a directory another user
+can write to is refused.
+"""
+import os
+import shutil
+import stat
+import tempfile
+import threading
+from typing import Optional
+
+from absl import logging
+
+# Fraction of the size limit written between two eviction scans.
+EVICT_FRACTION = 0.05
+
+
+def make_private_dir(path: str) -> None:
+    """Creates path and missing parents (mode 0700) and checks that only its owner can write to it.
+
+    The check also covers the parent directory, which could otherwise be used
+    to swap the cache directory, unless the parent is sticky (like /tmp).
+
+    Raises:
+        PermissionError: If path belongs to another user, or path or a
+            non-sticky parent is writable by group or others.
+    """
+    missing = []
+    directory = os.path.abspath(path)
+    while not os.path.isdir(directory):
+        missing.append(directory)
+        directory = os.path.dirname(directory)
+    for directory in reversed(missing):
+        try:
+            os.mkdir(directory, mode=0o700)
+        except FileExistsError:
+            pass  # Created by a concurrent process.
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(
+            f'Cache directory {path} must belong to the current user and not be '
+            f'writable by others')
+    parent = os.path.dirname(os.path.abspath(path))
+    info = os.stat(parent)
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH) and not info.st_mode & stat.S_ISVTX:
+        raise PermissionError(
+            f'Parent {parent} of cache directory {path} is writable by others')
+
+
+class DiskCache:
+    """Files keyed by hex digest under cache_dir, evicted least recently used first.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, cache_dir: str, suffix: str, max_size_bytes: Optional[int]):
+        """Initializes the cache.
+
+        Args:
+            cache_dir: Directory holding the entries. Created if missing, see
+                make_private_dir.
+            suffix: File name suffix of the entries.
+            max_size_bytes: Upper bound for the total size of the entries, or
+                None for no bound.
+        """
+        self.cache_dir = cache_dir
+        self._suffix = suffix
+        self._max_size_bytes = max_size_bytes
+        self._bytes_since_evict = 0
+        self._lock = threading.Lock()
+        make_private_dir(cache_dir)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + self._suffix)
+
+    def _touch(self, path: str) -> None:
+        try:
+            os.utime(path)  # Mark as recently used.
+        except FileNotFoundError:
+            pass
+
+    def read(self, key: str) -> Optional[bytes]:
+        """Returns the entry of key, or None on a miss."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        self._touch(path)
+        return data
+
+    def copy_to(self, key: str, destination: str) -> bool:
+        """Copies the entry of key to destination. Returns False on a miss."""
+        path = self.path(key)
+        try:
+            atomic_write(destination, lambda f: _copy_from(path, f))
+        except FileNotFoundError:
+            return False
+        self._touch(path)
+        return True
+
+    def write(self, key: str, data: bytes) -> None:
+        """Stores data under key. Failures are logged, not raised."""
+        self._put(key, lambda f: f.write(data), len(data))
+
+    def copy_from(self, key: str, source: str) -> None:
+        """Stores a copy of the source file under key. Failures are logged, not raised."""
+        self._put(key, lambda f: _copy_from(source, f), os.path.getsize(source))
+
+    def _put(self, key: str, write, num_bytes: int) -> None:
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            atomic_write(path, write)
+        except OSError as e:
+            logging.warning('Could not write cache entry %s: %s', path, e)
+            return
+        if self._max_size_bytes is None:
+            return
+        with self._lock:
+            self._bytes_since_evict += num_bytes
+            if self._bytes_since_evict <= self._max_size_bytes * EVICT_FRACTION:
+                return
+            self._bytes_since_evict = 0
+        self.evict(self._max_size_bytes)
+
+    def _entries(self):
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            try:
+                shard_entries = list(os.scandir(shard.path))
+            except FileNotFoundError:
+                continue
+            for entry in shard_entries:
+                if entry.name.endswith(self._suffix):
+                    yield entry
+
+    def evict(self, max_size_bytes: int) -> None:
+        """Removes the least recently used entries until at most max_size_bytes remain."""
+        entries = []
+        total_size = 0
+        for entry in self._entries():
+            try:
+                info = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((info.st_mtime, info.st_size, entry.path))
+            total_size += info.st_size
+
+        for _, size, path in sorted(entries):
+            if total_size <= max_size_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Removed by a concurrent process.
+            total_size -= size
+
+
+def _copy_from(source: str, f) -> None:
+    with open(source, 'rb') as src:
+        shutil.copyfileobj(src, f)
+
+
+def atomic_write(path: str, write) -> None:
+    """Calls write(f) on a temporary file next to path, then renames it to path."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def create(cache_dir: Optional[str], suffix: str,
+           max_size_bytes: Optional[int]) -> Optional[DiskCache]:
+    """Returns a DiskCache, or None when cache_dir is unset or cannot be used safely."""
+    if not cache_dir:
+        return None
+    try:
+        return DiskCache(cache_dir, suffix, max_size_bytes)
+    except OSError as e:
+        logging.warning('Disabling cache %s: %s', cache_dir, e)
+        return None
@@ -1,52 +1,90 @@
+import shlex
 import sys
 
-def filter_cif_by_chain(input_path, chain_id, output_path):
+
+def _split_cif_row(line, num_columns):
+    """Splits an mmCIF data row, re-tokenizing quoted values only when needed."""
+    tokens = line.split()
+    if len(tokens) != num_columns and ("'" in line or '"' in line):
+        try:
+            tokens = shlex.split(line)
+        except ValueError:
+            pass  # Unbalanced quote, e.g. an unquoted O5' atom name.
+    return tokens
+
+
+def filter_cif_by_chains(input_path, chain_output_paths):
+    """
+    Writes one single-chain copy of an mmCIF per requested chain in a single pass.
+
+    Args:
+        input_path (str): mmCIF file to read.
+        chain_output_paths (dict): Maps auth_asym_id chain IDs to output paths.
+    """
+    outfiles = {chain_id: open(output_path, 'w') for chain_id, output_path in chain_output_paths.items()}
+    all_outfiles = list(outfiles.values())
+
+    def write_all(line):
+        for outfile in all_outfiles:
+            outfile.write(line)
+
     atom_loop_started = False
     atom_headers = []
     atom_data_start = False
+    chain_idx = None
+
+    try:
+        with open(input_path, 'r') as infile:
+            for line in infile:
+                # Skip HETATM lines
+                if line.startswith("HETATM"):
+                    continue
+
+                stripped = line.strip()
 
-    with open(input_path, 'r') as infile, open(output_path, 'w') as outfile:
-        for line in infile:
-            # Skip HETATM lines
-            if line.startswith("HETATM"):
-                continue
-
-            # Detect beginning of atom_site loop
-            if line.strip() == "loop_":
-                atom_loop_started = True
-                atom_headers = []
-                atom_data_start = False
-                outfile.write(line)
-                continue
-
-            # If in atom loop, collect headers
-            if atom_loop_started and line.strip().startswith("_atom_site."):
-                atom_headers.append(line.strip())
-                outfile.write(line)
-                continue
-
-            # End of header block = start of data
-            if atom_loop_started and not line.strip().startswith("_") and not atom_data_start:
-                atom_data_start = True
-
-            # If in atom_site data
-            if atom_data_start:
-                tokens = line.strip().split()
-                if len(tokens) != len(atom_headers):
-                    outfile.write(line)  # malformed or non-atom line
+                # Detect beginning of atom_site loop
+                if stripped == "loop_":
+                    atom_loop_started = True
+                    atom_headers = []
+                    atom_data_start = False
+                    chain_idx = None
+                    write_all(line)
                     continue
 
-                # Find chain ID column dynamically
-                try:
-                    # chain_col = [h for h in atom_headers if "_atom_site.label_asym_id" in h][0]
-                    chain_col = [h for h in atom_headers if "_atom_site.auth_asym_id" in h][0]
-                    chain_idx = atom_headers.index(chain_col)
-                    if tokens[chain_idx] == chain_id:
+                # If in atom loop, collect headers
+                if atom_loop_started and stripped.startswith("_atom_site."):
+                    atom_headers.append(stripped)
+                    write_all(line)
+                    continue
+
+                # End of header block = start of data. Resolve the chain column once.
+                if atom_loop_started and not stripped.startswith("_") and not atom_data_start:
+                    atom_data_start = True
+                    if "_atom_site.auth_asym_id" in atom_headers:
+                        chain_idx = atom_headers.index("_atom_site.auth_asym_id")
+
+                # If in atom_site data
+                if atom_data_start:
+                    if chain_idx is None:
+                        tokens = line.split()
+                    else:
+                        tokens = _split_cif_row(line, len(atom_headers))
+                    if len(tokens) != len(atom_headers):
+                        write_all(line)  # malformed or non-atom line
+                        continue
+                    if chain_idx is None:
+                        continue  # No chain column in this loop
+                    outfile = outfiles.get(tokens[chain_idx])
+                    if outfile is not None:
                         outfile.write(line)
-                except IndexError:
-                    continue  # Skip if chain index is out of range
-                continue
+                    continue
 
-            # Default: write all non-ATOM lines
-            outfile.write(line)
+                # Default: write all non-ATOM lines
+                write_all(line)
+    finally:
+        for outfile in all_outfiles:
+            outfile.close()
 
+
+def filter_cif_by_chain(input_path, chain_id, output_path):
+    filter_cif_by_chains(input_path, {chain_id: output_path})
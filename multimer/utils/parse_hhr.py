@@ -12,6 +12,10 @@ import argparse
 from pathlib import Path
 from typing import List, Tuple, Dict, Optional
 
+import numpy as np
+
+from utils.alignment_indices import paired_aligned_indices
+
 
 class HHRParser:
     def __init__(self):
@@ -95,7 +99,7 @@ class HHRParser:
             lines[alignment_start:]
         )
         
-        if not query_indices or not template_indices:
+        if not len(query_indices) or not len(template_indices):
             return None
         
         return {
@@ -120,8 +124,8 @@ class HHRParser:
         
         return False
     
-    def _parse_alignment_blocks(self, alignment_lines: List[str]) -> Tuple[List[int], List[int]]:
-        """Parse alignment blocks to extract aligned residue indices."""
+    def _parse_alignment_blocks(self, alignment_lines: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Parse alignment blocks to extract aligned residue indices (int32 arrays)."""
         query_indices = []
         template_indices = []
         
@@ -161,8 +165,8 @@ class HHRParser:
                             q_indices, t_indices = self._extract_aligned_positions(
                                 query_seq, template_seq, query_start, template_start
                             )
-                            query_indices.extend(q_indices)
-                            template_indices.extend(t_indices)
+                            query_indices.append(q_indices)
+                            template_indices.append(t_indices)
                             
                             # Skip to after the template line
                             i = template_idx + 1
@@ -172,49 +176,14 @@ class HHRParser:
             
             i += 1
         
-        return query_indices, template_indices
+        if not query_indices:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        return np.concatenate(query_indices), np.concatenate(template_indices)
     
     def _extract_aligned_positions(self, query_seq: str, template_seq: str, 
-                                 query_start: int, template_start: int) -> Tuple[List[int], List[int]]:
-        """Extract aligned residue positions from sequence alignment."""
-        query_indices = []
-        template_indices = []
-        
-        query_pos = query_start
-        template_pos = template_start
-        # print("Hereeeeeeeeeeee")
-        # print("Printing:",query_seq,template_seq)
-        
-        for q_char, t_char in zip(query_seq, template_seq):
-            # print()
-            # Both positions have residues (aligned)
-            if not q_char == "-" and not t_char == "-":
-                query_indices.append(query_pos)
-                template_indices.append(template_pos)
-                template_pos += 1
-                query_pos += 1
-                # continue
-            # template_pos += 1
-            # query_pos += 1
-            # elif q_char == "-":
-            #     template_pos += 1
-            #     pass
-                
-            # else:
-                
-            
-            # query_pos += 1
-            # template_pos += 1
-                # query_pos += 1
-                # template_pos += 1
-            
-            # # Update positions
-            # if q_char != '-':
-            #     query_pos += 1
-            # if t_char != '-':
-            #     template_pos += 1
-        
-        return query_indices, template_indices
+                                 query_start: int, template_start: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Extract aligned residue positions (int32 arrays) from sequence alignment."""
+        return paired_aligned_indices(query_seq, template_seq, query_start, template_start)
     
     def save_to_csv(self, templates: List[Dict], output_file: str):
         """Save extracted template data to CSV file."""
@@ -228,8 +197,8 @@ class HHRParser:
             for template in templates:
                 query_indices_str = ','.join(map(str, template['query_indices']))
                 template_indices_str = ','.join(map(str, template['template_indices']))
-                query_indices = [i - 1 for i in template['query_indices']]
-                template_indices = [i - 1 for i in template['template_indices']]
+                query_indices = (template['query_indices'] - 1).tolist()
+                template_indices = (template['template_indices'] - 1).tolist()
                 
                 writer.writerow([
                     template['template_name'],
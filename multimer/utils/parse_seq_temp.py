@@ -12,6 +12,10 @@ import argparse
 from pathlib import Path
 from typing import List, Tuple, Dict, Optional
 
+import numpy as np
+
+from utils.alignment_indices import paired_aligned_indices
+
 
 class TemplateCSVParser:
     def __init__(self):
@@ -60,7 +64,7 @@ class TemplateCSVParser:
                 query_seq, template_seq, query_start, template_start
             )
             
-            if not query_indices or not template_indices:
+            if not len(query_indices) or not len(template_indices):
                 return None
             
             return {
@@ -78,25 +82,9 @@ class TemplateCSVParser:
             return None
     
     def _extract_aligned_positions(self, query_seq: str, template_seq: str, 
-                                 query_start: int, template_start: int) -> Tuple[List[int], List[int]]:
-        """Extract aligned residue positions from sequence alignment."""
-        query_indices = []
-        template_indices = []
-        
-        query_pos = query_start
-        template_pos = template_start
-        
-        for q_char, t_char in zip(query_seq, template_seq):
-            # print()
-            # Both positions have residues (aligned)
-            
-            if not q_char == "-" and not t_char == "-":
-                query_indices.append(query_pos)
-                template_indices.append(template_pos)
-                template_pos += 1
-                query_pos += 1
-        
-        return query_indices, template_indices
+                                 query_start: int, template_start: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Extract aligned residue positions (int32 arrays) from sequence alignment."""
+        return paired_aligned_indices(query_seq, template_seq, query_start, template_start)
     
     def save_to_csv(self, templates: List[Dict], output_file: str):
         """Save extracted template data to CSV file."""
@@ -113,8 +101,8 @@ class TemplateCSVParser:
             for template in templates:
                 query_indices_str = ','.join(map(str, template['query_indices']))
                 template_indices_str = ','.join(map(str, template['template_indices']))
-                query_indices = [i - 1 for i in template['query_indices']]
-                template_indices = [i - 1 for i in template['template_indices']]
+                query_indices = (template['query_indices'] - 1).tolist()
+                template_indices = (template['template_indices'] - 1).tolist()
                 
                 writer.writerow([
                     template['template_name'],
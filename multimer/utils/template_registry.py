@@ -0,0 +1,66 @@
+import hashlib
+import os
+import pandas as pd
+from utils.cif_store import link_template_cifs
+
+# Every template of a target lives once in <templates>/store; the per-source
+# directories (pdb_seqres, pdb70_seq, tmsearch, folds_iter_*, ...) only keep the
+# *_templates.csv index files, whose STORE_COLUMN names the file in the store.
+STORE_DIRNAME = "store"
+STORE_COLUMN = "store_cif"
+
+
+def get_store_dir(output_root_dir):
+    return os.path.join(output_root_dir, STORE_DIRNAME)
+
+
+def pdb_chain_cif_name(pdb_id, chain_id):
+    return f"{pdb_id[:4].lower()}_{chain_id}.cif"
+
+
+def atom_cif_name(atom_input, repair=False):
+    """
+    Store name for an in-house .atom template.
+
+    Names are content addressed, so the same structure found by several sources
+    or predictors is stored once, while different files sharing a name are not mixed up.
+    """
+    hasher = hashlib.sha1()
+    with open(atom_input, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(chunk)
+    if repair:
+        hasher.update(b"repaired")
+    name = os.path.basename(atom_input)
+    if name.endswith(".atom"):
+        name = name[:-len(".atom")]
+    return f"{name}_{hasher.hexdigest()[:12]}.cif"
+
+
+def write_template_index(template_csv, cif_names):
+    """Records the store file of every row of template_csv ("" when it has none)."""
+    df = pd.read_csv(template_csv)
+    df[STORE_COLUMN] = cif_names
+    df.to_csv(template_csv, index=False)
+
+
+def register_pdb_templates(template_csv, pdb_chains, store_dir):
+    """
+    Links the PDB chains of template_csv into the store and indexes them.
+
+    Args:
+        template_csv (str): *_templates.csv of one source and chain.
+        pdb_chains (list): (pdb_id, chain_id) per row of template_csv.
+        store_dir (str): Target-level template store.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    cif_names = [pdb_chain_cif_name(pdb_id, chain_id) for pdb_id, chain_id in pdb_chains]
+
+    missing = {}
+    for (pdb_id, chain_id), cif_name in zip(pdb_chains, cif_names):
+        store_cif = os.path.join(store_dir, cif_name)
+        if not os.path.exists(store_cif):
+            missing[store_cif] = (pdb_id, chain_id, store_cif)
+    link_template_cifs(list(missing.values()))
+
+    write_template_index(template_csv, cif_names)